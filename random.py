@@ -1,18 +1,27 @@
-from O365 import Account, FileSystemTokenBackend
 from dotenv import load_dotenv
 from datetime import datetime, timezone, timedelta
-import os, time, openai, json
-import textwrap
+import os, sys, time, json
 import re
-from bs4 import BeautifulSoup
 from datetime import datetime, timedelta
-import requests
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import logging
 
+log = logging.getLogger("mlfa")
+
+# Nothing below authenticates, touches the network or reads state at import
+# time; main() does that via warm_up(). O365, openai and bs4 are imported lazily.
 
-load_dotenv()
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# Shared, dependency-free modules from src/ (reply-text cleaner, logging
+# setup, routing planner, token refresh)
+sys.path.insert(0, os.path.join(BASE_DIR, "src"))
+from cleaner import clean_message_text  # noqa: E402
+from logs import setup_logging  # noqa: E402
+from routing import Router  # noqa: E402
+from tokens import TokenRefresher  # noqa: E402
+
 ### CONSTANTS
 
 # Start from now - only process new emails going forward
@@ -34,60 +43,127 @@ def save_processed_messages():
             for msg_id in processed_messages:
                 f.write(f"{msg_id}\n")
     except Exception as e:
-        print(f"⚠️ Could not save processed messages: {e}")
-
-# Load processed messages at startup
-processed_messages = load_processed_messages()
-print(f"📚 Loaded {len(processed_messages)} processed messages from previous runs")
+        log.warning("⚠️ Could not save processed messages: %s", e)
 
 CLIENT_ID = "c0abfd02-2166-4a52-b052-16d1aa084afb"  # MLFA app registration
-CLIENT_SECRET = os.getenv("O365_CLIENT_SECRET")
-TENANT_ID = os.getenv("O365_TENANT_ID")
 REPLY_ID_TAG = "Pair_Reply_Reference_ID"
+# Ask Graph for immutable item ids on every request (O365 adds these headers to
+# each call). A message keeps its id when it is moved to another folder, so ids
+# in pending_emails, forwarded_recipients and the hidden reply tag stay direct GETs.
+GRAPH_HEADERS = {"Prefer": 'IdType="ImmutableId"'}
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-EMAIL_TO_WATCH = os.getenv("EMAIL_TO_WATCH")
+# Filled in from the environment / .env by load_config()
+CLIENT_SECRET = None
+TENANT_ID = None
+OPENAI_API_KEY = None
+EMAIL_TO_WATCH = None
+IS_PRODUCTION = False
 
 
 EMAILS_TO_FORWARD = ['Mujahid.rasul@mlfa.org', 'Syeda.sadiqa@mlfa.org', 'Arshia.ali.khan@mlfa.org', 'Maria.laura@mlfa.org', 'info@mlfa.org', 'aisha.ukiu@mlfa.org', 'shawn@strategichradvisory.com', 'Marium.Uddin@mlfa.org']
-NONREAD_CATEGORIES = {"marketing"}  # Keep these unread
-SKIP_CATEGORIES = {'spam', 'cold_outreach', 'newsletter', 'irrelevant_other'}
+# Per-category forwards, replies, moves and read state; edits are picked up
+# on the next poll cycle (see src/routing.py for the format)
+ROUTES_PATH = os.path.join(BASE_DIR, "email_routes.json")
 
 HUMAN_CHECK = True  # Enable human check for approval hub
 
 # Storage for multiple pending emails
 pending_emails = {}  # Dictionary to store multiple emails by ID
-current_email_id = None  # Track which email is currently being shown
 
 # Storage for forwarded email recipients (for CC functionality)
 forwarded_recipients = {}  # Maps message_id to list of recipients
 
+
+def load_config():
+    """Read .env and the environment into the module settings."""
+    global CLIENT_SECRET, TENANT_ID, OPENAI_API_KEY, EMAIL_TO_WATCH, IS_PRODUCTION
+    load_dotenv()
+    CLIENT_SECRET = os.getenv("O365_CLIENT_SECRET")
+    TENANT_ID = os.getenv("O365_TENANT_ID")
+    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    EMAIL_TO_WATCH = os.getenv("EMAIL_TO_WATCH")
+    # Security settings - adjust based on environment
+    IS_PRODUCTION = os.getenv('ENVIRONMENT', 'development').lower() == 'production'
+
 ###CONNECTING
 
+# Set by warm_up() / reconnect_account()
+account = None
+mailbox = None
+inbox_folder = None
+junk_folder = None
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_openai_client():
+    """Create the OpenAI client on first use (the openai package is slow to import)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+                _client = OpenAI(api_key=OPENAI_API_KEY)
+    return _client
+
+
+def connect_account(force=False):
+    """Build and authenticate the Graph Account. `force` re-runs authentication."""
+    from O365 import Account, FileSystemTokenBackend
+
+    # Use client credentials for production (no user interaction needed)
+    if IS_PRODUCTION and CLIENT_SECRET:
+        credentials = (CLIENT_ID, CLIENT_SECRET)
+        acct = Account(credentials, auth_flow_type="credentials", tenant_id=TENANT_ID,
+                       default_headers=GRAPH_HEADERS)
+        if force or not acct.is_authenticated:
+            acct.authenticate()
+    else:
+        # Development mode with OAuth flow
+        credentials = (CLIENT_ID, None)
+        token_backend = FileSystemTokenBackend(token_path=".", token_filename="o365_token.txt")
+        acct = Account(credentials, auth_flow_type="authorization", token_backend=token_backend, tenant_id=TENANT_ID,
+                       default_headers=GRAPH_HEADERS)
+        if force or not acct.is_authenticated:
+            acct.authenticate(scopes=['basic', 'message_all'])
+    return acct
+
+
+def warm_up():
+    """
+    Run independent start-up steps concurrently: auth followed by parallel
+    inbox/junk folder resolution, processed-message and delta token loading,
+    and the OpenAI client import. Returns (inbox_delta, junk_delta, timings).
+    """
+    global account, mailbox, inbox_folder, junk_folder, processed_messages
+    timings = {}
+
+    def timed(name, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            timings[name] = time.perf_counter() - t0
 
-from openai import OpenAI
-client = OpenAI(api_key=OPENAI_API_KEY)
+    def load_state():
+        return load_processed_messages(), load_last_delta()
 
-# Security settings - adjust based on environment
-IS_PRODUCTION = os.getenv('ENVIRONMENT', 'development').lower() == 'production'
+    with ThreadPoolExecutor(max_workers=4, thread_name_prefix="warmup") as pool:
+        auth_f = pool.submit(timed, "auth", connect_account)
+        state_f = pool.submit(timed, "state", load_state)
+        pool.submit(timed, "openai", get_openai_client)
+
+        account = auth_f.result()
+        mailbox = account.mailbox(resource=EMAIL_TO_WATCH)
+        inbox_f = pool.submit(timed, "inbox_folder", mailbox.inbox_folder)
+        junk_f = pool.submit(timed, "junk_folder", mailbox.junk_folder)
 
-# Use client credentials for production (no user interaction needed)
-if IS_PRODUCTION and CLIENT_SECRET:
-    credentials = (CLIENT_ID, CLIENT_SECRET)
-    account = Account(credentials, auth_flow_type="credentials", tenant_id=TENANT_ID)
-    if not account.is_authenticated:
-        account.authenticate()
-else:
-    # Development mode with OAuth flow
-    credentials = (CLIENT_ID, None)
-    token_backend = FileSystemTokenBackend(token_path=".", token_filename="o365_token.txt")
-    account = Account(credentials, auth_flow_type="authorization", token_backend=token_backend, tenant_id=TENANT_ID)
-    if not account.is_authenticated:
-        account.authenticate(scopes=['basic', 'message_all'])
+        processed_messages, (inbox_delta, junk_delta) = state_f.result()
+        inbox_folder = inbox_f.result()
+        junk_folder = junk_f.result()
 
-mailbox = account.mailbox(resource=EMAIL_TO_WATCH)
-inbox_folder = mailbox.inbox_folder()
-junk_folder = mailbox.junk_folder()
+    log.info("📚 Loaded %d processed messages from previous runs", len(processed_messages))
+    return inbox_delta, junk_delta, timings
 
 
 
@@ -115,16 +191,12 @@ def save_last_delta(inbox_token, junk_token):
     # Create the full, correct path for saving
     inbox_token_path = os.path.join(BASE_DIR, "delta_token_inbox.txt")
     junk_token_path = os.path.join(BASE_DIR, "delta_token_junk.txt")
-    print("Made it", inbox_token)
 
     try:
-        print("second")
         # CHECK if a valid token was passed in
         if inbox_token:
-            print("third")
             # OPEN the correct full path
             with open(inbox_token_path, "w") as f:
-                print("CHIECKEN")
                 f.write(inbox_token)
         
         # CHECK if a valid token was passed in
@@ -134,7 +206,7 @@ def save_last_delta(inbox_token, junk_token):
                 f.write(junk_token)
 
     except IOError as e:
-        print(f"⚠️ CRITICAL: Could not save delta token to file! Error: {e}")
+        log.error("⚠️ CRITICAL: Could not save delta token to file! Error: %s", e)
 
 
 #Passes the subject and body of the email to chat gpt, which figures out how to handle the email. 
@@ -240,7 +312,7 @@ def classify_email(subject, body):
 
 
     try:
-        response = client.chat.completions.create(
+        response = get_openai_client().chat.completions.create(
             model="gpt-4.1-mini",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.2,
@@ -252,11 +324,11 @@ def classify_email(subject, body):
         
         # Ensure we always return a dictionary
         if not isinstance(parsed_result, dict):
-            print(f"Warning: AI returned non-dict response: {type(parsed_result)}")
+            log.warning("AI returned non-dict response: %s", type(parsed_result))
             return {}
         return parsed_result
     except Exception as e:
-        print(f"Classification error: {e}")
+        log.error("Classification error: %s", e)
         return {}
 
 
@@ -281,20 +353,10 @@ def process_folder(folder, name, delta_token):
     try:
         msgs = folder.get_messages(query=qs)
 
-         # ---- NEW DIAGNOSTIC CHECK 1 ----
-        # First, let's see if the API call even returned a valid object.
         if not msgs:
-            print(f"DIAGNOSTIC [{name}]: API call to get_messages returned an empty or None object. Nothing to do.")
+            log.debug("[%s] get_messages returned nothing", name)
             return delta_token # Return the old token if the call failed
 
-        # Since 'msgs' is an iterator, we convert it to a list to work with it.
-        # This allows us to count items and inspect the parent object later.
-        msg_list = list(msgs)
-        
-        # ---- NEW DIAGNOSTIC CHECK 2 ----
-        # How many items did the API actually return?
-        print(f"DIAGNOSTIC [{name}]: API response contains {len(msg_list)} changed item(s).")
-
         for msg in msgs:
             # For each conversation that changed, act ONLY on unread children
             conv_id = getattr(msg, 'conversation_id', None)
@@ -326,13 +388,13 @@ def process_folder(folder, name, delta_token):
                         processed_messages.add(dedup_key)
                         continue
 
-                    body_to_analyze = get_clean_message_text(msg)
+                    body_to_analyze = clean_message_text(msg)
 
-                    print(f"\nNEW:  [{name}] {msg.received.strftime('%Y-%m-%d %H:%M')} | "
-                          f"{msg.sender.address if msg.sender else 'UNKNOWN'} | {msg.subject}")
+                    log.info("NEW:  [%s] %s | %s | %s", name, msg.received.strftime('%Y-%m-%d %H:%M'),
+                             msg.sender.address if msg.sender else 'UNKNOWN', msg.subject)
                     result = classify_email(msg.subject, body_to_analyze)
                     if HUMAN_CHECK: 
-                        print(json.dumps(result, indent=2))
+                        log.debug("Classification: %s", result.get("categories"), extra={"classification": result})
                         # Skip if this email is already in pending queue (prevent duplicates)
                         email_id = msg.object_id
                         if email_id not in pending_emails:
@@ -344,12 +406,12 @@ def process_folder(folder, name, delta_token):
                                 "received": msg.received.strftime('%Y-%m-%d %H:%M'),
                                 "message_obj": msg
                             }
-                            print(f"📧 Email stored for approval: {msg.subject}")
+                            log.info("📧 Email stored for approval: %s", msg.subject)
                         else:
-                            print(f"⏭️  Email already in pending queue, skipping: {msg.subject}")
+                            log.debug("⏭️ Email already in pending queue, skipping: %s", msg.subject)
                         processed_messages.add(dedup_key)
                     else: 
-                        print(json.dumps(result, indent=2))
+                        log.debug("Classification: %s", result.get("categories"), extra={"classification": result})
                         handle_new_email(msg, result)
                         processed_messages.add(dedup_key)
                 continue  # done with this delta item
@@ -358,7 +420,7 @@ def process_folder(folder, name, delta_token):
             try:
                 unread_msgs = unread_in_conversation(folder, mailbox, conv_id)
             except Exception as e:
-                print(f"   Could not fetch unread children for {conv_id}: {e}")
+                log.warning("Could not fetch unread children for %s: %s", conv_id, e)
                 continue
 
             if not unread_msgs:
@@ -396,11 +458,11 @@ def process_folder(folder, name, delta_token):
                     continue
 
                 # 3) Classify using reply-only text, then handle
-                body_to_analyze = get_clean_message_text(child)
-                print(f"\nNEW:  [{name}] {child.received.strftime('%Y-%m-%d %H:%M')} | "
-                      f"{child.sender.address if child.sender else 'UNKNOWN'} | {child.subject}")
+                body_to_analyze = clean_message_text(child)
+                log.info("NEW:  [%s] %s | %s | %s", name, child.received.strftime('%Y-%m-%d %H:%M'),
+                         child.sender.address if child.sender else 'UNKNOWN', child.subject)
                 result = classify_email(child.subject, body_to_analyze)
-                print(json.dumps(result, indent=2))
+                log.debug("Classification: %s", result.get("categories"), extra={"classification": result})
                 
                 if HUMAN_CHECK:
                     # Skip if this email is already in pending queue (prevent duplicates)
@@ -414,9 +476,9 @@ def process_folder(folder, name, delta_token):
                             "received": child.received.strftime('%Y-%m-%d %H:%M'),
                             "message_obj": child
                         }
-                        print(f"📧 Email stored for approval: {child.subject}")
+                        log.info("📧 Email stored for approval: %s", child.subject)
                     else:
-                        print(f"⏭️  Email already in pending queue, skipping: {child.subject}")
+                        log.debug("⏭️ Email already in pending queue, skipping: %s", child.subject)
                 else:
                     handle_new_email(child, result)
 
@@ -436,13 +498,8 @@ def process_folder(folder, name, delta_token):
             # If no new link, return the old token so we don't lose it
             return delta_token'''
         
-         # ---- NEW DIAGNOSTIC CHECK 3 ----
-        # This is the most important check. What attributes are available on the 'msgs' object?
-        # Is 'delta_link' missing, or just named differently?
-        print(f"DIAGNOSTIC [{name}]: Attributes on the result object are: {dir(msgs)}")
-        
         new_delta_link = getattr(msgs, 'delta_link', None)
-        print(f"DIAGNOSTIC [{name}]: Final check for delta_link: {new_delta_link}")
+        log.debug("[%s] delta link present: %s", name, bool(new_delta_link))
         
         if new_delta_link:
             return new_delta_link.split('deltatoken=')[-1]
@@ -451,7 +508,7 @@ def process_folder(folder, name, delta_token):
         
 
     except Exception as e:
-        print(f" Error accessing {name}: {e}")
+        log.error("Error accessing %s: %s", name, e)
         return delta_token
 
 
@@ -459,37 +516,62 @@ def handle_new_email(msg, result):
     """
     Takes a message and its AI classification result, then acts on it.
     It does NOT call the AI again.
+
+    However many categories the message has, the routing plan gives one
+    categories + read-state PATCH, at most one reply (the first route in
+    email_routes.json with one), one forward to every recipient and one move,
+    which goes last.
     """
-    categories = result.get("categories", [])
-    recipients_set = set(result.get("all_recipients", []))
-    name_sender = result.get("name_sender")
-    
-    # We pass the message and its categories to be tagged
-    tag_email(msg, categories, replyTag=False)
-    # We use the results to perform specific actions
-    handle_emails(categories, result, recipients_set, msg, name_sender)
+    plan = router.table.plan(result)
+
+    # Category tags and read state in one PATCH
+    tag_email(msg, plan.categories, replyTag=False, read=True if plan.mark_read else None)
+
+    if plan.reply:
+        reply_message = msg.reply(to_all=False)
+        reply_message.body = plan.reply.replace("{greeting}", get_time_based_greeting(result.get("name_sender")))
+        reply_message.body_type = "HTML"
+        reply_message.send()
 
-    if recipients_set:
+    if plan.forward:
         fwd = msg.forward()
-        recipients_list = list(recipients_set)
-        fwd.to.add(recipients_list)
-        
+        fwd.to.add(plan.forward)
+
         # Store recipients for later CC functionality
-        forwarded_recipients[msg.object_id] = recipients_list
-        
+        forwarded_recipients[msg.object_id] = plan.forward
+
         # Add the hidden tracking ID into the top of the forwarded body
         instruction_html = f"""<div style="display:none;">{REPLY_ID_TAG}{msg.object_id}</div>"""
-        
+
         # Prepend to the auto-generated forward body
         fwd.body = "Please press 'Reply All,' and reply to info@mlfa.org. You're email will automatically be sent to the correct person. " + instruction_html
         fwd.body_type = 'HTML'
-        
+
         # Send the forward
         fwd.send()
 
+    if plan.move:
+        move_to_folder(msg, plan.move)
 
-    if not set(categories).issubset(NONREAD_CATEGORIES):
-        mark_as_read(msg)
+
+def move_to_folder(msg, folders):
+    """
+    Move `msg` to the first of `folders` that exists. A name is a path below
+    the inbox, "/"-separated for nested folders ("Irrelevant/Spam").
+    """
+    inbox = mailbox.inbox_folder()
+    for path in folders:
+        try:
+            target = inbox
+            for folder_name in path.split("/"):
+                target = target.get_folder(folder_name=folder_name)
+        except Exception:
+            target = None
+        if target:
+            log.info("Moving to %s folder.", path)
+            return msg.move(target)
+    log.warning("⚠️ Could not move %s: none of the folders %s exist", msg.subject, folders)
+    return False
 
 
 def get_time_based_greeting(name_sender):
@@ -508,217 +590,9 @@ def get_time_based_greeting(name_sender):
     else:
         return "Good morning,"  # Default to good morning for late night/early morning
 
-def handle_emails(categories, result, recipients_set, msg, name_sender): 
-    for category in categories:
-        if category == "legal":
-            reply_message = msg.reply(to_all=False)
-            # Check if this email needs a personal reply based on classification
-            needs_personal = result.get("needs_personal_reply", False)
-            greeting = get_time_based_greeting(name_sender)
-
-            if needs_personal:
-                reply_message.body = f"""
-                    <p>{greeting}</p>
-
-                    <p>Thank you for contacting the Muslim Legal Fund of America (MLFA). 
-                    We are grateful that you reached out and placed your trust in us to potentially support your legal matter.</p>
-
-                    <p>If you have not already done so, please submit a formal application for legal assistance through our website:<br>
-                    <a href="https://mlfa.org/application-for-legal-assistance/">https://mlfa.org/application-for-legal-assistance/</a></p>
-
-                    <p>Once submitted, our team will carefully review your application and follow up with next steps. 
-                    If you have any questions about the application process or need help completing it, please don't hesitate to reach out.</p>
-
-                    <p>We appreciate your patience as we work through applications, and we look forward to learning more about how we might be able to help.</p>
-
-                    <p>Warm regards,<br>
-                    The MLFA Team<br>
-                    Muslim Legal Fund of America</p>
-                """
-
-                reply_message.body_type = "HTML"
-            else:
-                reply_message.body = f"""
-                    <p>{greeting}</p>
-
-                    <p>Thank you for contacting the Muslim Legal Fund of America (MLFA).</p>
-
-                    <p>If you have not already done so, please submit a formal application for legal assistance 
-                    through our website:<br>
-                    <a href="https://mlfa.org/application-for-legal-assistance/">https://mlfa.org/application-for-legal-assistance/</a></p>
-
-                    <p>This ensures our legal team has the information needed to review your case promptly.</p>
-
-                    <p>Sincerely,<br>
-                    The MLFA Team</p>
-                """
-
-                reply_message.body_type = "HTML"
-            reply_message.send()
-            
-            # Move to Apply for help folder
-            inbox = mailbox.inbox_folder()
-            try:
-                apply_folder = inbox.get_folder(folder_name="Apply for help")
-                print("Moving to Apply for help folder.")
-                msg.move(apply_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to Apply for help folder: {e}")
-
-        elif category == "donor":
-            recipients_set.update([f"{EMAILS_TO_FORWARD[0]}", f"{EMAILS_TO_FORWARD[1]}"])
-            # Move to Doner_Related folder
-            inbox = mailbox.inbox_folder()
-            try:
-                donor_folder = inbox.get_folder(folder_name="Doner_Related")
-                print("Moving to Doner_Related folder.")
-                msg.move(donor_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to Doner_Related folder: {e}")
-
-        elif category == "sponsorship":
-            recipients_set.update([f"{EMAILS_TO_FORWARD[2]}", f"{EMAILS_TO_FORWARD[3]}"])
-
-        elif category == "organizational":
-            recipients_set.update([f"{EMAILS_TO_FORWARD[2]}", f"{EMAILS_TO_FORWARD[3]}"])
-            # Move to Organizational inquiries folder
-            inbox = mailbox.inbox_folder()
-            try:
-                org_folder = inbox.get_folder(folder_name="Organizational inquiries")
-                print("Moving to Organizational inquiries folder.")
-                msg.move(org_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to Organizational inquiries folder: {e}")
-
-        elif category == "volunteer":
-            # Send automated reply with volunteer application form instead of forwarding
-            reply_message = msg.reply(to_all=False)
-            greeting = get_time_based_greeting(name_sender)
-            
-            reply_message.body = f"""
-                <p>{greeting}</p>
-
-                <p>Thank you for your interest in volunteering with the Muslim Legal Fund of America (MLFA)!</p>
-
-                <p>We are grateful for your willingness to support our mission of providing legal assistance to Muslims in need. To get started with the volunteer process, please complete our volunteer application form:</p>
-
-                <p><a href="https://forms.office.com/Pages/ResponsePage.aspx?id=oiB_iSDzkUu20kpWPbd_DnxSOj2KmWxOomg5Rm0KtBNUMElYQkdOQUU2WUxLTlNHMkY4S0tFOU1XViQlQCN0PWcu">MLFA Volunteer Application Form</a></p>
-
-                <p>Once you submit the form, our team will review your application and follow up with next steps about volunteer opportunities that match your skills and interests.</p>
-
-                <p>Thank you again for your support!</p>
-
-                <p>Best regards,<br>
-                The MLFA Team<br>
-                Muslim Legal Fund of America</p>
-            """
-            
-            reply_message.body_type = "HTML"
-            reply_message.send()
-            
-            # Move to Volunteer folder
-            inbox = mailbox.inbox_folder()
-            try:
-                volunteer_folder = inbox.get_folder(folder_name="Volunteer")
-                print("Moving to Volunteer folder.")
-                msg.move(volunteer_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to Volunteer folder: {e}")
-
-        elif category == "internship":
-            recipients_set.update([f"{EMAILS_TO_FORWARD[5]}"])
-            # Move to Internship folder
-            inbox = mailbox.inbox_folder()
-            try:
-                internship_folder = inbox.get_folder(folder_name="Internship")
-                print("Moving to Internship folder.")
-                msg.move(internship_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to Internship folder: {e}")
-
-        elif category == "job_application":
-            recipients_set.update([f"{EMAILS_TO_FORWARD[6]}"])
-            # Move to Job_Application folder
-            inbox = mailbox.inbox_folder()
-            try:
-                job_folder = inbox.get_folder(folder_name="Job_Application")
-                print("Moving to Job_Application folder.")
-                msg.move(job_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to Job_Application folder: {e}")
-
-        elif category == "fellowship":
-            recipients_set.update([f"{EMAILS_TO_FORWARD[5]}"])
-            # Move to Fellowship folder
-            inbox = mailbox.inbox_folder()
-            try:
-                fellowship_folder = inbox.get_folder(folder_name="Fellowship")
-                print("Moving to Fellowship folder.")
-                msg.move(fellowship_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to Fellowship folder: {e}")
-            
-        elif category == "media":
-            recipients_set.update([f"{EMAILS_TO_FORWARD[7]}"])  # Marium.Uddin@mlfa.org
-            # Move to Media folder
-            inbox = mailbox.inbox_folder()
-            try:
-                media_folder = inbox.get_folder(folder_name="Media")
-                print("Moving to Media folder.")
-                msg.move(media_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to Media folder: {e}")
 
-        elif category == "marketing":
-            inbox = mailbox.inbox_folder()
-            try:
-                sales_folder = inbox.get_folder(folder_name="Sales emails")
-                print("Moving to Sales emails folder.")
-                msg.move(sales_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to Sales emails folder: {e}")
-        
-        elif category == "cold_outreach":
-            inbox = mailbox.inbox_folder()
-            try:
-                irrelevant_folder = inbox.get_folder(folder_name="Irrelevant")
-                cold_outreach_folder = irrelevant_folder.get_folder(folder_name="Cold_Outreach")
-                print("Moving to Irrelevant/Cold_Outreach folder.")
-                msg.move(cold_outreach_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to Irrelevant/Cold_Outreach folder: {e}")
-        
-        elif category == "spam":
-            inbox = mailbox.inbox_folder()
-            try:
-                irrelevant_folder = inbox.get_folder(folder_name="Irrelevant")
-                spam_folder = irrelevant_folder.get_folder(folder_name="Spam")
-                print("Moving to Irrelevant/Spam folder.")
-                msg.move(spam_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to Irrelevant/Spam folder: {e}")
-        
-        elif category == "newsletter":
-            inbox = mailbox.inbox_folder()
-            try:
-                for_reference_folder = inbox.get_folder(folder_name="For reference")
-                newsletter_folder = for_reference_folder.get_folder(folder_name="subscriptions and newsletters")
-                print("Moving to For reference/subscriptions and newsletters folder.")
-                msg.move(newsletter_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to For reference/subscriptions and newsletters folder: {e}")
-        
-        elif category == "irrelevant_other":
-            inbox = mailbox.inbox_folder()
-            try:
-                irrelevant_folder = inbox.get_folder(folder_name="Irrelevant")
-                other_folder = irrelevant_folder.get_folder(folder_name="Other")
-                print("Moving to Irrelevant/Other folder.")
-                msg.move(other_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to Irrelevant/Other folder: {e}")
-
-def tag_email(msg, categories, replyTag):
+def tag_email(msg, categories, replyTag, read=None):
+    """Merge the PAIRActioned tags in and, unless `read` is None, set isRead in the same PATCH."""
     # 1) Load existing categories safely
     existing = set((msg.categories or []))
 
@@ -743,38 +617,45 @@ def tag_email(msg, categories, replyTag):
     merged = existing.union(new_tags)
 
     # 4) Save only if there’s a change
+    changed = False
     if merged != existing:
         msg.categories = sorted(merged)
+        changed = True
+    if read is not None and bool(msg.is_read) != read:
+        msg.is_read = read
+        changed = True
+    if changed:
         msg.save_message()
 
 
 def mark_as_read(msg): 
-    print("   Marking email as read...")
     try:
         msg.mark_as_read()
-        print("   Marked as read")
+        log.debug("Marked as read: %s", msg.subject)
     except Exception as e:
-        print(f"    Could not mark as read: {e}")
+        log.warning("Could not mark as read: %s", e)
 
 def handle_internal_reply(msg): 
-    print(f"\nREPLY DETECTED: From {msg.sender.address} | {msg.subject}")
+    log.info("REPLY DETECTED: From %s | %s", msg.sender.address, msg.subject)
     body_parts = msg.body.split(REPLY_ID_TAG)
     if len(body_parts) < 2:
-        print(" ERROR: Could not find the reply id, therefore, we cannot reply. ")
+        log.error("Could not find the reply id, therefore, we cannot reply.")
         return
 
+    from bs4 import BeautifulSoup
+
     html_chunk = body_parts[0]
     soup = BeautifulSoup(html_chunk, 'html.parser')
     reply_content = str(soup)
 
     if not reply_content: 
-        print("   WARNING: Reply appears to be empty. Not sending. ")
+        log.warning("Reply appears to be empty. Not sending.")
         #We need to maybe re-email the person who wrote the reply to the forwarded email to try again. 
         return
 
     match = re.search(f"{REPLY_ID_TAG}(.+?)</", msg.body)
     if not match: 
-        print("   ERROR: Could not find the original message ID.")
+        log.error("Could not find the original message ID.")
         return
     original_message_id = match.group(1).strip()
     
@@ -787,7 +668,7 @@ def handle_internal_reply(msg):
         if original_message_id in forwarded_recipients:
             all_recipients = forwarded_recipients[original_message_id]
             other_forwardees = [email for email in all_recipients if email.lower() != sender_email]
-            print(f"   Found recipients: {all_recipients}, will CC: {other_forwardees}")
+            log.debug("Found recipients: %s, will CC: %s", all_recipients, other_forwardees)
         
         # Create the reply
         final_reply = original_msg.reply(to_all=False)
@@ -798,17 +679,17 @@ def handle_internal_reply(msg):
         if other_forwardees:
             for cc_email in other_forwardees:
                 final_reply.cc.add(cc_email)
-            print(f"   Sent reply to original sender: {original_msg.sender.address}, CC'd: {other_forwardees}")
+            log.info("Sent reply to original sender: %s, CC'd: %s", original_msg.sender.address, other_forwardees)
         else:
-            print(f"   Sent reply to original sender: {original_msg.sender.address}")
+            log.info("Sent reply to original sender: %s", original_msg.sender.address)
         
         final_reply.send()
     except Exception as e:
-        print(f"   ERROR: Could not send final reply. Error: {e}")
+        log.error("Could not send final reply: %s", e)
         return
 
     msg.mark_as_read()
-    print("   Cleanup complete. Reply process finished.")
+    log.debug("Reply process finished.")
 
 
 def newest_unread_in_conversation(folder, mailbox, conversation_id):
@@ -871,134 +752,93 @@ def unread_in_conversation(folder, mailbox, conversation_id, page_limit=30):
         except: pass
     return unread
 
-def get_clean_message_text(msg):
-    """
-    Return only the reply content for this message.
-    Prefer Graph's unique_body (just the new text),
-    otherwise strip quoted history from the full body.
-    """
-    QUOTE_SEPARATORS = [
-        r'^\s*On .* wrote:\s*$',              
-        r'^\s*From:\s.*$',                    
-        r'^\s*-----Original Message-----\s*$',
-        r'^\s*De:\s.*$',                      
-        r'^\s*Sent:\s.*$',
-        r'^\s*To:\s.*$',
-    ]
-
-    def strip_quoted_reply(html_or_text: str) -> str:
-        if not html_or_text:
-            return ""
-        text = html_or_text
-        try:
-            from bs4 import BeautifulSoup
-            soup = BeautifulSoup(html_or_text, 'html.parser')
-            for sel in [
-                'blockquote',
-                'div.gmail_quote',
-                'div[type=cite]',
-                'div.moz-cite-prefix',
-                'div.OutlookMessageHeader',
-            ]:
-                for node in soup.select(sel):
-                    node.decompose()
-            text = soup.get_text("\n")
-        except Exception:
-            pass
-
-        import re
-        lines = [ln.rstrip() for ln in text.splitlines()]
-        out = []
-        for ln in lines:
-            if ln.strip().startswith('>'):
-                break
-            if any(re.match(pat, ln, flags=re.IGNORECASE) for pat in QUOTE_SEPARATORS):
-                break
-            out.append(ln)
-
-        return "\n".join(out).strip()[:8000]
-
-    body = getattr(msg, 'unique_body', None) or getattr(msg, 'body', None) or ""
-    return strip_quoted_reply(body)
-
-
-
-inbox_delta, junk_delta = load_last_delta()
-
-# Import and initialize the web interface
-from web_interface import app, create_email_routes, start_web_server
-
-# Initialize the email routes with the required dependencies
-create_email_routes(pending_emails, handle_new_email, processed_messages, mailbox, mark_as_read)
-
-# Start the web server
-start_web_server()
-print(f"Monitoring inbox + junk for: {EMAIL_TO_WATCH} … Ctrl-C to stop.")
-print(f"📧 Approval hub available at: http://localhost:5000")
 
 def reconnect_account():
-    """Re-authenticate and reconnect to mailbox"""
+    """
+    Last resort when refreshing the token in place did not help: rebuild the
+    Account, mailbox and folders from scratch.
+    """
     global account, mailbox, inbox_folder, junk_folder
     
-    print("🔄 Re-authenticating with Microsoft Graph API...")
+    log.info("🔄 Re-authenticating with Microsoft Graph API...")
     try:
         # Re-authenticate with fresh token
-        if IS_PRODUCTION and CLIENT_SECRET:
-            credentials = (CLIENT_ID, CLIENT_SECRET)
-            account = Account(credentials, auth_flow_type="credentials", tenant_id=TENANT_ID)
-            account.authenticate()  # Force new authentication
-        else:
-            credentials = (CLIENT_ID, None)
-            token_backend = FileSystemTokenBackend(token_path=".", token_filename="o365_token.txt")
-            account = Account(credentials, auth_flow_type="authorization", token_backend=token_backend, tenant_id=TENANT_ID)
-            account.authenticate(scopes=['basic', 'message_all'])
+        account = connect_account(force=True)
         
         # Reconnect to mailbox
         mailbox = account.mailbox(resource=EMAIL_TO_WATCH)
         inbox_folder = mailbox.inbox_folder()
         junk_folder = mailbox.junk_folder()
-        
-        print("✅ Successfully re-authenticated!")
+        token_refresher.connection = account.connection
+
+        log.info("✅ Successfully re-authenticated!")
         return True
     except Exception as e:
-        print(f"❌ Re-authentication failed: {e}")
+        log.error("❌ Re-authentication failed: %s", e)
         return False
 
-consecutive_errors = 0
-last_successful_check = time.time()
 
-while True:
-    try:
-        print(f"🔄 Checking for new emails... (Pending: {len(pending_emails)}, Processed: {len(processed_messages)})")
-        
-        # Check if it's been too long since last successful check (1 hour)
-        if time.time() - last_successful_check > 3600:
-            print("⚠️ No successful checks in 1 hour, forcing re-authentication...")
-            reconnect_account()
-        
-        inbox_delta = process_folder(inbox_folder, "INBOX", inbox_delta)
-        junk_delta = process_folder(junk_folder, "JUNK", junk_delta)
-        print(f"DEBUG: Current directory is: {os.getcwd()}")
-        #gets the new delta tokens and then saves them,
-        save_last_delta(inbox_delta, junk_delta)
-        # Also save processed messages regularly
-        save_processed_messages()
-        
-        # Reset error counter on success
-        consecutive_errors = 0
-        last_successful_check = time.time()
-        
-    except Exception as e:
-        consecutive_errors += 1
-        print(f"❌ Error in main loop (attempt {consecutive_errors}): {e}")
+token_refresher = None  # set by main()
+router = None  # set by main()
+
+
+def main():
+    global token_refresher, router
+    load_dotenv()  # LOG_LEVEL / LOG_LEVELS / LOG_FORMAT may come from .env
+    setup_logging()
+    started = time.perf_counter()
+    load_config()
+    router = Router(REPLY_ID_TAG, path=ROUTES_PATH)
+    inbox_delta, junk_delta, timings = warm_up()
+    token_refresher = TokenRefresher(account.connection)
+    token_refresher.start()
+
+    # Import and initialize the web interface
+    from web_interface import app, create_email_routes, start_web_server
+
+    # Initialize the email routes with the required dependencies
+    create_email_routes(pending_emails, handle_new_email, processed_messages, mailbox, mark_as_read)
+
+    # Start the web server
+    start_web_server()
+    steps = ", ".join(f"{name} {secs:.2f}s" for name, secs in sorted(timings.items()))
+    log.info("🚀 Ready in %.2fs (%s)", time.perf_counter() - started, steps)
+    log.info("Monitoring inbox + junk for: %s … Ctrl-C to stop.", EMAIL_TO_WATCH)
+    log.info("📧 Approval hub available at: http://localhost:5000")
+
+    consecutive_errors = 0
+
+    while True:
+        try:
+            log.debug("🔄 Checking for new emails... (Pending: %d, Processed: %d)", len(pending_emails), len(processed_messages))
+            
+            router.reload_if_changed()
+            inbox_delta = process_folder(inbox_folder, "INBOX", inbox_delta)
+            junk_delta = process_folder(junk_folder, "JUNK", junk_delta)
+            #gets the new delta tokens and then saves them,
+            save_last_delta(inbox_delta, junk_delta)
+            # Also save processed messages regularly
+            save_processed_messages()
+            
+            # Reset error counter on success
+            consecutive_errors = 0
+            
+        except Exception as e:
+            consecutive_errors += 1
+            log.error("❌ Error in main loop (attempt %d): %s", consecutive_errors, e)
+            
+            # If we get 3 errors in a row, refresh the token in place; rebuild
+            # the whole account only if that does not work
+            if consecutive_errors >= 3:
+                log.warning("⚠️ Multiple consecutive errors detected, refreshing the access token...")
+                if token_refresher.refresh() or reconnect_account():
+                    consecutive_errors = 0
+                else:
+                    log.warning("😴 Waiting 60 seconds before retry...")
+                    time.sleep(60)
         
-        # If we get 3 errors in a row, try to re-authenticate
-        if consecutive_errors >= 3:
-            print("⚠️ Multiple consecutive errors detected, attempting to reconnect...")
-            if reconnect_account():
-                consecutive_errors = 0
-            else:
-                print("😴 Waiting 60 seconds before retry...")
-                time.sleep(60)
-    
-    time.sleep(10)
+        time.sleep(10)
+
+
+if __name__ == "__main__":
+    main()
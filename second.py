@@ -1,73 +1,149 @@
-from O365 import Account, FileSystemTokenBackend
 from dotenv import load_dotenv
 from datetime import datetime, timezone, timedelta
-import os, time, openai, json
-import textwrap
+import os, sys, time, json
 import re
-from bs4 import BeautifulSoup
 from datetime import datetime, timedelta
-import requests
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import logging
 
+log = logging.getLogger("mlfa")
+
+# Nothing below authenticates, touches the network or reads state at import
+# time; main() does that via warm_up(). O365, openai and bs4 are imported lazily.
 
-load_dotenv()
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# Shared, dependency-free modules from src/ (reply-text cleaner, logging
+# setup, routing planner, token refresh)
+sys.path.insert(0, os.path.join(BASE_DIR, "src"))
+from cleaner import clean_message_text  # noqa: E402
+from logs import setup_logging  # noqa: E402
+from routing import Router  # noqa: E402
+from tokens import TokenRefresher  # noqa: E402
+
 ### CONSTANTS
 
 # Start from now - only process new emails going forward
 START_TIME = datetime.now(timezone.utc) - timedelta(days=4)
 
 CLIENT_ID = "c0abfd02-2166-4a52-b052-16d1aa084afb"  # MLFA app registration
-CLIENT_SECRET = os.getenv("O365_CLIENT_SECRET")
-TENANT_ID = os.getenv("O365_TENANT_ID")
 REPLY_ID_TAG = "Pair_Reply_Reference_ID"
-
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-EMAIL_TO_WATCH = os.getenv("EMAIL_TO_WATCH")
+# Ask Graph for immutable item ids on every request (O365 adds these headers to
+# each call). A message keeps its id when it is moved to another folder, so ids
+# in pending_emails, forwarded_recipients and the hidden reply tag stay direct GETs.
+GRAPH_HEADERS = {"Prefer": 'IdType="ImmutableId"'}
+
+# Filled in from the environment / .env by load_config()
+CLIENT_SECRET = None
+TENANT_ID = None
+OPENAI_API_KEY = None
+EMAIL_TO_WATCH = None
+IS_PRODUCTION = False
 
 PENDING_TAG = "PAIRActioned/pending_review"
 
 
 EMAILS_TO_FORWARD = ['Mujahid.rasul@mlfa.org', 'Syeda.sadiqa@mlfa.org', 'Arshia.ali.khan@mlfa.org', 'Maria.laura@mlfa.org', 'info@mlfa.org', 'aisha.ukiu@mlfa.org', 'shawn@strategichradvisory.com', 'Marium.Uddin@mlfa.org']
-NONREAD_CATEGORIES = {"marketing"}  # Keep these unread
-SKIP_CATEGORIES = {'spam', 'cold_outreach', 'newsletter', 'irrelevant_other'}
+# Per-category forwards, replies, moves and read state; edits are picked up
+# on the next poll cycle (see src/routing.py for the format)
+ROUTES_PATH = os.path.join(BASE_DIR, "email_routes.json")
 
 HUMAN_CHECK = True  # Enable human check for approval hub
 
 # Storage for multiple pending emails
 pending_emails = {}  # Dictionary to store multiple emails by ID
-current_email_id = None  # Track which email is currently being shown
 
 # Storage for forwarded email recipients (for CC functionality)
 forwarded_recipients = {}  # Maps message_id to list of recipients
 
+
+def load_config():
+    """Read .env and the environment into the module settings."""
+    global CLIENT_SECRET, TENANT_ID, OPENAI_API_KEY, EMAIL_TO_WATCH, IS_PRODUCTION
+    load_dotenv()
+    CLIENT_SECRET = os.getenv("O365_CLIENT_SECRET")
+    TENANT_ID = os.getenv("O365_TENANT_ID")
+    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    EMAIL_TO_WATCH = os.getenv("EMAIL_TO_WATCH")
+    # Security settings - adjust based on environment
+    IS_PRODUCTION = os.getenv('ENVIRONMENT', 'development').lower() == 'production'
+
 ###CONNECTING
 
+# Set by warm_up() / reconnect_account()
+account = None
+mailbox = None
+inbox_folder = None
+junk_folder = None
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_openai_client():
+    """Create the OpenAI client on first use (the openai package is slow to import)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+                _client = OpenAI(api_key=OPENAI_API_KEY)
+    return _client
+
+
+def connect_account(force=False):
+    """Build and authenticate the Graph Account. `force` re-runs authentication."""
+    from O365 import Account, FileSystemTokenBackend
+
+    # Use client credentials for production (no user interaction needed)
+    if IS_PRODUCTION and CLIENT_SECRET:
+        credentials = (CLIENT_ID, CLIENT_SECRET)
+        acct = Account(credentials, auth_flow_type="credentials", tenant_id=TENANT_ID,
+                       default_headers=GRAPH_HEADERS)
+        if force or not acct.is_authenticated:
+            acct.authenticate()
+    else:
+        # Development mode with OAuth flow
+        credentials = (CLIENT_ID, None)
+        token_backend = FileSystemTokenBackend(token_path=".", token_filename="o365_token.txt")
+        acct = Account(credentials, auth_flow_type="authorization", token_backend=token_backend, tenant_id=TENANT_ID,
+                       default_headers=GRAPH_HEADERS)
+        if force or not acct.is_authenticated:
+            acct.authenticate(scopes=['basic', 'message_all'])
+    return acct
+
+
+def warm_up():
+    """
+    Run independent start-up steps concurrently: auth followed by parallel
+    inbox/junk folder resolution, delta token loading, and the OpenAI client
+    import. Returns (inbox_delta, junk_delta, timings).
+    """
+    global account, mailbox, inbox_folder, junk_folder
+    timings = {}
+
+    def timed(name, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            timings[name] = time.perf_counter() - t0
 
-from openai import OpenAI
-client = OpenAI(api_key=OPENAI_API_KEY)
+    with ThreadPoolExecutor(max_workers=4, thread_name_prefix="warmup") as pool:
+        auth_f = pool.submit(timed, "auth", connect_account)
+        state_f = pool.submit(timed, "state", load_last_delta)
+        pool.submit(timed, "openai", get_openai_client)
 
-# Security settings - adjust based on environment
-IS_PRODUCTION = os.getenv('ENVIRONMENT', 'development').lower() == 'production'
+        account = auth_f.result()
+        mailbox = account.mailbox(resource=EMAIL_TO_WATCH)
+        inbox_f = pool.submit(timed, "inbox_folder", mailbox.inbox_folder)
+        junk_f = pool.submit(timed, "junk_folder", mailbox.junk_folder)
 
-# Use client credentials for production (no user interaction needed)
-if IS_PRODUCTION and CLIENT_SECRET:
-    credentials = (CLIENT_ID, CLIENT_SECRET)
-    account = Account(credentials, auth_flow_type="credentials", tenant_id=TENANT_ID)
-    if not account.is_authenticated:
-        account.authenticate()
-else:
-    # Development mode with OAuth flow
-    credentials = (CLIENT_ID, None)
-    token_backend = FileSystemTokenBackend(token_path=".", token_filename="o365_token.txt")
-    account = Account(credentials, auth_flow_type="authorization", token_backend=token_backend, tenant_id=TENANT_ID)
-    if not account.is_authenticated:
-        account.authenticate(scopes=['basic', 'message_all'])
+        inbox_delta, junk_delta = state_f.result()
+        inbox_folder = inbox_f.result()
+        junk_folder = junk_f.result()
 
-mailbox = account.mailbox(resource=EMAIL_TO_WATCH)
-inbox_folder = mailbox.inbox_folder()
-junk_folder = mailbox.junk_folder()
+    return inbox_delta, junk_delta, timings
 
 
 
@@ -95,16 +171,12 @@ def save_last_delta(inbox_token, junk_token):
     # Create the full, correct path for saving
     inbox_token_path = os.path.join(BASE_DIR, "delta_token_inbox.txt")
     junk_token_path = os.path.join(BASE_DIR, "delta_token_junk.txt")
-    print("Made it", inbox_token)
 
     try:
-        print("second")
         # CHECK if a valid token was passed in
         if inbox_token:
-            print("third")
             # OPEN the correct full path
             with open(inbox_token_path, "w") as f:
-                print("CHIECKEN")
                 f.write(inbox_token)
         
         # CHECK if a valid token was passed in
@@ -114,7 +186,57 @@ def save_last_delta(inbox_token, junk_token):
                 f.write(junk_token)
 
     except IOError as e:
-        print(f"⚠️ CRITICAL: Could not save delta token to file! Error: {e}")
+        log.error("⚠️ CRITICAL: Could not save delta token to file! Error: %s", e)
+
+
+# When each folder was last fully caught up (its delta loop reached a new
+# deltaLink). If a delta token expires, the fresh sync starts from here
+# instead of from START_TIME. Kept in memory; the file is read once and
+# rewritten at most once per poll cycle, only when a checkpoint moved.
+CHECKPOINT_PATH = os.path.join(BASE_DIR, "delta_checkpoints.json")
+RESYNC_MARGIN = timedelta(minutes=15)  # overlap, so nothing at the boundary is missed
+
+_checkpoints = None  # folder name -> ISO time, loaded on first use
+_checkpoints_dirty = False
+
+def _checkpoint_cache():
+    global _checkpoints
+    if _checkpoints is None:
+        try:
+            with open(CHECKPOINT_PATH, "r") as f:
+                _checkpoints = json.load(f)
+        except (FileNotFoundError, ValueError):
+            _checkpoints = {}
+    return _checkpoints
+
+
+def load_checkpoint(name):
+    try:
+        return datetime.fromisoformat(_checkpoint_cache()[name])
+    except (KeyError, ValueError):
+        return None
+
+
+def save_checkpoint(name, when):
+    """Move a folder's checkpoint; flush_checkpoints() persists it."""
+    global _checkpoints_dirty
+    _checkpoint_cache()[name] = when.isoformat()
+    _checkpoints_dirty = True
+
+
+def flush_checkpoints():
+    """Write the checkpoints if any moved, atomically (temp file + rename)."""
+    global _checkpoints_dirty
+    if not _checkpoints_dirty:
+        return
+    tmp_path = CHECKPOINT_PATH + ".tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(_checkpoints, f)
+        os.replace(tmp_path, CHECKPOINT_PATH)
+        _checkpoints_dirty = False
+    except OSError as e:
+        log.warning("Could not save the sync checkpoints: %s", e)
 
 
 #Passes the subject and body of the email to chat gpt, which figures out how to handle the email. 
@@ -220,7 +342,7 @@ def classify_email(subject, body):
 
 
     try:
-        response = client.chat.completions.create(
+        response = get_openai_client().chat.completions.create(
             model="gpt-4.1-mini",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.2,
@@ -232,27 +354,18 @@ def classify_email(subject, body):
         
         # Ensure we always return a dictionary
         if not isinstance(parsed_result, dict):
-            print(f"Warning: AI returned non-dict response: {type(parsed_result)}")
+            log.warning("AI returned non-dict response: %s", type(parsed_result))
             return {}
         return parsed_result
     except Exception as e:
-        print(f"Classification error: {e}")
+        log.error("Classification error: %s", e)
         return {}
 
 
-def process_folder(folder, name, delta_token_url):
-    """
-    Uses the Microsoft Graph /delta endpoint directly so we can:
-      1) Page through all changes (via @odata.nextLink)
-      2) Capture and return the final @odata.deltaLink
-
-    `delta_token_url` should be either:
-      - None (first run), or
-      - The FULL @odata.deltaLink URL from a previous run (store it as-is).
-    """
+def initial_delta_request(folder, since):
+    """(url, params) for a fresh delta query on `folder` covering mail received since `since`."""
     import urllib.parse
 
-    # --- Build the initial delta URL ---
     # Prefer the account's protocol base if available; fall back to the standard Graph URL.
     try:
         base_url = getattr(account.protocol, "service_url", None)
@@ -263,26 +376,88 @@ def process_folder(folder, name, delta_token_url):
     except Exception:
         base_url = "https://graph.microsoft.com/v1.0"
 
+    # /users/{user}/mailFolders/{folder_id}/messages/delta
+    folder_id = getattr(folder, 'object_id', None) or getattr(folder, 'folder_id', None) or getattr(folder, 'id', None)
+    user_part = urllib.parse.quote(EMAIL_TO_WATCH)
+    url = f"{base_url}/users/{user_part}/mailFolders/{folder_id}/messages/delta"
+    # Select lean fields (Graph uses camelCase field names)
+    params = {
+        "$select": "id,conversationId,isRead,receivedDateTime,from,sender,subject,categories,uniqueBody,body",
+        "$top": "50",
+    }
+    if since:
+        params["$filter"] = f"receivedDateTime ge {since.isoformat()}"
+    return url, params
+
+
+def resync_since(name):
+    """Lower bound for a fresh sync of a folder: its last checkpoint (minus a margin), else START_TIME."""
+    checkpoint = load_checkpoint(name)
+    if checkpoint is None:
+        return START_TIME
+    return max(checkpoint - RESYNC_MARGIN, START_TIME)
+
+
+def delta_get(conn, url, params):
+    """GET a delta page; an HTTP error comes back as its response instead of raising."""
+    try:
+        return conn.get(url, params=params) if params else conn.get(url)
+    except Exception as e:
+        if getattr(e, "response", None) is None:
+            raise
+        return e.response
+
+
+SYNC_STATE_ERRORS = {"syncstatenotfound", "resyncrequired", "syncstateinvalid"}
+
+def sync_state_expired(resp):
+    """True if Graph says the delta token can no longer be used."""
+    if resp is None or resp.status_code // 100 == 2:
+        return False
+    if resp.status_code == 410:
+        return True
+    try:
+        code = (resp.json().get("error") or {}).get("code", "")
+    except ValueError:
+        return False
+    return code.lower() in SYNC_STATE_ERRORS
+
+
+def already_handled(item):
+    """
+    A raw delta item that needs no work: removed from the folder, already
+    tagged PAIRActioned, or already waiting for approval / forwarded by us.
+    """
+    if "@removed" in item:
+        return True
+    if any((c or "").startswith("PAIRActioned") for c in item.get("categories") or []):
+        return True
+    return item.get("id") in pending_emails or item.get("id") in forwarded_recipients
+
+
+def process_folder(folder, name, delta_token_url):
+    """
+    Uses the Microsoft Graph /delta endpoint directly so we can:
+      1) Page through all changes (via @odata.nextLink)
+      2) Capture and return the final @odata.deltaLink
+
+    `delta_token_url` should be either:
+      - None (first run), or
+      - The FULL @odata.deltaLink URL from a previous run (store it as-is).
+    """
+    sync_started = datetime.now(timezone.utc)
+
     if delta_token_url:
         next_url = delta_token_url  # resume from last delta link (FULL URL)
         params = None
     else:
-        # First sync: build a delta URL scoped to THIS folder
-        # /users/{user}/mailFolders/{folder_id}/messages/delta
-        folder_id = getattr(folder, 'object_id', None) or getattr(folder, 'folder_id', None) or getattr(folder, 'id', None)
-        user_part = urllib.parse.quote(EMAIL_TO_WATCH)
-        next_url = f"{base_url}/users/{user_part}/mailFolders/{folder_id}/messages/delta"
-        # Select lean fields (Graph uses camelCase field names)
-        params = {
-            "$select": "id,conversationId,isRead,receivedDateTime,from,sender,subject,categories,uniqueBody,body",
-            "$top": "50",
-        }
-        # Your START_TIME filter on first run
-        if START_TIME:
-            params["$filter"] = f"receivedDateTime ge {START_TIME.isoformat()}"
+        # First sync, or the token files were removed: start from the last
+        # checkpoint when there is one, START_TIME otherwise
+        next_url, params = initial_delta_request(folder, resync_since(name))
 
     final_delta_link = delta_token_url  # will be replaced when Graph returns a new one
     total_changed = 0
+    resynced = False
 
     try:
         # Use the O365 connection so auth headers/tokens are handled for us
@@ -290,20 +465,31 @@ def process_folder(folder, name, delta_token_url):
 
         # Accumulate changes page by page
         while next_url:
-            resp = conn.get(next_url, params=params) if params else conn.get(next_url)
+            resp = delta_get(conn, next_url, params)
+            if delta_token_url and not resynced and sync_state_expired(resp):
+                # The stored deltaLink is dead (410 / syncStateNotFound): start a
+                # fresh delta bounded to the gap since the last checkpoint
+                since = resync_since(name)
+                log.warning("[%s] delta token expired; resyncing changes since %s", name, since.isoformat())
+                next_url, params = initial_delta_request(folder, since)
+                delta_token_url = final_delta_link = None  # never hand the dead link back
+                resynced = True
+                continue
             if not resp or resp.status_code // 100 != 2:
-                print(f" Error accessing {name}: {getattr(resp, 'status_code', 'n/a')} {getattr(resp, 'text', '')}")
+                log.error("Error accessing %s: %s %s", name, getattr(resp, 'status_code', 'n/a'), getattr(resp, 'text', ''))
                 return delta_token_url or final_delta_link
 
             data = resp.json() or {}
             items = data.get("value", [])
 
-            # --- DIAGNOSTIC ---
-            print(f"DIAGNOSTIC [{name}]: Page returned {len(items)} item(s).")
+            log.debug("[%s] delta page returned %d item(s)", name, len(items))
 
             # Process each changed item exactly as before
             for item in items:
                 total_changed += 1
+                # Known from the item itself or local state: no fetch, no conversation walk
+                if already_handled(item):
+                    continue
                 # We intentionally re-fetch the message object via SDK for your existing logic
                 try:
                     msg = folder.get_message(object_id=item.get("id"))
@@ -330,12 +516,12 @@ def process_folder(folder, name, delta_token_url):
                             handle_internal_reply(msg)
                             continue
 
-                        body_to_analyze = get_clean_message_text(msg)
-                        print(f"\nNEW:  [{name}] {msg.received.strftime('%Y-%m-%d %H:%M')} | "
-                              f"{msg.sender.address if msg.sender else 'UNKNOWN'} | {msg.subject}")
+                        body_to_analyze = clean_message_text(msg)
+                        log.info("NEW:  [%s] %s | %s | %s", name, msg.received.strftime('%Y-%m-%d %H:%M'),
+                                 msg.sender.address if msg.sender else 'UNKNOWN', msg.subject)
                         result = classify_email(msg.subject, body_to_analyze)
                         if HUMAN_CHECK:
-                            print(json.dumps(result, indent=2))
+                            log.debug("Classification: %s", result.get("categories"), extra={"classification": result})
                             email_id = msg.object_id
                             if email_id not in pending_emails:
                                 pending_emails[email_id] = {
@@ -346,13 +532,13 @@ def process_folder(folder, name, delta_token_url):
                                     "received": msg.received.strftime('%Y-%m-%d %H:%M'),
                                     "message_obj": msg,
                                 }
-                                print(f"📧 Email stored for approval: {msg.subject}")
+                                log.info("📧 Email stored for approval: %s", msg.subject)
                                 # Tag immediately when enqueued for approval
-                                tag_email(msg, ["pending_review"], replyTag=False)
+                                update_message_state(msg, add={PENDING_TAG})
                             else:
-                                print(f"⏭️  Email already in pending queue, skipping: {msg.subject}")
+                                log.debug("⏭️ Email already in pending queue, skipping: %s", msg.subject)
                         else:
-                            print(json.dumps(result, indent=2))
+                            log.debug("Classification: %s", result.get("categories"), extra={"classification": result})
                             handle_new_email(msg, result)
                     continue  # done with this delta item
 
@@ -360,7 +546,7 @@ def process_folder(folder, name, delta_token_url):
                 try:
                     unread_msgs = unread_in_conversation(folder, mailbox, conv_id)
                 except Exception as e:
-                    print(f"   Could not fetch unread children for {conv_id}: {e}")
+                    log.warning("Could not fetch unread children for %s: %s", conv_id, e)
                     continue
 
                 if not unread_msgs:
@@ -381,11 +567,11 @@ def process_folder(folder, name, delta_token_url):
                         handle_internal_reply(child)
                         continue
 
-                    body_to_analyze = get_clean_message_text(child)
-                    print(f"\nNEW:  [{name}] {child.received.strftime('%Y-%m-%d %H:%M')} | "
-                          f"{child.sender.address if child.sender else 'UNKNOWN'} | {child.subject}")
+                    body_to_analyze = clean_message_text(child)
+                    log.info("NEW:  [%s] %s | %s | %s", name, child.received.strftime('%Y-%m-%d %H:%M'),
+                             child.sender.address if child.sender else 'UNKNOWN', child.subject)
                     result = classify_email(child.subject, body_to_analyze)
-                    print(json.dumps(result, indent=2))
+                    log.debug("Classification: %s", result.get("categories"), extra={"classification": result})
 
                     if HUMAN_CHECK:
                         email_id = child.object_id
@@ -398,11 +584,11 @@ def process_folder(folder, name, delta_token_url):
                                 "received": child.received.strftime('%Y-%m-%d %H:%M'),
                                 "message_obj": child,
                             }
-                            print(f"📧 Email stored for approval: {child.subject}")
+                            log.info("📧 Email stored for approval: %s", child.subject)
                             # Tag immediately when enqueued for approval
-                            tag_email(child, ["pending_review"], replyTag=False)
+                            update_message_state(child, add={PENDING_TAG})
                         else:
-                            print(f"⏭️  Email already in pending queue, skipping: {child.subject}")
+                            log.debug("⏭️ Email already in pending queue, skipping: %s", child.subject)
                     else:
                         handle_new_email(child, result)
                 # ==== END: your existing per-item logic ====
@@ -413,14 +599,15 @@ def process_folder(folder, name, delta_token_url):
             if data.get("@odata.deltaLink"):
                 final_delta_link = data["@odata.deltaLink"]
 
-        # --- DIAGNOSTIC SUMMARY ---
-        print(f"DIAGNOSTIC [{name}]: Processed {total_changed} changed item(s). Final delta: {bool(final_delta_link)}")
+        log.debug("[%s] processed %d changed item(s), final delta: %s", name, total_changed, bool(final_delta_link))
+        if final_delta_link and final_delta_link != delta_token_url:
+            save_checkpoint(name, sync_started)
 
         # Return the FULL delta URL to persist (use as-is next time)
         return final_delta_link or delta_token_url
 
     except Exception as e:
-        print(f" Error accessing {name}: {e}")
+        log.error("Error accessing %s: %s", name, e)
         return delta_token_url or final_delta_link
 
 
@@ -428,38 +615,74 @@ def handle_new_email(msg, result):
     """
     Takes a message and its AI classification result, then acts on it.
     It does NOT call the AI again.
+
+    However many categories the message has, the routing plan gives one
+    categories + read-state PATCH, at most one reply (the first route in
+    email_routes.json with one), one forward to every recipient and one move,
+    which goes last.
     """
-    clear_pending_tag(msg)
-    categories = result.get("categories", [])
-    recipients_set = set(result.get("all_recipients", []))
-    name_sender = result.get("name_sender")
-    
-    # We pass the message and its categories to be tagged
-    tag_email(msg, categories, replyTag=False)
-    # We use the results to perform specific actions
-    handle_emails(categories, result, recipients_set, msg, name_sender)
-
-    if recipients_set:
-        fwd = msg.forward()
-        recipients_list = list(recipients_set)
-        fwd.to.add(recipients_list)
-        
+    plan = router.table.plan(result)
+
+    # Final tags (pending-review marker swapped for the category tags) and
+    # read state in one PATCH
+    update_message_state(msg, add=actioned_tags(plan.categories, replyTag=False), remove={PENDING_TAG},
+                         read=True if plan.mark_read else None)
+
+    if plan.reply:
+        send_reply(msg, plan.reply.replace("{greeting}", get_time_based_greeting(result.get("name_sender"))))
+
+    if plan.forward:
         # Store recipients for later CC functionality
-        forwarded_recipients[msg.object_id] = recipients_list
-        
+        forwarded_recipients[msg.object_id] = plan.forward
+
         # Add the hidden tracking ID into the top of the forwarded body
         instruction_html = f"""<div style="display:none;">{REPLY_ID_TAG}{msg.object_id}</div>"""
-        
-        # Prepend to the auto-generated forward body
-        fwd.body = "Please press 'Reply All,' and reply to info@mlfa.org. You're email will automatically be sent to the correct person. " + instruction_html
-        fwd.body_type = 'HTML'
-        
-        # Send the forward
-        fwd.send()
+
+        # One POST: the comment goes above the quoted original
+        send_forward(msg, plan.forward,
+                     "Please press 'Reply All,' and reply to info@mlfa.org. You're email will automatically be sent to the correct person. " + instruction_html)
+
+    if plan.move:
+        move_to_folder(msg, plan.move)
+
+
+def move_to_folder(msg, folders):
+    """
+    Move `msg` to the first of `folders` that exists. A name is a path below
+    the inbox, "/"-separated for nested folders ("Irrelevant/Spam").
+    """
+    inbox = mailbox.inbox_folder()
+    for path in folders:
+        try:
+            target = inbox
+            for folder_name in path.split("/"):
+                target = target.get_folder(folder_name=folder_name)
+        except Exception:
+            target = None
+        if target:
+            log.info("Moving to %s folder.", path)
+            return msg.move(target)
+    log.warning("⚠️ Could not move %s: none of the folders %s exist", msg.subject, folders)
+    return False
+
+
+def send_reply(msg, comment, to_all=False):
+    """
+    Reply in a single POST to Graph's /reply (or /replyAll): `comment` (HTML)
+    goes above the quoted original. No draft is created or updated. Use
+    msg.reply() + send() only when attachments or a replaced body are needed.
+    """
+    url = msg.build_url(f"/messages/{msg.object_id}/{'replyAll' if to_all else 'reply'}")
+    return bool(msg.con.post(url, data={"comment": comment}))
 
 
-    if not set(categories).issubset(NONREAD_CATEGORIES):
-        mark_as_read(msg)
+def send_forward(msg, to, comment):
+    """Forward in a single POST to Graph's /forward, recipients and comment included; the original stays quoted."""
+    url = msg.build_url(f"/messages/{msg.object_id}/forward")
+    return bool(msg.con.post(url, data={
+        "comment": comment,
+        "toRecipients": [{"emailAddress": {"address": address}} for address in to],
+    }))
 
 
 def get_time_based_greeting(name_sender):
@@ -478,221 +701,9 @@ def get_time_based_greeting(name_sender):
     else:
         return "Good morning,"  # Default to good morning for late night/early morning
 
-def handle_emails(categories, result, recipients_set, msg, name_sender): 
-    for category in categories:
-        if category == "legal":
-            reply_message = msg.reply(to_all=False)
-            # Check if this email needs a personal reply based on classification
-            needs_personal = result.get("needs_personal_reply", False)
-            greeting = get_time_based_greeting(name_sender)
-
-            if needs_personal:
-                reply_message.body = f"""
-                    <p>{greeting}</p>
-
-                    <p>Thank you for contacting the Muslim Legal Fund of America (MLFA). 
-                    We are grateful that you reached out and placed your trust in us to potentially support your legal matter.</p>
-
-                    <p>If you have not already done so, please submit a formal application for legal assistance through our website:<br>
-                    <a href="https://mlfa.org/application-for-legal-assistance/">https://mlfa.org/application-for-legal-assistance/</a></p>
-
-                    <p>Once submitted, our team will carefully review your application and follow up with next steps. 
-                    If you have any questions about the application process or need help completing it, please don't hesitate to reach out.</p>
-
-                    <p>We appreciate your patience as we work through applications, and we look forward to learning more about how we might be able to help.</p>
-
-                    <p>Warm regards,<br>
-                    The MLFA Team<br>
-                    Muslim Legal Fund of America</p>
-                """
-
-                reply_message.body_type = "HTML"
-            else:
-                reply_message.body = f"""
-                    <p>{greeting}</p>
-
-                    <p>Thank you for contacting the Muslim Legal Fund of America (MLFA).</p>
-
-                    <p>If you have not already done so, please submit a formal application for legal assistance 
-                    through our website:<br>
-                    <a href="https://mlfa.org/application-for-legal-assistance/">https://mlfa.org/application-for-legal-assistance/</a></p>
-
-                    <p>This ensures our legal team has the information needed to review your case promptly.</p>
-
-                    <p>Sincerely,<br>
-                    The MLFA Team</p>
-                """
-
-                reply_message.body_type = "HTML"
-            reply_message.send()
-            
-            # Move to Apply for help folder
-            inbox = mailbox.inbox_folder()
-            try:
-                apply_folder = inbox.get_folder(folder_name="Apply for help")
-                print("Moving to Apply for help folder.")
-                msg.move(apply_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to Apply for help folder: {e}")
-
-        elif category == "donor":
-            recipients_set.update([f"{EMAILS_TO_FORWARD[0]}", f"{EMAILS_TO_FORWARD[1]}"])
-            # Move to Doner_Related folder
-            inbox = mailbox.inbox_folder()
-            try:
-                donor_folder = inbox.get_folder(folder_name="Doner_Related")
-                print("Moving to Doner_Related folder.")
-                msg.move(donor_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to Doner_Related folder: {e}")
-
-        elif category == "sponsorship":
-            recipients_set.update([f"{EMAILS_TO_FORWARD[2]}", f"{EMAILS_TO_FORWARD[3]}"])
-
-        elif category == "organizational":
-            recipients_set.update([f"{EMAILS_TO_FORWARD[2]}", f"{EMAILS_TO_FORWARD[3]}"])
-            # Move to Organizational inquiries folder
-            inbox = mailbox.inbox_folder()
-            try:
-                org_folder = inbox.get_folder(folder_name="Organizational inquiries")
-                print("Moving to Organizational inquiries folder.")
-                msg.move(org_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to Organizational inquiries folder: {e}")
-
-        elif category == "volunteer":
-            # Send automated reply with volunteer application form instead of forwarding
-            reply_message = msg.reply(to_all=False)
-            greeting = get_time_based_greeting(name_sender)
-            
-            reply_message.body = f"""
-                <p>{greeting}</p>
-
-                <p>Thank you for your interest in volunteering with the Muslim Legal Fund of America (MLFA)!</p>
-
-                <p>We are grateful for your willingness to support our mission of providing legal assistance to Muslims in need. To get started with the volunteer process, please complete our volunteer application form:</p>
 
-                <p><a href="https://forms.office.com/Pages/ResponsePage.aspx?id=oiB_iSDzkUu20kpWPbd_DnxSOj2KmWxOomg5Rm0KtBNUMElYQkdOQUU2WUxLTlNHMkY4S0tFOU1XViQlQCN0PWcu">MLFA Volunteer Application Form</a></p>
-
-                <p>Once you submit the form, our team will review your application and follow up with next steps about volunteer opportunities that match your skills and interests.</p>
-
-                <p>Thank you again for your support!</p>
-
-                <p>Best regards,<br>
-                The MLFA Team<br>
-                Muslim Legal Fund of America</p>
-            """
-            
-            reply_message.body_type = "HTML"
-            reply_message.send()
-            
-            # Move to Volunteer folder
-            inbox = mailbox.inbox_folder()
-            try:
-                volunteer_folder = inbox.get_folder(folder_name="Volunteer")
-                print("Moving to Volunteer folder.")
-                msg.move(volunteer_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to Volunteer folder: {e}")
-
-        elif category == "internship":
-            recipients_set.update([f"{EMAILS_TO_FORWARD[5]}"])
-            # Move to Internship folder
-            inbox = mailbox.inbox_folder()
-            try:
-                internship_folder = inbox.get_folder(folder_name="Internship")
-                print("Moving to Internship folder.")
-                msg.move(internship_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to Internship folder: {e}")
-
-        elif category == "job_application":
-            recipients_set.update([f"{EMAILS_TO_FORWARD[6]}"])
-            # Move to Job_Application folder
-            inbox = mailbox.inbox_folder()
-            try:
-                job_folder = inbox.get_folder(folder_name="Job_Application")
-                print("Moving to Job_Application folder.")
-                msg.move(job_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to Job_Application folder: {e}")
-
-        elif category == "fellowship":
-            recipients_set.update([f"{EMAILS_TO_FORWARD[5]}"])
-            # Move to Fellowship folder
-            inbox = mailbox.inbox_folder()
-            try:
-                fellowship_folder = inbox.get_folder(folder_name="Fellowship")
-                print("Moving to Fellowship folder.")
-                msg.move(fellowship_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to Fellowship folder: {e}")
-            
-        elif category == "media":
-            recipients_set.update([f"{EMAILS_TO_FORWARD[7]}"])  # Marium.Uddin@mlfa.org
-            # Move to Media folder
-            inbox = mailbox.inbox_folder()
-            try:
-                media_folder = inbox.get_folder(folder_name="Media")
-                print("Moving to Media folder.")
-                msg.move(media_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to Media folder: {e}")
-
-        elif category == "marketing":
-            inbox = mailbox.inbox_folder()
-            try:
-                sales_folder = inbox.get_folder(folder_name="Sales emails")
-                print("Moving to Sales emails folder.")
-                msg.move(sales_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to Sales emails folder: {e}")
-        
-        elif category == "cold_outreach":
-            inbox = mailbox.inbox_folder()
-            try:
-                irrelevant_folder = inbox.get_folder(folder_name="Irrelevant")
-                cold_outreach_folder = irrelevant_folder.get_folder(folder_name="Cold_Outreach")
-                print("Moving to Irrelevant/Cold_Outreach folder.")
-                msg.move(cold_outreach_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to Irrelevant/Cold_Outreach folder: {e}")
-        
-        elif category == "spam":
-            inbox = mailbox.inbox_folder()
-            try:
-                irrelevant_folder = inbox.get_folder(folder_name="Irrelevant")
-                spam_folder = irrelevant_folder.get_folder(folder_name="Spam")
-                print("Moving to Irrelevant/Spam folder.")
-                msg.move(spam_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to Irrelevant/Spam folder: {e}")
-        
-        elif category == "newsletter":
-            inbox = mailbox.inbox_folder()
-            try:
-                for_reference_folder = inbox.get_folder(folder_name="For reference")
-                newsletter_folder = for_reference_folder.get_folder(folder_name="subscriptions and newsletters")
-                print("Moving to For reference/subscriptions and newsletters folder.")
-                msg.move(newsletter_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to For reference/subscriptions and newsletters folder: {e}")
-        
-        elif category == "irrelevant_other":
-            inbox = mailbox.inbox_folder()
-            try:
-                irrelevant_folder = inbox.get_folder(folder_name="Irrelevant")
-                other_folder = irrelevant_folder.get_folder(folder_name="Other")
-                print("Moving to Irrelevant/Other folder.")
-                msg.move(other_folder)
-            except Exception as e:
-                print(f"⚠️ Could not move to Irrelevant/Other folder: {e}")
-
-def tag_email(msg, categories, replyTag):
-    # 1) Load existing categories safely
-    existing = set((msg.categories or []))
-
-    # 2) Build new tags for this operation
+def actioned_tags(categories, replyTag):
+    """The PAIRActioned categories that mark a message as handled for `categories`."""
     new_tags = set()
     for c in categories or []:
         c = (c or "").strip()
@@ -708,51 +719,66 @@ def tag_email(msg, categories, replyTag):
 
     # Always keep the umbrella marker
     new_tags.add("PAIRActioned")
+    return new_tags
+
 
-    # 3) Merge (union) — do NOT drop existing tags
-    merged = existing.union(new_tags)
+def update_message_state(msg, add=(), remove=(), read=None):
+    """
+    Bring a message's categories and read flag to their final state in one
+    PATCH: existing categories are kept (never dropped unless in `remove`),
+    `add` is merged in, and isRead is set when `read` is not None. Sends
+    nothing when the message already looks like that.
+    """
+    existing = set(msg.categories or [])
+    final = (existing | set(add)) - set(remove)
+    changed = False
+    if final != existing:
+        msg.categories = sorted(final)
+        changed = True
+    if read is not None and bool(msg.is_read) != read:
+        msg.is_read = read
+        changed = True
+    if not changed:
+        return True
+    try:
+        return msg.save_message()  # PATCHes only the tracked fields: categories and/or isRead
+    except Exception as e:
+        log.warning("Could not update categories/read state of %s: %s", msg.subject, e)
+        return False
 
-    # 4) Save only if there’s a change
-    if merged != existing:
-        msg.categories = sorted(merged)
-        msg.save_message()
 
-def clear_pending_tag(msg): 
-    try: 
-        cats = set(msg.categories or [])
-        msg.categories = sorted(cats)
-        msg.save_message()
-        print("removed the tag")
-    except Exception as e: 
-        print("could not remove the tag'")
+def tag_email(msg, categories, replyTag):
+    return update_message_state(msg, add=actioned_tags(categories, replyTag))
+
 
 def mark_as_read(msg): 
-    print("   Marking email as read...")
     try:
         msg.mark_as_read()
-        print("   Marked as read")
+        log.debug("Marked as read: %s", msg.subject)
     except Exception as e:
-        print(f"    Could not mark as read: {e}")
+        log.warning("Could not mark as read: %s", e)
 
 def handle_internal_reply(msg): 
-    print(f"\nREPLY DETECTED: From {msg.sender.address} | {msg.subject}")
+    log.info("REPLY DETECTED: From %s | %s", msg.sender.address, msg.subject)
     body_parts = msg.body.split(REPLY_ID_TAG)
     if len(body_parts) < 2:
-        print(" ERROR: Could not find the reply id, therefore, we cannot reply. ")
+        log.error("Could not find the reply id, therefore, we cannot reply.")
         return
 
+    from bs4 import BeautifulSoup
+
     html_chunk = body_parts[0]
     soup = BeautifulSoup(html_chunk, 'html.parser')
     reply_content = str(soup)
 
     if not reply_content: 
-        print("   WARNING: Reply appears to be empty. Not sending. ")
+        log.warning("Reply appears to be empty. Not sending.")
         #We need to maybe re-email the person who wrote the reply to the forwarded email to try again. 
         return
 
     match = re.search(f"{REPLY_ID_TAG}(.+?)</", msg.body)
     if not match: 
-        print("   ERROR: Could not find the original message ID.")
+        log.error("Could not find the original message ID.")
         return
     original_message_id = match.group(1).strip()
     
@@ -765,7 +791,7 @@ def handle_internal_reply(msg):
         if original_message_id in forwarded_recipients:
             all_recipients = forwarded_recipients[original_message_id]
             other_forwardees = [email for email in all_recipients if email.lower() != sender_email]
-            print(f"   Found recipients: {all_recipients}, will CC: {other_forwardees}")
+            log.debug("Found recipients: %s, will CC: %s", all_recipients, other_forwardees)
         
         # Create the reply
         final_reply = original_msg.reply(to_all=False)
@@ -776,17 +802,17 @@ def handle_internal_reply(msg):
         if other_forwardees:
             for cc_email in other_forwardees:
                 final_reply.cc.add(cc_email)
-            print(f"   Sent reply to original sender: {original_msg.sender.address}, CC'd: {other_forwardees}")
+            log.info("Sent reply to original sender: %s, CC'd: %s", original_msg.sender.address, other_forwardees)
         else:
-            print(f"   Sent reply to original sender: {original_msg.sender.address}")
+            log.info("Sent reply to original sender: %s", original_msg.sender.address)
         
         final_reply.send()
     except Exception as e:
-        print(f"   ERROR: Could not send final reply. Error: {e}")
+        log.error("Could not send final reply: %s", e)
         return
 
     msg.mark_as_read()
-    print("   Cleanup complete. Reply process finished.")
+    log.debug("Reply process finished.")
 
 
 def newest_unread_in_conversation(folder, mailbox, conversation_id):
@@ -849,132 +875,92 @@ def unread_in_conversation(folder, mailbox, conversation_id, page_limit=30):
         except: pass
     return unread
 
-def get_clean_message_text(msg):
-    """
-    Return only the reply content for this message.
-    Prefer Graph's unique_body (just the new text),
-    otherwise strip quoted history from the full body.
-    """
-    QUOTE_SEPARATORS = [
-        r'^\s*On .* wrote:\s*$',              
-        r'^\s*From:\s.*$',                    
-        r'^\s*-----Original Message-----\s*$',
-        r'^\s*De:\s.*$',                      
-        r'^\s*Sent:\s.*$',
-        r'^\s*To:\s.*$',
-    ]
-
-    def strip_quoted_reply(html_or_text: str) -> str:
-        if not html_or_text:
-            return ""
-        text = html_or_text
-        try:
-            from bs4 import BeautifulSoup
-            soup = BeautifulSoup(html_or_text, 'html.parser')
-            for sel in [
-                'blockquote',
-                'div.gmail_quote',
-                'div[type=cite]',
-                'div.moz-cite-prefix',
-                'div.OutlookMessageHeader',
-            ]:
-                for node in soup.select(sel):
-                    node.decompose()
-            text = soup.get_text("\n")
-        except Exception:
-            pass
-
-        import re
-        lines = [ln.rstrip() for ln in text.splitlines()]
-        out = []
-        for ln in lines:
-            if ln.strip().startswith('>'):
-                break
-            if any(re.match(pat, ln, flags=re.IGNORECASE) for pat in QUOTE_SEPARATORS):
-                break
-            out.append(ln)
-
-        return "\n".join(out).strip()[:8000]
-
-    body = getattr(msg, 'unique_body', None) or getattr(msg, 'body', None) or ""
-    return strip_quoted_reply(body)
-
-
-
-inbox_delta, junk_delta = load_last_delta()
-
-# Import and initialize the web interface
-from web_interface import app, create_email_routes, start_web_server
-
-# Initialize the email routes with the required dependencies
-create_email_routes(pending_emails, handle_new_email, mailbox, mark_as_read)
-
-# Start the web server
-start_web_server()
-print(f"Monitoring inbox + junk for: {EMAIL_TO_WATCH} … Ctrl-C to stop.")
-print(f"📧 Approval hub available at: http://localhost:5000")
 
 def reconnect_account():
-    """Re-authenticate and reconnect to mailbox"""
+    """
+    Last resort when refreshing the token in place did not help: rebuild the
+    Account, mailbox and folders from scratch.
+    """
     global account, mailbox, inbox_folder, junk_folder
     
-    print("🔄 Re-authenticating with Microsoft Graph API...")
+    log.info("🔄 Re-authenticating with Microsoft Graph API...")
     try:
         # Re-authenticate with fresh token
-        if IS_PRODUCTION and CLIENT_SECRET:
-            credentials = (CLIENT_ID, CLIENT_SECRET)
-            account = Account(credentials, auth_flow_type="credentials", tenant_id=TENANT_ID)
-            account.authenticate()  # Force new authentication
-        else:
-            credentials = (CLIENT_ID, None)
-            token_backend = FileSystemTokenBackend(token_path=".", token_filename="o365_token.txt")
-            account = Account(credentials, auth_flow_type="authorization", token_backend=token_backend, tenant_id=TENANT_ID)
-            account.authenticate(scopes=['basic', 'message_all'])
+        account = connect_account(force=True)
         
         # Reconnect to mailbox
         mailbox = account.mailbox(resource=EMAIL_TO_WATCH)
         inbox_folder = mailbox.inbox_folder()
         junk_folder = mailbox.junk_folder()
-        
-        print("✅ Successfully re-authenticated!")
+        token_refresher.connection = account.connection
+
+        log.info("✅ Successfully re-authenticated!")
         return True
     except Exception as e:
-        print(f"❌ Re-authentication failed: {e}")
+        log.error("❌ Re-authentication failed: %s", e)
         return False
 
-consecutive_errors = 0
-last_successful_check = time.time()
 
-while True:
-    try:
-        print(f"🔄 Checking for new emails... (Pending: {len(pending_emails)})")
-        
-        # Check if it's been too long since last successful check (1 hour)
-        if time.time() - last_successful_check > 3600:
-            print("⚠️ No successful checks in 1 hour, forcing re-authentication...")
-            reconnect_account()
-        
-        inbox_delta = process_folder(inbox_folder, "INBOX", inbox_delta)
-        junk_delta = process_folder(junk_folder, "JUNK", junk_delta)
-        print(f"DEBUG: Current directory is: {os.getcwd()}")
-        #gets the new delta tokens and then saves them,
-        save_last_delta(inbox_delta, junk_delta)
-        
-        # Reset error counter on success
-        consecutive_errors = 0
-        last_successful_check = time.time()
-        
-    except Exception as e:
-        consecutive_errors += 1
-        print(f"❌ Error in main loop (attempt {consecutive_errors}): {e}")
+token_refresher = None  # set by main()
+router = None  # set by main()
+
+
+def main():
+    global token_refresher, router
+    load_dotenv()  # LOG_LEVEL / LOG_LEVELS / LOG_FORMAT may come from .env
+    setup_logging()
+    started = time.perf_counter()
+    load_config()
+    router = Router(REPLY_ID_TAG, path=ROUTES_PATH)
+    inbox_delta, junk_delta, timings = warm_up()
+    token_refresher = TokenRefresher(account.connection)
+    token_refresher.start()
+
+    # Import and initialize the web interface
+    from web_interface import app, create_email_routes, start_web_server
+
+    # Initialize the email routes with the required dependencies
+    create_email_routes(pending_emails, handle_new_email, mailbox, mark_as_read)
+
+    # Start the web server
+    start_web_server()
+    steps = ", ".join(f"{name} {secs:.2f}s" for name, secs in sorted(timings.items()))
+    log.info("🚀 Ready in %.2fs (%s)", time.perf_counter() - started, steps)
+    log.info("Monitoring inbox + junk for: %s … Ctrl-C to stop.", EMAIL_TO_WATCH)
+    log.info("📧 Approval hub available at: http://localhost:5000")
+
+    consecutive_errors = 0
+
+    while True:
+        try:
+            log.debug("🔄 Checking for new emails... (Pending: %d)", len(pending_emails))
+            
+            router.reload_if_changed()
+            inbox_delta = process_folder(inbox_folder, "INBOX", inbox_delta)
+            junk_delta = process_folder(junk_folder, "JUNK", junk_delta)
+            #gets the new delta tokens and then saves them,
+            save_last_delta(inbox_delta, junk_delta)
+            flush_checkpoints()
+            
+            # Reset error counter on success
+            consecutive_errors = 0
+            
+        except Exception as e:
+            consecutive_errors += 1
+            log.error("❌ Error in main loop (attempt %d): %s", consecutive_errors, e)
+            
+            # If we get 3 errors in a row, refresh the token in place; rebuild
+            # the whole account only if that does not work
+            if consecutive_errors >= 3:
+                log.warning("⚠️ Multiple consecutive errors detected, refreshing the access token...")
+                if token_refresher.refresh() or reconnect_account():
+                    consecutive_errors = 0
+                else:
+                    log.warning("😴 Waiting 60 seconds before retry...")
+                    time.sleep(60)
         
-        # If we get 3 errors in a row, try to re-authenticate
-        if consecutive_errors >= 3:
-            print("⚠️ Multiple consecutive errors detected, attempting to reconnect...")
-            if reconnect_account():
-                consecutive_errors = 0
-            else:
-                print("😴 Waiting 60 seconds before retry...")
-                time.sleep(60)
-    
-    time.sleep(10)
+        time.sleep(10)
+
+
+if __name__ == "__main__":
+    main()
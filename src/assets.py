@@ -0,0 +1,115 @@
+"""
+Versioned, precompressed static assets for the approval hub.
+
+At startup every file in static/ is read once, content-hashed and compressed
+with gzip (and brotli, if the optional `brotli` package is installed). Files
+are served under a hashed URL (/static/hub.<hash>.js) with a one-year
+immutable Cache-Control, so browsers fetch each version exactly once. The hub
+page itself references the plain names (/static/hub.js); render_page()
+rewrites them to the hashed URLs, and the page is served with no-cache plus a
+content-hash ETag so a deploy is picked up on the next load.
+"""
+import gzip
+import hashlib
+import os
+import re
+
+try:
+    import brotli
+except ImportError:  # optional: gzip alone is fine
+    brotli = None
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+CONTENT_TYPES = {
+    ".css": "text/css; charset=utf-8",
+    ".js": "text/javascript; charset=utf-8",
+    ".html": "text/html; charset=utf-8",
+    ".svg": "image/svg+xml",
+    ".png": "image/png",
+    ".ico": "image/x-icon",
+}
+COMPRESSIBLE = {".css", ".js", ".html", ".svg"}
+MIN_COMPRESS_SIZE = 1024  # below this the headers outweigh the saving
+
+
+class Asset:
+    """One file's bytes in every encoding we serve, plus its content hash."""
+
+    def __init__(self, data, content_type, compress=True):
+        self.content_type = content_type
+        self.digest = hashlib.sha256(data).hexdigest()[:12]
+        self.etag = f'"{self.digest}"'
+        self.encodings = {"identity": data}
+        if compress and len(data) >= MIN_COMPRESS_SIZE:
+            self.encodings["gzip"] = gzip.compress(data, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.encodings["br"] = brotli.compress(data, quality=11)
+
+    def pick(self, accept_encoding):
+        """(encoding, bytes) for the client's Accept-Encoding; brotli preferred."""
+        accepted = accepts(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding in accepted and encoding in self.encodings:
+                return encoding, self.encodings[encoding]
+        return "identity", self.encodings["identity"]
+
+
+def accepts(accept_encoding):
+    """Encodings named in an Accept-Encoding header (ignoring q=0)."""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.partition(";")
+        name, params = name.strip().lower(), params.replace(" ", "")
+        try:
+            q = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            q = 1.0
+        if name and q > 0:
+            accepted.add(name)
+    return accepted
+
+
+class AssetBundle:
+    """All files of a static directory, loaded once and addressed by hashed name."""
+
+    def __init__(self, directory, url_prefix="/static/"):
+        self.url_prefix = url_prefix
+        self.by_name = {}     # "hub.js" -> Asset
+        self.by_hashed = {}   # "hub.3f2a9c1b04de.js" -> Asset
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not os.path.isfile(path):
+                continue
+            stem, ext = os.path.splitext(name)
+            with open(path, "rb") as f:
+                asset = Asset(f.read(), CONTENT_TYPES.get(ext, "application/octet-stream"), ext in COMPRESSIBLE)
+            self.by_name[name] = asset
+            self.by_hashed[f"{stem}.{asset.digest}{ext}"] = asset
+
+    def url(self, name):
+        stem, ext = os.path.splitext(name)
+        return f"{self.url_prefix}{stem}.{self.by_name[name].digest}{ext}"
+
+    def render_page(self, path):
+        """Load an HTML page, point its /static/<name> references at the hashed URLs, and precompress it."""
+        with open(path, "r", encoding="utf-8") as f:
+            html = f.read()
+        prefix = re.escape(self.url_prefix)
+        html = re.sub(prefix + r"([\w.-]+)",
+                      lambda m: self.url(m.group(1)) if m.group(1) in self.by_name else m.group(0),
+                      html)
+        return Asset(html.encode("utf-8"), CONTENT_TYPES[".html"])
+
+
+def compress_body(data, accept_encoding):
+    """Compress a dynamic response body on the fly: (encoding, bytes), or (None, data) if not worth it."""
+    if len(data) < MIN_COMPRESS_SIZE:
+        return None, data
+    accepted = accepts(accept_encoding)
+    if "br" in accepted and brotli is not None:
+        return "br", brotli.compress(data, quality=4)  # low quality: fast enough per request
+    if "gzip" in accepted:
+        return "gzip", gzip.compress(data, compresslevel=5)
+    return None, data
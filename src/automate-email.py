@@ -1,16 +1,49 @@
-from O365 import Account, FileSystemTokenBackend
+import argparse
 from dotenv import load_dotenv
 from datetime import datetime, timezone, timedelta
-import os, time, openai, json
-import textwrap
+import os, time, json
+from urllib.parse import unquote
 import re
-from bs4 import BeautifulSoup
-from flask import Flask, jsonify, send_from_directory, request, session, render_template_string, redirect, url_for
-from flask_cors import CORS
+from concurrent.futures import ThreadPoolExecutor
 import threading
-
-
-load_dotenv()
+import logging
+from logs import setup_logging
+import metrics
+from pending import PendingEmail
+from cleaner import clean_message_text
+from routing import Router
+from echoes import EchoRegistry
+from hubstore import HubStore
+from outbox import Outbox, OutboxWorker
+from backfill import BackfillProgress, run_backfill
+from jobs import JobRunner
+from tokens import TokenRefresher
+
+# NOTE: nothing in this module authenticates, touches the network or reads state
+# files at import time. All of that happens in main() -> warm_up(), so the module
+# can be imported for testing/benchmarking. O365, openai and bs4 are imported
+# lazily where they are first needed.
+
+log = logging.getLogger("ingest")
+
+# --- Metrics (served by the hub's /metrics, see publish_metrics_forever) ---
+GRAPH_REQUESTS = metrics.Counter("mlfa_graph_requests_total", "Microsoft Graph HTTP requests",
+                                 ("method", "endpoint", "status"))
+GRAPH_SECONDS = metrics.Histogram("mlfa_graph_request_seconds", "Microsoft Graph request latency", ("endpoint",))
+DELTA_PAGES = metrics.Counter("mlfa_delta_pages_total", "Delta query pages fetched")
+DELTA_PAGE_ITEMS = metrics.Histogram("mlfa_delta_page_items", "Changed items per delta page",
+                                     buckets=(0, 1, 5, 10, 25, 50, 100, 250, 1000))
+LLM_SECONDS = metrics.Histogram("mlfa_llm_request_seconds", "Classification LLM call latency")
+LLM_TOKENS = metrics.Counter("mlfa_llm_tokens_total", "Tokens used by classification calls", ("kind",))
+LLM_ERRORS = metrics.Counter("mlfa_llm_errors_total", "Classification calls that failed or returned bad JSON")
+CLASSIFY_SKIPPED = metrics.Counter("mlfa_classification_skipped_total",
+                                   "Messages that did not need an LLM call", ("reason",))
+MESSAGES = metrics.Counter("mlfa_messages_total", "Messages classified, by what happened next", ("outcome",))
+POLL_SECONDS = metrics.Histogram("mlfa_poll_cycle_seconds", "Duration of one inbox + junk poll cycle")
+POLL_ERRORS = metrics.Counter("mlfa_poll_errors_total", "Folder polls that failed", ("folder",))
+DELTA_ECHOES = metrics.Counter("mlfa_delta_echoes_dropped_total", "Delta items that were our own changes coming back")
+OUTBOX_ACTIONS = metrics.Gauge("mlfa_outbox_actions", "Outbox actions by status", ("status",))
+LAST_SYNC = {}  # folder name -> time of the last delta poll that completed
 
 ### CONSTANTS
 
@@ -25,86 +58,128 @@ def load_processed_messages():
     except FileNotFoundError:
         return set()
 
+_processed_save_lock = threading.Lock()
+
 def save_processed_messages():
     """Save processed messages to file"""
     try:
-        with open('processed_messages.txt', 'w') as f:
-            for msg_id in processed_messages:
+        # Snapshot first: backfill workers may be adding to the set concurrently
+        snapshot = list(processed_messages)
+        with _processed_save_lock, open('processed_messages.txt', 'w') as f:
+            for msg_id in snapshot:
                 f.write(f"{msg_id}\n")
     except Exception as e:
-        print(f"⚠️ Could not save processed messages: {e}")
-
-# Load processed messages at startup
-processed_messages = load_processed_messages()
-print(f"📚 Loaded {len(processed_messages)} processed messages from previous runs")
+        log.warning("⚠️ Could not save processed messages: %s", e)
 
 CLIENT_ID = "b985204d-8506-4bb3-8f54-25899e38c825"
-CLIENT_SECRET = os.getenv("O365_CLIENT_SECRET")
-TENANT_ID = os.getenv("O365_TENANT_ID")
 REPLY_ID_TAG = "Pair_Reply_Reference_ID"
+# Ask Graph for immutable item ids on every request (O365 adds these headers to
+# each call). A message keeps its id when it is moved to another folder, so ids
+# stored in the hub, the outbox and the hidden reply tag stay direct GETs.
+GRAPH_HEADERS = {"Prefer": 'IdType="ImmutableId"'}
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-EMAIL_TO_WATCH = os.getenv("EMAIL_TO_WATCH")
+# Filled in from the environment / .env by load_config()
+CLIENT_SECRET = None
+TENANT_ID = None
+OPENAI_API_KEY = None
+EMAIL_TO_WATCH = None
 
 
-EMAILS_TO_FORWARD = ['Mujahid.rasul@mlfa.org', 'Syeda.sadiqa@mlfa.org', 'Arshia.ali.khan@mlfa.org', 'Maria.laura@mlfa.org', 'info@mlfa.org', 'aisha.ukiu@mlfa.org', 'shawn@strategichradvisory.com', 'm.ahmad0826@gmail.com']
-NONREAD_CATEGORIES = {"marketing"}  # Keep these unread
-SKIP_CATEGORIES = {'spam', 'cold_outreach', 'newsletter', 'irrelevant_other'}
+# Staff addresses, forwards, replies, moves and keep-unread categories live in
+# routing.py (DEFAULT_CONFIG, or routing.json when present). Set by main().
+router = None
 
 HUMAN_CHECK = True  # Enable human check for approval hub
 
-# Storage for multiple pending emails
-pending_emails = {}  # Dictionary to store multiple emails by ID
-current_email_id = None  # Track which email is currently being shown
-
-# Flask app for approval hub
-app = Flask(__name__, static_folder='.')
-app.secret_key = os.getenv('SECRET_KEY', 'mlfa-email-hub-2024')  # Change this in production
-app.config['SESSION_COOKIE_SECURE'] = False  # Set to True in production with HTTPS
-app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
-CORS(app, supports_credentials=True)
-
-# Simple password (set in .env or use default)
-ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'MLFA2024secure!')
-
-def login_required(f):
-    def decorated_function(*args, **kwargs):
-        logged_in = session.get('logged_in')
-        print(f"🔍 Checking auth for {request.path}: logged_in={logged_in}, session={dict(session)}")
-        
-        if not logged_in:
-            if request.path.startswith('/api/'):
-                # For API calls, return JSON error instead of redirect
-                print(f"❌ API call denied - not logged in")
-                return jsonify({"error": "Authentication required"}), 401
-            print(f"❌ Redirecting to login")
-            return redirect(url_for('login'))
-        
-        print(f"✅ Authentication passed")
-        return f(*args, **kwargs)
-    decorated_function.__name__ = f.__name__
-    return decorated_function
+# Storage for multiple pending emails: the store shared with the hub service
+# (hub.py). Set by main(); the poll loop adds, the hub reads and claims.
+pending_emails = None
 
+def load_config():
+    """Read .env and the environment into the module settings."""
+    global CLIENT_SECRET, TENANT_ID, OPENAI_API_KEY, EMAIL_TO_WATCH
+    load_dotenv()
+    CLIENT_SECRET = os.getenv("O365_CLIENT_SECRET")
+    TENANT_ID = os.getenv("O365_TENANT_ID")
+    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    EMAIL_TO_WATCH = os.getenv("EMAIL_TO_WATCH")
 
+###CONNECTING
 
+# Set by warm_up()
+account = None
+mailbox = None
+inbox_folder = None
+junk_folder = None
 
-###CONNECTING
+_openai_client = None
+_openai_lock = threading.Lock()
+
+def get_openai_client():
+    """Create the OpenAI client on first use (the openai package is slow to import)."""
+    global _openai_client
+    if _openai_client is None:
+        with _openai_lock:
+            if _openai_client is None:
+                from openai import OpenAI
+                _openai_client = OpenAI(api_key=OPENAI_API_KEY)
+    return _openai_client
 
 
-openai.api_key = OPENAI_API_KEY
-credentials = (CLIENT_ID, None) #delete
-#credentials = (CLIENT_ID, CLIENT_SECRET)
-token_backend = FileSystemTokenBackend(token_path=".", token_filename="o365_token.txt")
-account = Account(credentials, auth_flow_type="authorization", token_backend=token_backend)  #Delete this
-#account = Account(credentials, auth_flow_type="credentials",  tenant_id=TENANT_ID) 
+def connect_account():
+    """Authenticate with Microsoft Graph (may prompt on first run) and return the Account."""
+    from O365 import Account, FileSystemTokenBackend
 
-if not account.is_authenticated:
-    account.authenticate(scopes=['basic', 'message_all']) #Deleting this
-    #account.authenticate()
+    credentials = (CLIENT_ID, None) #delete
+    #credentials = (CLIENT_ID, CLIENT_SECRET)
+    token_backend = FileSystemTokenBackend(token_path=".", token_filename="o365_token.txt")
+    acct = Account(credentials, auth_flow_type="authorization", token_backend=token_backend,
+                   default_headers=GRAPH_HEADERS)  #Delete this
+    #acct = Account(credentials, auth_flow_type="credentials",  tenant_id=TENANT_ID, default_headers=GRAPH_HEADERS) 
+
+    if not acct.is_authenticated:
+        acct.authenticate(scopes=['basic', 'message_all']) #Deleting this
+        #acct.authenticate()
+    return acct
+
+
+def warm_up():
+    """
+    Run the independent start-up steps concurrently instead of back to back:
+      - auth, then inbox and junk folder resolution (in parallel with each other)
+      - loading processed messages and delta tokens from disk
+      - constructing the OpenAI client (import cost only, no network)
+    Returns the loaded delta tokens and a dict of per-step timings.
+    """
+    global account, mailbox, inbox_folder, junk_folder, processed_messages
+    timings = {}
+
+    def timed(name, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            timings[name] = time.perf_counter() - t0
 
-mailbox = account.mailbox(resource=EMAIL_TO_WATCH)
-inbox_folder = mailbox.inbox_folder()
-junk_folder = mailbox.junk_folder()
+    def load_state():
+        return load_processed_messages(), load_last_delta()
+
+    with ThreadPoolExecutor(max_workers=4, thread_name_prefix="warmup") as pool:
+        auth_f = pool.submit(timed, "auth", connect_account)
+        state_f = pool.submit(timed, "state", load_state)
+        pool.submit(timed, "openai", get_openai_client)
+
+        account = auth_f.result()
+        mailbox = account.mailbox(resource=EMAIL_TO_WATCH)
+        inbox_f = pool.submit(timed, "inbox_folder", mailbox.inbox_folder)
+        junk_f = pool.submit(timed, "junk_folder", mailbox.junk_folder)
+
+        processed_messages, (inbox_delta, junk_delta) = state_f.result()
+        inbox_folder = inbox_f.result()
+        junk_folder = junk_f.result()
+
+    log.info("📚 Loaded %d processed messages from previous runs", len(processed_messages))
+    return inbox_delta, junk_delta, timings
 
 
 
@@ -230,102 +305,71 @@ def classify_email(subject, body):
 
 
     try:
-        response = openai.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2,
-        )
+        started = time.perf_counter()
+        try:
+            response = get_openai_client().chat.completions.create(
+                model="gpt-4.1-mini",
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.2,
+            )
+        finally:
+            LLM_SECONDS.observe(time.perf_counter() - started)
+        usage = getattr(response, "usage", None)
+        if usage:
+            LLM_TOKENS.inc(usage.prompt_tokens or 0, kind="prompt")
+            LLM_TOKENS.inc(usage.completion_tokens or 0, kind="completion")
         raw = response.choices[0].message.content.strip()
         if raw.startswith("```json"): raw = raw[len("```json"):].strip() #to prevent errors from occuring. 
         if raw.endswith("```"): raw = raw[:-3].strip()
         return json.loads(raw)
     except Exception as e:
-        print(f"Classification error: {e}")
+        LLM_ERRORS.inc()
+        log.error("Classification error: %s", e)
         return {}
 
 
-def process_folder(folder, name, delta_token):
+def process_folder(folder, name, delta_token, since=None):
     """
     Delta items are treated as signals only.
     For each changed conversation, fetch ALL unread child messages and process
     them individually (oldest -> newest), never reprocessing the original/root.
     Internal replies are detected and handled before classification.
+
+    `since` bounds a first run (no delta token) to mail received at or after
+    that time; the backfill uses it to open the live cursor at its cutover.
     """
     # Build delta query (optionally select a few cheap fields to reduce "shallow" items)
     qs = folder.new_query()
     if delta_token:
         qs = qs.delta_token(delta_token)
+    elif since:
+        qs = qs.on_attribute('receivedDateTime').greater_equal(since)
     qs = qs.select([
-        'id', 'conversationId', 'isRead', 'receivedDateTime', 'from', 'sender', 'subject', 'categories'
+        'id', 'changeKey', 'conversationId', 'isRead', 'receivedDateTime', 'from', 'sender', 'subject', 'categories'
     ])
 
     try:
         msgs = folder.get_messages(query=qs)
 
         for msg in msgs:
+            # Our own tag/read/move coming back: nothing to fetch
+            if echoes.is_echo(msg.object_id):
+                DELTA_ECHOES.inc()
+                continue
+
             # For each conversation that changed, act ONLY on unread children
             conv_id = getattr(msg, 'conversation_id', None)
             if not conv_id:
-                # Fallback: skip if no conversation id (rare)
-                dedup_key = getattr(msg, 'internet_message_id', None) or msg.object_id
-                if dedup_key in processed_messages:
-                    print(f"⏭️  Already processed message (dedup), skipping: {getattr(msg, 'subject', 'Unknown')}")
-                    continue
-                try:
-                    msg.refresh()
-                except Exception:
-                    pass
-                
-                # Skip if already processed (marked with PAIRActioned)
-                if any((c or '').startswith('PAIRActioned') for c in (msg.categories or [])):
-                    print(f"⏭️  Already processed message (categories), skipping: {msg.subject}")
-                    processed_messages.add(dedup_key)
-                    continue
-                
-                # If this solitary item is unread, process it as a last resort
-                if not msg.is_read:
-                    # Internal-reply detection (rare path)
-                    sender_addr = (msg.sender.address or "").lower() if msg.sender else ""
-                    sender_is_staff = sender_addr in [e.lower() for e in EMAILS_TO_FORWARD]
-                    is_automated_reply = bool(re.search(fr"{REPLY_ID_TAG}\s*([^\s<]+)", msg.body or "", flags=re.I|re.S))
-                    if sender_is_staff and is_automated_reply and not any((c or '').startswith('PAIRActioned') for c in (msg.categories or [])):
-                        handle_internal_reply(msg)
-                        processed_messages.add(dedup_key)
-                        continue
-
-                    body_to_analyze = get_clean_message_text(msg)
-
-                    print(f"\nNEW:  [{name}] {msg.received.strftime('%Y-%m-%d %H:%M')} | "
-                          f"{msg.sender.address if msg.sender else 'UNKNOWN'} | {msg.subject}")
-                    result = classify_email(msg.subject, body_to_analyze)
-                    if HUMAN_CHECK: 
-                        print(json.dumps(result, indent=2))
-                        # Skip if this email is already in pending queue (prevent duplicates)
-                        email_id = msg.object_id
-                        if email_id not in pending_emails:
-                            pending_emails[email_id] = {
-                                "subject": msg.subject,
-                                "body": body_to_analyze,
-                                "classification": result,
-                                "sender": msg.sender.address,
-                                "received": msg.received.strftime('%Y-%m-%d %H:%M'),
-                                "message_obj": msg
-                            }
-                            print(f"📧 Email stored for approval: {msg.subject}")
-                        else:
-                            print(f"⏭️  Email already in pending queue, skipping: {msg.subject}")
-                        processed_messages.add(dedup_key)
-                    else: 
-                        print(json.dumps(result, indent=2))
-                        handle_new_email(msg, result)
-                        processed_messages.add(dedup_key)
+                # Fallback: no conversation id (rare) - process this solitary item
+                # as a last resort if it is unread
+                process_message(msg, name, require_unread=True)
                 continue  # done with this delta item
 
             # Normal path: fetch unread messages in this conversation
             try:
                 unread_msgs = unread_in_conversation(folder, mailbox, conv_id)
             except Exception as e:
-                print(f"   Could not fetch unread children for {conv_id}: {e}")
+                log.warning("Could not fetch unread children for %s: %s", conv_id, e)
                 continue
 
             if not unread_msgs:
@@ -334,182 +378,271 @@ def process_folder(folder, name, delta_token):
 
             # Process each unread child once, oldest -> newest
             for child in unread_msgs:
-                dedup_key = getattr(child, 'internet_message_id', None) or child.object_id
-                if dedup_key in processed_messages:
-                    print(f"⏭️  Already processed message (dedup), skipping: {child.subject}")
-                    continue
-
-                # Make sure we have up-to-date fields on the child
-                try:
-                    child.refresh()
-                except Exception:
-                    pass
-
-                # Skip if already processed (marked with PAIRActioned)
-                if any((c or '').startswith('PAIRActioned') for c in (child.categories or [])):
-                    print(f"⏭️  Already processed message (categories), skipping: {child.subject}")
-                    processed_messages.add(dedup_key)
-                    continue
-
-                # 1) Internal reply path (staff replies captured by your hidden REPLY_ID_TAG)
-                sender_addr = (child.sender.address or "").lower() if child.sender else ""
-                sender_is_staff = sender_addr in [e.lower() for e in EMAILS_TO_FORWARD]
-                is_automated_reply = bool(re.search(fr"{REPLY_ID_TAG}\s*([^\s<]+)", child.body or "", flags=re.I|re.S))
-                if sender_is_staff and is_automated_reply and not any(
-                    (c or '').startswith('PAIRActioned') for c in (child.categories or [])
-                ):
-                    handle_internal_reply(child)
-                    processed_messages.add(dedup_key)
-                    continue
-
-                # 3) Classify using reply-only text, then handle
-                body_to_analyze = get_clean_message_text(child)
-                print(f"\nNEW:  [{name}] {child.received.strftime('%Y-%m-%d %H:%M')} | "
-                      f"{child.sender.address if child.sender else 'UNKNOWN'} | {child.subject}")
-                result = classify_email(child.subject, body_to_analyze)
-                print(json.dumps(result, indent=2))
-                
-                if HUMAN_CHECK:
-                    # Skip if this email is already in pending queue (prevent duplicates)
-                    email_id = child.object_id
-                    if email_id not in pending_emails:
-                        pending_emails[email_id] = {
-                            "subject": child.subject,
-                            "body": body_to_analyze,
-                            "classification": result,
-                            "sender": child.sender.address,
-                            "received": child.received.strftime('%Y-%m-%d %H:%M'),
-                            "message_obj": child
-                        }
-                        print(f"📧 Email stored for approval: {child.subject}")
-                    else:
-                        print(f"⏭️  Email already in pending queue, skipping: {child.subject}")
-                else:
-                    handle_new_email(child, result)
-
-                # 4) Dedup remember
-                processed_messages.add(dedup_key)
+                process_message(child, name)
 
         # Return latest delta token (if present) to persist
+        LAST_SYNC[name] = time.time()
         return getattr(msgs, 'delta_token', delta_token)
 
     except Exception as e:
-        print(f" Error accessing {name}: {e}")
+        POLL_ERRORS.inc(folder=name)
+        log.error("Error accessing %s: %s", name, e)
         return delta_token
 
 
+def process_message(msg, name, require_unread=False):
+    """
+    Dedup, detect internal replies, classify and then queue (HUMAN_CHECK) or
+    handle one message. Shared by the live delta loop and the backfill workers.
+    """
+    dedup_key = getattr(msg, 'internet_message_id', None) or msg.object_id
+    if dedup_key in processed_messages:
+        CLASSIFY_SKIPPED.inc(reason="dedup")
+        log.debug("⏭️  Already processed message (dedup), skipping: %s", getattr(msg, 'subject', 'Unknown'))
+        return
+
+    # Make sure we have up-to-date fields on the message
+    try:
+        msg.refresh()
+    except Exception:
+        pass
+
+    # Skip if already processed (marked with PAIRActioned)
+    if any((c or '').startswith('PAIRActioned') for c in (msg.categories or [])):
+        log.debug("⏭️  Already processed message (categories), skipping: %s", msg.subject)
+        CLASSIFY_SKIPPED.inc(reason="already_actioned")
+        processed_messages.add(dedup_key)
+        return
+
+    if require_unread and msg.is_read:
+        return
+
+    # 1) Internal reply path (staff replies captured by your hidden REPLY_ID_TAG)
+    if router.table.is_internal_reply(msg.sender.address if msg.sender else "", msg.body):
+        handle_internal_reply(msg)
+        CLASSIFY_SKIPPED.inc(reason="internal_reply")
+        processed_messages.add(dedup_key)
+        return
+
+    # 2) Classify using reply-only text, then handle
+    body_to_analyze = clean_message_text(msg)
+    log.info("NEW:  [%s] %s | %s | %s", name, msg.received.strftime('%Y-%m-%d %H:%M'),
+             msg.sender.address if msg.sender else 'UNKNOWN', msg.subject)
+    result = classify_email(msg.subject, body_to_analyze)
+    log.debug("Classified %s as %s", msg.subject, result.get("categories"), extra={"classification": result})
+
+    if HUMAN_CHECK:
+        # Skip if this email is already in pending queue (prevent duplicates)
+        if pending_emails.add(PendingEmail.from_message(msg, body_to_analyze, result)):
+            MESSAGES.inc(outcome="queued_for_review")
+            log.info("📧 Email stored for approval: %s", msg.subject)
+        else:
+            MESSAGES.inc(outcome="already_pending")
+            log.debug("⏭️  Email already in pending queue, skipping: %s", msg.subject)
+    else:
+        MESSAGES.inc(outcome="handled")
+        handle_new_email(msg, result)
+
+    # 3) Dedup remember
+    processed_messages.add(dedup_key)
+
+
 def handle_new_email(msg, result):
     """
     Takes a message and its AI classification result, then acts on it.
     It does NOT call the AI again.
     """
-    categories = result.get("categories", [])
-    recipients_set = set(result.get("all_recipients", []))
-    name_sender = result.get("name_sender")
-    
-    # We pass the message and its categories to be tagged
-    tag_email(msg, categories, replyTag=False)
-    # We use the results to perform specific actions
-    handle_emails(categories, result, recipients_set, msg, name_sender)
-
-    if recipients_set:
-        fwd = msg.forward()
-        # fwd.to.add(list(recipients_set))
-        fwd.to.add('m.ahmad0826@gmail.com')  # For testing
-        # Add th=e hidden tracking ID into the top of the forwarded body
-        instruction_html = f"""<div style="display:none;">{REPLY_ID_TAG}{msg.object_id}</div>"""
-        
-        # Prepend to the auto-generated forward body
-        fwd.body = "Please press 'Reply All,' and reply to info@mlfa.org. You're email will automatically be sent to the correct person. " + instruction_html
-        fwd.body_type = 'HTML'
-        
-        # Send the forward
-        fwd.send()
-
-
-    if not set(categories).issubset(NONREAD_CATEGORIES):
-        mark_as_read(msg)
-
-
-def handle_emails(categories, result, recipients_set, msg, name_sender): 
-    for category in categories:
-        if category == "legal":
-            reply_message = msg.reply(to_all=False)
-            # Check if this email needs a personal reply based on classification
-            needs_personal = result.get("needs_personal_reply", False)
-
-            if needs_personal:
-                reply_message.body = f"""
-                    <p>Dear {name_sender},</p>
-
-                    <p>Thank you for contacting the Muslim Legal Fund of America (MLFA). 
-                    We are grateful that you reached out and placed your trust in us to potentially support your legal matter.</p>
-
-                    <p>If you have not already done so, please submit a formal application for legal assistance through our website:<br>
-                    <a href="https://mlfa.org/application-for-legal-assistance/">https://mlfa.org/application-for-legal-assistance/</a></p>
-
-                    <p>Once submitted, our team will carefully review your application and follow up with next steps. 
-                    If you have any questions about the application process or need help completing it, please don't hesitate to reach out.</p>
-
-                    <p>We appreciate your patience as we work through applications, and we look forward to learning more about how we might be able to help.</p>
-
-                    <p>Warm regards,<br>
-                    The MLFA Team<br>
-                    Muslim Legal Fund of America</p>
-                """
-
-                reply_message.body_type = "HTML"
-            else:
-                reply_message.body = f"""
-                    <p>Dear {name_sender},</p>
+    plan_actions(msg.object_id, result)
+
+
+def plan_actions(message_id, result):
+    """
+    Write every side effect for this message to the outbox instead of running
+    it inline. Re-planning the same message is a no-op for actions already
+    recorded, so a retry can never send a duplicate reply or forward.
+
+    Whatever the number of categories, the routing plan gives one update
+    (categories + read state in a single PATCH), at most one reply, one
+    forward and one move.
+    """
+    plan = router.table.plan(result)
+
+    outbox.reopen(message_id)  # a plan that gave up before: retry what never succeeded
+    outbox.enqueue(message_id, "update", {"categories": plan.categories, "read": plan.mark_read})
+    if plan.reply:
+        outbox.enqueue(message_id, "reply", {"body": plan.reply})
+
+    if plan.forward:
+        # Add the hidden tracking ID into the top of the forwarded body
+        instruction_html = f"""<div style="display:none;">{REPLY_ID_TAG}{message_id}</div>"""
+        outbox.enqueue(message_id, "forward", {
+            # "to": plan.forward,
+            "to": ['m.ahmad0826@gmail.com'],  # For testing
+            # Comment above the quoted original (Graph one-shot /forward)
+            "body": "Please press 'Reply All,' and reply to info@mlfa.org. You're email will automatically be sent to the correct person. " + instruction_html,
+        })
+
+    if plan.move:
+        outbox.enqueue(message_id, "move", {"folders": plan.move})
+
+    outbox_worker.notify()
+
+
+def plan_rejection(message_id):
+    """Outbox plan for a rejected email: processed marker, read, moved to declined."""
+    outbox.reopen(message_id)
+    outbox.enqueue(message_id, "update", {"categories": [], "read": True})
+    outbox.enqueue(message_id, "move", {"folders": ["declined", "Declined"]})
+    outbox_worker.notify()
+
+
+# -------------------------------
+# OUTBOX EXECUTORS (run on the outbox worker thread)
+# Each one raises on failure so the worker retries it with backoff.
+# -------------------------------
+def _require(ok, what):
+    if not ok:
+        raise RuntimeError(f"{what} was not accepted by Graph")
+
+
+def _run_update(msg, payload):
+    """Processed-marker categories and read state in one PATCH, or none if both already hold."""
+    existing = set(msg.categories or [])
+    merged = actioned_categories(existing, payload.get("categories", []), replyTag=False)
+    if merged != existing:
+        msg.categories = sorted(merged)
+    if payload.get("read") and not msg.is_read:
+        msg.is_read = True
+    _require(msg.save_message(), "update")  # the SDK PATCHes only the tracked changes, if any
+
 
-                    <p>Thank you for contacting the Muslim Legal Fund of America (MLFA).</p>
+def send_reply(msg, comment, to_all=False):
+    """
+    Reply in a single POST to Graph's /reply (or /replyAll): `comment` (HTML)
+    goes above the quoted original. No draft is created or updated.
+    """
+    url = msg.build_url(f"/messages/{msg.object_id}/{'replyAll' if to_all else 'reply'}")
+    return bool(msg.con.post(url, data={"comment": comment}))
 
-                    <p>If you have not already done so, please submit a formal application for legal assistance 
-                    through our website:<br>
-                    <a href="https://mlfa.org/application-for-legal-assistance/">https://mlfa.org/application-for-legal-assistance/</a></p>
 
-                    <p>This ensures our legal team has the information needed to review your case promptly.</p>
+def send_forward(msg, to, comment):
+    """Forward in a single POST to Graph's /forward, recipients and comment included; the original stays quoted."""
+    url = msg.build_url(f"/messages/{msg.object_id}/forward")
+    return bool(msg.con.post(url, data={
+        "comment": comment,
+        "toRecipients": [{"emailAddress": {"address": address}} for address in to],
+    }))
 
-                    <p>Sincerely,<br>
-                    The MLFA Team</p>
-                """
 
-                reply_message.body_type = "HTML"
-            reply_message.send()
+def _needs_draft(payload):
+    # One-shot actions can't carry attachments or replace the quoted body
+    return bool(payload.get("attachments") or payload.get("replace_body"))
 
-        elif category == "donor":
-            recipients_set.update([f"{EMAILS_TO_FORWARD[0]}", f"{EMAILS_TO_FORWARD[1]}"])
 
-        elif category == "sponsorship":
-            recipients_set.update([f"{EMAILS_TO_FORWARD[2]}", f"{EMAILS_TO_FORWARD[3]}"])
+def _run_reply(msg, payload):
+    if not _needs_draft(payload):
+        _require(send_reply(msg, payload["body"], to_all=payload.get("to_all", False)), "reply")
+        return
+    reply_message = msg.reply(to_all=payload.get("to_all", False))
+    reply_message.body = payload["body"]
+    reply_message.body_type = "HTML"
+    for path in payload.get("attachments", []):
+        reply_message.attachments.add(path)
+    _require(reply_message.send(), "reply send")
 
-        elif category == "organizational":
-            recipients_set.update([f"{EMAILS_TO_FORWARD[2]}", f"{EMAILS_TO_FORWARD[3]}"])
 
-        elif category == "volunteer":
-            recipients_set.update([f"{EMAILS_TO_FORWARD[5]}"])
+def _run_forward(msg, payload):
+    if not _needs_draft(payload):
+        _require(send_forward(msg, payload["to"], payload["body"]), "forward")
+        return
+    fwd = msg.forward()
+    fwd.to.add(payload["to"])
+    fwd.body = payload["body"]
+    fwd.body_type = 'HTML'
+    for path in payload.get("attachments", []):
+        fwd.attachments.add(path)
+    _require(fwd.send(), "forward send")
+
+
+def _run_move(msg, payload):
+    inbox = mailbox.inbox_folder()
+    target = None
+    for folder_name in payload["folders"]:
+        try:
+            target = inbox.get_folder(folder_name=folder_name)
+        except Exception:
+            target = None
+        if target:
+            break
+    if not target:
+        raise LookupError(f"none of the folders {payload['folders']} exist")
+    log.debug("Moving to %s folder.", target.name)
+    _require(msg.move(target), "move")
+
+
+OUTBOX_EXECUTORS = {
+    "update": _run_update,
+    "reply": _run_reply,
+    "forward": _run_forward,
+    "move": _run_move,
+}
+
+def release_message(message_id, msg):
+    """
+    An outbox action gave up and the rest of the plan is blocked. Take our
+    PAIRActioned marker off and mark the message unread again, so it is not
+    silently treated as handled: the delta loop picks it up as new mail and
+    it goes back to the review queue. Planning it again only re-runs what
+    never succeeded (a reply that went out is not sent twice), see
+    Outbox.reopen(). Its job keeps reporting "failed" until then.
+    """
+    processed_messages.discard(message_id)
+    processed_messages.discard(getattr(msg, "internet_message_id", None))
+    msg.categories = sorted(c for c in (msg.categories or []) if not (c or "").startswith("PAIRActioned"))
+    msg.is_read = False
+    _require(msg.save_message(), "release")
+    echoes.forget(message_id)  # the change we just made must come back through the delta
+    log.warning("⚠️ Gave up on '%s'; marker removed so it is reviewed again", msg.subject)
 
-        elif category == "internship":
-            recipients_set.update([f"{EMAILS_TO_FORWARD[5]}"])
 
-        elif category == "job_application":
-            recipients_set.update([f"{EMAILS_TO_FORWARD[6]}"])
+def fetch_message(message_id):
+    """Load the full Graph message only when an action is about to run on it."""
+    return mailbox.get_message(message_id)
 
-        elif category == "fellowship":
-            recipients_set.update([f"{EMAILS_TO_FORWARD[5]}"])
 
-        elif category == "marketing":
-            inbox = mailbox.inbox_folder()
-            sales_folder = inbox.get_folder(folder_name="Sales emails")
-            print("Moving to sales emails folder.")
-            msg.move(sales_folder)
+# Set by main(); opening the outbox database is start-up I/O
+outbox = None
+outbox_worker = None
+job_runner = None
 
-def tag_email(msg, categories, replyTag):
-    # 1) Load existing categories safely
-    existing = set((msg.categories or []))
 
-    # 2) Build new tags for this operation
+def run_review_job(job):
+    """
+    Execute an approve/reject job queued by the hub: plan its actions into
+    the outbox and run them right away. Returns the outbox (status, error).
+    """
+    email_id = job["emailId"]
+    # Add to processed messages to prevent reappearance
+    processed_messages.add(email_id)
+
+    if job["kind"] == "approve":
+        log.info("✅ Email approved: %s - Processing normally", job['subject'])
+        plan_actions(email_id, job["payload"]["classification"])
+    else:
+        # Just mark as processed without adding new tags (only the PAIRActioned marker),
+        # mark as read and move it to the "declined" folder
+        log.info("❌ Email rejected: %s - Reason: %s", job['subject'], job['payload'].get('reason'))
+        plan_rejection(email_id)
+
+    outbox_worker.run_message(email_id)
+    status, error = outbox.message_status(email_id)
+    if error and status != "done":
+        log.warning("⚠️ %s of '%s' is %s: %s", job['kind'], job['subject'], status, error)
+    return status, error
+
+def actioned_categories(existing, categories, replyTag):
+    """`existing` categories plus the PAIRActioned tags for `categories`."""
+    # 1) Build new tags for this operation
     new_tags = set()
     for c in categories or []:
         c = (c or "").strip()
@@ -526,58 +659,48 @@ def tag_email(msg, categories, replyTag):
     # Always keep the umbrella marker
     new_tags.add("PAIRActioned")
 
-    # 3) Merge (union) — do NOT drop existing tags
-    merged = existing.union(new_tags)
-
-    # 4) Save only if there’s a change
-    if merged != existing:
-        msg.categories = sorted(merged)
-        msg.save_message()
+    # 2) Merge (union) — do NOT drop existing tags
+    return set(existing).union(new_tags)
 
 
-def mark_as_read(msg): 
-    print("   Marking email as read...")
-    try:
-        msg.mark_as_read()
-        print("   Marked as read")
-    except Exception as e:
-        print(f"    Could not mark as read: {e}")
-
 def handle_internal_reply(msg): 
-    print(f"\nREPLY DETECTED: From {msg.sender.address} | {msg.subject}")
+    log.info("REPLY DETECTED: From %s | %s", msg.sender.address, msg.subject)
     body_parts = msg.body.split(REPLY_ID_TAG)
     if len(body_parts) < 2:
-        print(" ERROR: Could not find the reply id, therefore, we cannot reply. ")
+        log.error("Could not find the reply id, therefore, we cannot reply.")
         return
 
+    from bs4 import BeautifulSoup
+
     html_chunk = body_parts[0]
     soup = BeautifulSoup(html_chunk, 'html.parser')
     reply_content = str(soup)
 
     if not reply_content: 
-        print("   WARNING: Reply appears to be empty. Not sending. ")
+        log.warning("Reply appears to be empty. Not sending.")
         #We need to maybe re-email the person who wrote the reply to the forwarded email to try again. 
         return
 
     match = re.search(f"{REPLY_ID_TAG}(.+?)</", msg.body)
     if not match: 
-        print("   ERROR: Could not find the original message ID.")
+        log.error("Could not find the original message ID.")
         return
     original_message_id = match.group(1).strip()
     
     try:
         original_msg = mailbox.get_message(original_message_id)
+        # Draft path on purpose: the staff reply replaces the body instead of quoting it
         final_reply = original_msg.reply(to_all=False)
         final_reply.body = reply_content
         final_reply.body_type = "HTML"
         final_reply.send()
-        print(f"   Sent reply to original sender: {original_msg.sender.address}")
+        log.info("Sent reply to original sender: %s", original_msg.sender.address)
     except Exception as e:
-        print(f"   ERROR: Could not send final reply. Error: {e}")
+        log.error("Could not send final reply. Error: %s", e)
         return
 
     msg.mark_as_read()
-    print("   Cleanup complete. Reply process finished.")
+    log.debug("Cleanup complete. Reply process finished.")
 
 
 def newest_unread_in_conversation(folder, mailbox, conversation_id):
@@ -640,368 +763,216 @@ def unread_in_conversation(folder, mailbox, conversation_id, page_limit=30):
         except: pass
     return unread
 
-def get_clean_message_text(msg):
-    """
-    Return only the reply content for this message.
-    Prefer Graph's unique_body (just the new text),
-    otherwise strip quoted history from the full body.
-    """
-    QUOTE_SEPARATORS = [
-        r'^\s*On .* wrote:\s*$',              
-        r'^\s*From:\s.*$',                    
-        r'^\s*-----Original Message-----\s*$',
-        r'^\s*De:\s.*$',                      
-        r'^\s*Sent:\s.*$',
-        r'^\s*To:\s.*$',
-    ]
-
-    def strip_quoted_reply(html_or_text: str) -> str:
-        if not html_or_text:
-            return ""
-        text = html_or_text
+
+# -------------------------------
+# METRICS
+# -------------------------------
+_ID_SEGMENT = re.compile(r"^[A-Za-z0-9_=\-]{20,}$|@|^[0-9a-f-]{36}$")
+
+def _graph_endpoint(path_url):
+    """Low-cardinality label for a Graph URL: ids and addresses become {id}."""
+    path = path_url.split("?", 1)[0]
+    parts = [("{id}" if _ID_SEGMENT.search(part) else part) for part in path.split("/") if part]
+    return "/" + "/".join(parts[1:])  # drop the API version
+
+def _response_json(response):
+    """The JSON body, decoded once per response and shared by the hooks below."""
+    data = getattr(response, "_mlfa_json", None)
+    if data is None:
+        data = response._mlfa_json = response.json()
+    return data
+
+def _record_graph_response(response, *args, **kwargs):
+    """requests response hook: count every Graph call (429s included) and its latency."""
+    endpoint = _graph_endpoint(response.request.path_url)
+    GRAPH_REQUESTS.inc(method=response.request.method, endpoint=endpoint, status=response.status_code)
+    GRAPH_SECONDS.observe(response.elapsed.total_seconds(), endpoint=endpoint)
+    if endpoint.endswith("/delta") and response.ok:
+        DELTA_PAGES.inc()
         try:
-            from bs4 import BeautifulSoup
-            soup = BeautifulSoup(html_or_text, 'html.parser')
-            for sel in [
-                'blockquote',
-                'div.gmail_quote',
-                'div[type=cite]',
-                'div.moz-cite-prefix',
-                'div.OutlookMessageHeader',
-            ]:
-                for node in soup.select(sel):
-                    node.decompose()
-            text = soup.get_text("\n")
-        except Exception:
+            DELTA_PAGE_ITEMS.observe(len(_response_json(response).get("value", [])))
+        except ValueError:
             pass
 
-        import re
-        lines = [ln.rstrip() for ln in text.splitlines()]
-        out = []
-        for ln in lines:
-            if ln.strip().startswith('>'):
-                break
-            if any(re.match(pat, ln, flags=re.IGNORECASE) for pat in QUOTE_SEPARATORS):
-                break
-            out.append(ln)
-
-        return "\n".join(out).strip()[:8000]
-
-    body = getattr(msg, 'unique_body', None) or getattr(msg, 'body', None) or ""
-    return strip_quoted_reply(body)
-
-
-
-# Login page template
-LOGIN_TEMPLATE = '''
-<!DOCTYPE html>
-<html>
-<head>
-    <title>MLFA Email Hub - Login</title>
-    <style>
-        @import url('https://fonts.googleapis.com/css2?family=JetBrains+Mono:wght@300;400;500;600&family=Inter:wght@300;400;500;600&display=swap');
-        
-        * {
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }
-        
-        body {
-            font-family: 'Inter', -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
-            background: #0d1117;
-            color: #f0f6fc;
-            min-height: 100vh;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            margin: 0;
-            font-size: 14px;
-            line-height: 1.5;
-        }
-        
-        .login-container {
-            width: 100%;
-            max-width: 400px;
-            padding: 20px;
-        }
-        
-        .login-header {
-            text-align: center;
-            margin-bottom: 32px;
-        }
-        
-        .login-header h1 {
-            font-family: 'JetBrains Mono', monospace;
-            font-size: 18px;
-            font-weight: 500;
-            color: #58a6ff;
-            margin: 0;
-            letter-spacing: -0.025em;
-        }
-        
-        .login-box {
-            background: #161b22;
-            padding: 32px;
-            border-radius: 6px;
-            border: 1px solid #30363d;
-            width: 100%;
-        }
-        
-        .login-box input[type="password"] {
-            width: 100%;
-            padding: 12px;
-            margin-bottom: 16px;
-            background: #0d1117;
-            border: 1px solid #30363d;
-            border-radius: 4px;
-            color: #f0f6fc;
-            font-size: 14px;
-            font-family: 'JetBrains Mono', monospace;
-            transition: border-color 0.15s ease;
-        }
-        
-        .login-box input[type="password"]:focus {
-            outline: none;
-            border-color: #58a6ff;
-        }
-        
-        .login-box input[type="password"]::placeholder {
-            color: #7d8590;
-            font-family: 'JetBrains Mono', monospace;
-        }
-        
-        .login-box button {
-            width: 100%;
-            padding: 8px 16px;
-            background: #238636;
-            border: 1px solid #238636;
-            border-radius: 4px;
-            color: #f0f6fc;
-            font-size: 13px;
-            font-weight: 500;
-            cursor: pointer;
-            font-family: 'Inter', sans-serif;
-            transition: all 0.15s ease;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            min-height: 32px;
-        }
-        
-        .login-box button:hover {
-            background: #2ea043;
-            border-color: #2ea043;
-        }
-        
-        .error {
-            color: #f85149;
-            margin-bottom: 16px;
-            font-size: 13px;
-            font-family: 'Inter', sans-serif;
-            text-align: center;
-            padding: 8px 12px;
-            background: #0d1117;
-            border: 1px solid #da3633;
-            border-radius: 4px;
-        }
-        
-        @media (max-width: 768px) {
-            .login-container {
-                padding: 16px;
-            }
-            .login-box {
-                padding: 24px;
-            }
-        }
-    </style>
-</head>
-<body>
-    <div class="login-container">
-        <div class="login-header">
-            <h1>Approval Hub for info@mlfa.org</h1>
-        </div>
-        <div class="login-box">
-            {% if error %}
-            <div class="error">{{ error }}</div>
-            {% endif %}
-            <form method="post">
-                <input type="password" name="password" placeholder="enter password" required autofocus>
-                <button type="submit">Login</button>
-            </form>
-        </div>
-    </div>
-</body>
-</html>
-'''
-
-# Flask routes
-@app.route('/login', methods=['GET', 'POST'])
-def login():
-    if request.method == 'POST':
-        password = request.form.get('password')
-        if password == ADMIN_PASSWORD:
-            session['logged_in'] = True
-            session.permanent = True
-            print(f"✅ User logged in successfully, session ID: {session.get('logged_in')}")
-            return redirect(url_for('index'))
-        else:
-            print(f"❌ Login failed with password: {password}")
-            return render_template_string(LOGIN_TEMPLATE, error='Invalid password')
-    return render_template_string(LOGIN_TEMPLATE)
-
-@app.route('/logout')
-def logout():
-    session.pop('logged_in', None)
-    return redirect(url_for('login'))
-
-@app.route('/')
-@login_required
-def index():
-    return send_from_directory('.', 'approval-hub.html')
-
-@app.route('/api/emails')
-@login_required
-def get_emails():
-    print(f"📧 API call to /api/emails - pending emails count: {len(pending_emails)}")
-    emails = []
-    for email_id, email_data in pending_emails.items():
-        # Format data for the interface
-        categories = email_data["classification"].get('categories', [])
-        category_display = ', '.join([cat.replace('_', ' ').title() for cat in categories])
-        
-        recipients = email_data["classification"].get('all_recipients', [])
-        recipients_display = ', '.join(recipients) if recipients else 'None'
-        
-        reasons = email_data["classification"].get('reason', {})
-        reason_display = '; '.join(reasons.values()) if reasons else 'No reason provided'
-        
-        email = {
-            "id": email_id,
-            "meta": f"FROM: [INBOX] {email_data['received']} | {email_data['sender']} | {email_data['subject']}",
-            "senderName": email_data["classification"].get('name_sender', 'Unknown'),
-            "category": category_display,
-            "recipients": recipients_display,
-            "needsReply": "Yes" if email_data["classification"].get('needs_personal_reply', False) else "No",
-            "reason": reason_display,
-            "escalation": email_data["classification"].get('escalation_reason') or 'None',
-            "originalContent": email_data["body"],
-            "status": "pending"
-        }
-        emails.append(email)
-    return jsonify(emails)
-
-@app.route('/api/emails/<email_id>/approve', methods=['POST'])
-@login_required
-def approve_email(email_id):
-    if email_id in pending_emails:
-        email_data = pending_emails[email_id]
-        msg = email_data["message_obj"]
-        classification = email_data["classification"]
-        
-        print(f"✅ Email approved: {email_data['subject']} - Processing normally")
-        
-        # Process the email normally using the stored message and classification
-        handle_new_email(msg, classification)
-        
-        # Add to processed messages to prevent reappearance
-        dedup_key = getattr(msg, 'internet_message_id', None) or msg.object_id
-        processed_messages.add(dedup_key)
-        processed_messages.add(email_id)  # Also add the email_id itself
-        
-        # Remove from pending emails
-        del pending_emails[email_id]
-        
-    return jsonify({"status": "success", "message": "Email approved and will be processed normally"})
-
-@app.route('/api/emails/<email_id>/reject', methods=['POST'])
-@login_required
-def reject_email(email_id):
-    data = request.get_json()
-    reason = data.get('reason', 'No reason provided')
-    
-    if email_id in pending_emails:
-        email_data = pending_emails[email_id]
-        msg = email_data["message_obj"]
-        print(f"❌ Email rejected: {email_data['subject']} - Reason: {reason}")
-        
-        # Move rejected email to special folder
+# Our own recent mutations, so their delta echoes are dropped (see echoes.py)
+echoes = EchoRegistry()
+
+_ONE_SHOT_SENDS = ("/messages/{id}/reply", "/messages/{id}/replyAll", "/messages/{id}/forward")
+
+def _track_own_changes(response, *args, **kwargs):
+    """requests response hook: record our message PATCHes, moves and sends and flag their echoes in delta pages."""
+    if not response.ok:
+        return
+    method, path = response.request.method, response.request.path_url.split("?", 1)[0]
+    endpoint = _graph_endpoint(path)
+    try:
+        if endpoint.endswith("/delta"):
+            echoes.note_delta_page(_response_json(response).get("value", []))
+        elif method == "PATCH" and endpoint.endswith("/messages/{id}"):
+            data = _response_json(response)
+            echoes.record(data["id"], data.get("changeKey"))
+        elif method == "POST" and endpoint.endswith("/messages/{id}/move"):
+            data = _response_json(response)
+            echoes.record_move(unquote(path.rstrip("/").split("/")[-2]), data.get("id"), data.get("changeKey"))
+        elif method == "POST" and endpoint.endswith(_ONE_SHOT_SENDS):
+            echoes.record_send(unquote(path.rstrip("/").split("/")[-2]))
+    except (ValueError, KeyError):
+        pass
+
+GRAPH_HOOKS = (_record_graph_response, _track_own_changes)
+
+def instrument_graph():
+    """
+    Attach the metrics and echo hooks to the O365 connection's requests
+    session. Cheap and idempotent, so it is called every poll cycle: O365
+    creates the session lazily and may replace it when it refreshes the token.
+    """
+    session = getattr(account.connection, "session", None) if account else None
+    if session is not None:
+        for hook in GRAPH_HOOKS:
+            if hook not in session.hooks["response"]:
+                session.hooks["response"].append(hook)
+
+METRICS_PUBLISH_SECONDS = 15
+
+def publish_metrics_forever():
+    """Hand this process's metrics to the hub (through the shared store) every few seconds."""
+    while True:
         try:
-            inbox = mailbox.inbox_folder()
-            rejected_folder = None
-            
-            # Try to find existing "declined" folder
-            try:
-                rejected_folder = inbox.get_folder(folder_name="declined")
-                print(f"📁 Found existing 'declined' folder")
-            except:
-                try:
-                    rejected_folder = inbox.get_folder(folder_name="Declined")
-                    print(f"📁 Found existing 'Declined' folder")
-                except:
-                    print(f"⚠️ Could not find 'declined' or 'Declined' folder")
-            
-            # Move the email to rejected folder
-            if rejected_folder:
-                try:
-                    msg.move(rejected_folder)
-                    print(f"📁 Moved email to 'declined' folder")
-                except Exception as e:
-                    print(f"⚠️ Could not move email to rejected folder: {e}")
-            
-            # Just mark as processed without adding new tags
-            try:
-                existing_cats = set(msg.categories or [])
-                existing_cats.add("PAIRActioned")  # Only add the standard processed marker
-                msg.categories = sorted(existing_cats)
-                msg.save_message()
-                print(f"📋 Marked email as processed (rejected)")
-            except Exception as e:
-                print(f"⚠️ Could not update email categories: {e}")
-            
-            
-            # Mark as read and add to processed messages to prevent reprocessing
-            try:
-                mark_as_read(msg)
-                dedup_key = getattr(msg, 'internet_message_id', None) or msg.object_id
-                processed_messages.add(dedup_key)
-                processed_messages.add(email_id)  # Also add the email_id itself
-                print(f"✅ Marked email as processed")
-            except Exception as e:
-                print(f"⚠️ Could not mark as processed: {e}")
-            
+            for status, count in outbox.counts().items():
+                OUTBOX_ACTIONS.set(count, status=status)
+            pending_emails.publish_metrics(metrics.render(), dict(LAST_SYNC))
         except Exception as e:
-            print(f"❌ Error handling rejected email: {e}")
-        
-        # Remove from pending emails
-        del pending_emails[email_id]
-    
-    return jsonify({"status": "success", "message": f"Email rejected: {reason}"})
+            log.warning("Could not publish metrics: %s", e)
+        time.sleep(METRICS_PUBLISH_SECONDS)
+
 
+def start_web_server(hub_db):
+    """Development only: run the hub (hub.py) on Flask's server in a thread of this process."""
+    os.environ["HUB_DB"] = hub_db
+    import hub
 
-def start_web_server():
-    """Start the Flask web server in a separate thread"""
     def run_server():
-        print("🌐 Starting approval hub at http://localhost:5000")
-        app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)
-    
+        log.info("🌐 Starting approval hub at http://localhost:5000 (development server)")
+        hub.app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False, threaded=True)  # SSE holds a thread per client
+
     server_thread = threading.Thread(target=run_server, daemon=True)
     server_thread.start()
 
 
-# Start the web server
-start_web_server()
+def list_backfill_slice(folder_name, start, end):
+    """Unread messages received in [start, end) in one folder, paged 50 at a time."""
+    folder = {"INBOX": inbox_folder, "JUNK": junk_folder}[folder_name]
+    q = (folder.new_query()
+         .on_attribute('receivedDateTime').greater_equal(start)
+         .chain('and').on_attribute('receivedDateTime').less(end)
+         .chain('and').on_attribute('isRead').equals(False)
+         .select([
+             'id','conversationId','internetMessageId',
+             'isRead','receivedDateTime',
+             'from','sender','subject',
+             'categories','uniqueBody','body'
+         ]))
+    return folder.get_messages(query=q, limit=None, batch=50)
 
-inbox_delta, junk_delta = load_last_delta()
-print(f"Monitoring inbox + junk for: {EMAIL_TO_WATCH} … Ctrl-C to stop.")
-print(f"📧 Approval hub available at: http://localhost:5000")
 
-while True:
-    print(f"🔄 Checking for new emails... (Pending: {len(pending_emails)}, Processed: {len(processed_messages)})")
-    inbox_delta = process_folder(inbox_folder, "INBOX", inbox_delta)
-    junk_delta = process_folder(junk_folder, "JUNK", junk_delta)
-    #gets the new delta tokens and then saves them,
-    save_last_delta(inbox_delta, junk_delta)
-    # Also save processed messages regularly
+def backfill(days, slice_hours, workers, inbox_delta, junk_delta):
+    """
+    Process the last `days` of mail in parallel time slices, or resume an
+    unfinished backfill. Returns the (possibly newly opened) delta tokens.
+    """
+    progress = BackfillProgress("backfill_progress.json")
+    if progress.unfinished:
+        log.info("📦 Resuming backfill %s → %s (%d slice(s) left)",
+                 progress.plan['start'][:16], progress.plan['cutover'][:16], len(progress.pending()))
+    else:
+        cutover = datetime.now(timezone.utc)
+        # Open the live cursors at the cutover BEFORE backfilling, so mail that
+        # arrives while the slices run is picked up by the delta loop (no gap).
+        if not inbox_delta:
+            inbox_delta = process_folder(inbox_folder, "INBOX", None, since=cutover)
+        if not junk_delta:
+            junk_delta = process_folder(junk_folder, "JUNK", None, since=cutover)
+        save_last_delta(inbox_delta, junk_delta)
+        progress.start_new(["INBOX", "JUNK"], cutover - timedelta(days=days), cutover, slice_hours)
+        log.info("📦 Backfilling %g day(s) in %d slice(s) with %d worker(s)", days, len(progress.pending()), workers)
+
+    started = time.perf_counter()
+    done, failed = run_backfill(progress, list_backfill_slice, process_message,
+                                workers=workers, on_slice_done=lambda slc: save_processed_messages())
     save_processed_messages()
-    time.sleep(10)
\ No newline at end of file
+    log.info("📦 Backfill finished %d slice(s) in %.1fs%s; handing off to live delta",
+             done, time.perf_counter() - started, f", {failed} failed (re-run to resume)" if failed else "")
+    failed_messages = progress.failed_messages()
+    if failed_messages:
+        log.warning("⚠️ %d backfilled message(s) failed and were skipped; see %s",
+                    len(failed_messages), progress.path)
+    return inbox_delta, junk_delta
+
+
+def main(argv=None):
+    global outbox, outbox_worker, pending_emails, job_runner, router
+    parser = argparse.ArgumentParser(description="MLFA inbox automation (the approval hub is served by hub.py)")
+    parser.add_argument("--backfill-days", type=float, default=0,
+                        help="process this many days of history in parallel before going live")
+    parser.add_argument("--slice-hours", type=float, default=6, help="backfill time-slice size")
+    parser.add_argument("--backfill-workers", type=int, default=4, help="backfill worker threads")
+    parser.add_argument("--hub-db", default=os.getenv("HUB_DB", "hub.db"),
+                        help="store shared with the approval hub service (hub.py)")
+    parser.add_argument("--serve-hub", action="store_true",
+                        help="development: also serve the hub from this process on Flask's built-in server")
+    args = parser.parse_args(argv)
+    started = time.perf_counter()
+
+    load_config()
+    setup_logging()
+    router = Router(REPLY_ID_TAG)
+    outbox = Outbox("outbox.db")
+    outbox_worker = OutboxWorker(outbox, fetch_message, OUTBOX_EXECUTORS, on_give_up=release_message)
+    pending_emails = HubStore(args.hub_db)
+    job_runner = JobRunner(pending_emails, run_review_job, refresh=outbox.message_status)
+
+    inbox_delta, junk_delta, timings = warm_up()
+
+    # Keep the access token fresh ahead of expiry, inside the same connection
+    TokenRefresher(account.connection).start()
+    # Start the outbox worker and the runner for the hub's approve/reject jobs
+    outbox_worker.start()
+    job_runner.start()
+    instrument_graph()
+    threading.Thread(target=publish_metrics_forever, name="metrics", daemon=True).start()
+    if args.serve_hub:
+        start_web_server(args.hub_db)
+
+    steps = ", ".join(f"{name} {secs:.2f}s" for name, secs in sorted(timings.items()))
+    log.info("🚀 Ready in %.2fs (%s)", time.perf_counter() - started, steps)
+    log.info("Monitoring inbox + junk for: %s … Ctrl-C to stop.", EMAIL_TO_WATCH)
+    if args.serve_hub:
+        log.info("📧 Approval hub available at: http://localhost:5000")
+    else:
+        log.info("📧 Approval hub: run `gunicorn -w 4 -k gthread --threads 16 -b 0.0.0.0:5000 hub:app` (shares %s)", args.hub_db)
+
+    # An interrupted backfill is always resumed, with or without the flag
+    if args.backfill_days or BackfillProgress("backfill_progress.json").unfinished:
+        inbox_delta, junk_delta = backfill(args.backfill_days, args.slice_hours, args.backfill_workers,
+                                           inbox_delta, junk_delta)
+
+    while True:
+        # Every 10 s, so only every 30th cycle (~5 min) is logged
+        log.info("🔄 Checking for new emails... (Pending: %d, Processed: %d)",
+                 len(pending_emails), len(processed_messages), extra={"sample": 30})
+        cycle_started = time.perf_counter()
+        instrument_graph()
+        router.reload_if_changed()
+        inbox_delta = process_folder(inbox_folder, "INBOX", inbox_delta)
+        junk_delta = process_folder(junk_folder, "JUNK", junk_delta)
+        POLL_SECONDS.observe(time.perf_counter() - cycle_started)
+        #gets the new delta tokens and then saves them,
+        save_last_delta(inbox_delta, junk_delta)
+        # Also save processed messages regularly
+        save_processed_messages()
+        time.sleep(10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Parallel, resumable historical backfill.
+
+A window [start, cutover) is split into fixed-size time slices per folder and
+the slices are processed by a thread pool. Progress is written to a JSON file
+after every slice, so an interrupted run resumes with only the unfinished
+slices. The live delta cursor is opened at `cutover` BEFORE any slice runs:
+everything older is covered by the backfill, everything newer by the delta
+stream, so nothing falls in a gap. Mail that both paths see (e.g. an old
+unread message changed during the run) is dropped by the normal dedup checks.
+A message that fails is logged and recorded on its slice, and the slice
+carries on, so one bad message cannot stall the backfill.
+"""
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+log = logging.getLogger("backfill")
+
+
+def plan_slices(folders, start, cutover, slice_hours):
+    """Split [start, cutover) into slices for each folder name, newest first."""
+    slices = []
+    step = timedelta(hours=slice_hours)
+    for folder in folders:
+        end = cutover
+        while end > start:
+            begin = max(start, end - step)
+            slices.append({
+                "folder": folder,
+                "start": begin.isoformat(),
+                "end": end.isoformat(),
+                "status": "pending",
+                "messages": 0,
+            })
+            end = begin
+    return slices
+
+
+class BackfillProgress:
+    """The slice plan plus per-slice status, persisted as JSON after each change."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.plan = None
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.plan = json.load(f)
+
+    @property
+    def unfinished(self):
+        return bool(self.plan) and any(s["status"] != "done" for s in self.plan["slices"])
+
+    def start_new(self, folders, start, cutover, slice_hours):
+        self.plan = {
+            "start": start.isoformat(),
+            "cutover": cutover.isoformat(),
+            "slice_hours": slice_hours,
+            "slices": plan_slices(folders, start, cutover, slice_hours),
+        }
+        self._save()
+
+    def pending(self):
+        return [s for s in self.plan["slices"] if s["status"] != "done"]
+
+    def mark_done(self, slc, messages, failures=()):
+        """`failures` are (message id, error) pairs for messages that could not be handled."""
+        with self._lock:
+            slc["status"] = "done"
+            slc["messages"] = messages
+            if failures:
+                slc["failed"] = [{"id": message_id, "error": str(error)[:300]} for message_id, error in failures]
+            else:
+                slc.pop("failed", None)
+            self._save()
+
+    def failed_messages(self):
+        """Every message recorded as failed, with its folder."""
+        return [dict(failure, folder=s["folder"]) for s in self.plan["slices"] for failure in s.get("failed", ())]
+
+    def _save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.plan, f, indent=1)
+        os.replace(tmp, self.path)
+
+
+def run_backfill(progress, list_slice, process, workers=4, on_slice_done=None):
+    """
+    Process every unfinished slice in `progress` on a pool of `workers` threads.
+
+    `list_slice(folder_name, start, end)` yields the messages of one slice and
+    `process(msg, folder_name)` handles one message. A slice is only marked
+    done once all of its messages were tried, so a crash re-runs it (the
+    per-message dedup makes that safe). A message whose `process` raises is
+    recorded in `progress` (see failed_messages()) and skipped; a slice that
+    cannot be listed fails as a whole and is retried on resume.
+    Returns (slices_done, slices_failed).
+    """
+    todo = progress.pending()
+    if not todo:
+        return 0, 0
+
+    def run_slice(slc):
+        start = datetime.fromisoformat(slc["start"])
+        end = datetime.fromisoformat(slc["end"])
+        count, failures = 0, []
+        for msg in list_slice(slc["folder"], start, end):
+            count += 1
+            try:
+                process(msg, slc["folder"])
+            except Exception as e:
+                message_id = getattr(msg, "object_id", None)
+                log.warning("⚠️ Backfill [%s] message %s failed, skipping it: %s", slc['folder'], message_id, e)
+                failures.append((message_id, e))
+        progress.mark_done(slc, count, failures)
+        if on_slice_done:
+            on_slice_done(slc)
+        return count
+
+    done = failed = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backfill") as pool:
+        futures = {pool.submit(run_slice, slc): slc for slc in todo}
+        for future in as_completed(futures):
+            slc = futures[future]
+            try:
+                count = future.result()
+                done += 1
+                log.info("📦 Backfill [%s] %s → %s: %d message(s) (%d/%d)",
+                         slc['folder'], slc['start'][:16], slc['end'][:16], count, done, len(todo))
+            except Exception as e:
+                failed += 1
+                log.warning("⚠️ Backfill slice [%s] %s failed, will retry on resume: %s", slc['folder'], slc['start'][:16], e)
+    return done, failed
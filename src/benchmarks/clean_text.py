@@ -0,0 +1,135 @@
+"""
+Reply-text extraction speed: the old per-line strip_quoted_reply (bs4 tree,
+five selector passes, six re.match calls per line) vs cleaner.strip_quoted_reply.
+
+The corpus mimics what the mailbox actually receives: Outlook desktop/web
+replies (OutlookMessageHeader / "From: ... Sent: ..." blocks), Gmail replies
+(gmail_quote + "On ... wrote:"), Apple Mail (blockquote type=cite), plain-text
+"> " replies, and newsletters with no quoted part at all, one of them 2 MB,
+plus a 1.7 MB body of inline tags inside a single table cell (no line breaks
+at all). Peak memory shows that the cleaner's cost on the large bodies is
+bounded by the 8000-character budget, not the body size.
+
+Usage (from src/):  python benchmarks/clean_text.py [rounds]
+"""
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cleaner  # noqa: E402
+
+REPLY = ("<p>Assalamu alaikum,</p><p>Thank you for getting back to me. I have attached the court notice "
+         "and the letter from my employer. Please let me know what else you need.</p><p>Best,<br>Yusuf</p>")
+HISTORY = ("<p>Dear Yusuf, we received your intake form and an attorney will review it this week. "
+           "In the meantime please send any documents related to your case.</p>" * 20)
+
+CORPUS = {
+    "outlook": (
+        "<html><head><style>p.MsoNormal{margin:0}</style></head><body><div class=WordSection1>"
+        + REPLY.replace("<p>", "<p class=MsoNormal>")
+        + "<div style='border:none;border-top:solid #E1E1E1 1.0pt'><p class=MsoNormal><b>From:</b> MLFA Intake "
+          "&lt;info@mlfa.org&gt;<br><b>Sent:</b> Monday, March 3, 2025 9:14 AM<br><b>To:</b> Yusuf "
+          "&lt;yusuf@example.com&gt;<br><b>Subject:</b> RE: Legal help request</p></div>"
+        + HISTORY + "</div></body></html>"
+    ),
+    "outlook_web": (
+        "<html><body><div dir=ltr>" + REPLY + "</div><hr style='display:inline-block;width:98%'>"
+        "<div id=divRplyFwdMsg class=OutlookMessageHeader><font face=Calibri><b>From:</b> MLFA Intake<br>"
+        "<b>Sent:</b> Monday, March 3, 2025 9:14 AM</font></div>" + HISTORY + "</body></html>"
+    ),
+    "gmail": (
+        "<div dir=ltr>" + REPLY + "</div><br><div class=gmail_quote><div dir=ltr class=gmail_attr>"
+        "On Mon, Mar 3, 2025 at 9:14 AM MLFA Intake &lt;info@mlfa.org&gt; wrote:<br></div>"
+        "<blockquote class=gmail_quote style='margin:0 0 0 .8ex'>" + HISTORY + "</blockquote></div>"
+    ),
+    "apple_mail": (
+        "<html><head><meta http-equiv=Content-Type content='text/html; charset=utf-8'></head><body>"
+        + REPLY + "<div><br><blockquote type=cite><div>On Mar 3, 2025, at 9:14 AM, MLFA Intake "
+        "&lt;info@mlfa.org&gt; wrote:</div><br><div>" + HISTORY + "</div></blockquote></div></body></html>"
+    ),
+    "plain_text": (
+        "Assalamu alaikum,\r\n\r\nThank you, the documents are attached.\r\n\r\nYusuf\r\n\r\n"
+        "On Mon, Mar 3, 2025 at 9:14 AM MLFA Intake <info@mlfa.org> wrote:\r\n"
+        + "> Dear Yusuf, we received your intake form.\r\n" * 40
+    ),
+    "newsletter": (
+        "<html><head><style>" + "td{padding:0}" * 200 + "</style><script>var x=1;</script></head><body><table>"
+        + "<tr><td><p>Community update: new clinic hours and volunteer opportunities.</p></td></tr>" * 600
+        + "</table></body></html>"
+    ),
+    "newsletter_2mb": (
+        "<html><head><style>" + "td{padding:0}" * 2000 + "</style></head><body><table>"
+        + "<tr><td><p>Community update: new clinic hours and volunteer opportunities.</p></td></tr>" * 24000
+        + "</table></body></html>"
+    ),
+    "inline_1_7mb": (
+        "<html><body><table><tr><td>"
+        + "<span>Community update: new clinic hours and <font color=green>volunteer</font> opportunities.</span> " * 17000
+        + "</td></tr></table></body></html>"
+    ),
+}
+
+LEGACY_SEPARATORS = [
+    r'^\s*On .* wrote:\s*$',
+    r'^\s*From:\s.*$',
+    r'^\s*-----Original Message-----\s*$',
+    r'^\s*De:\s.*$',
+    r'^\s*Sent:\s.*$',
+    r'^\s*To:\s.*$',
+]
+
+
+def legacy_strip_quoted_reply(html_or_text):
+    """The implementation get_clean_message_text used before cleaner.py."""
+    if not html_or_text:
+        return ""
+    text = html_or_text
+    try:
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(html_or_text, 'html.parser')
+        for sel in cleaner.QUOTE_SELECTORS:
+            for node in soup.select(sel):
+                node.decompose()
+        text = soup.get_text("\n")
+    except Exception:
+        pass
+    out = []
+    for ln in [ln.rstrip() for ln in text.splitlines()]:
+        if ln.strip().startswith('>'):
+            break
+        if any(re.match(pat, ln, flags=re.IGNORECASE) for pat in LEGACY_SEPARATORS):
+            break
+        out.append(ln)
+    return "\n".join(out).strip()[:8000]
+
+
+def _time(fn, body, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn(body)
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def _peak(fn, body):
+    tracemalloc.start()
+    fn(body)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1024
+
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    backend = cleaner.html_to_text.__name__.replace("_text_", "") if cleaner.html_to_text else "streaming only"
+    print(f"HTML backend: {backend}, {rounds} rounds")
+    print(f"  {'format':<15} {'size':>10} {'legacy µs':>11} {'cleaner µs':>11} {'speedup':>8}"
+          f" {'legacy KiB':>11} {'cleaner KiB':>12}")
+    for name, body in CORPUS.items():
+        n = max(1, rounds * 10_000 // len(body)) if len(body) > 100_000 else rounds
+        old = _time(legacy_strip_quoted_reply, body, n)
+        new = _time(cleaner.strip_quoted_reply, body, n)
+        print(f"  {name:<15} {len(body):>10,} {old:>11,.0f} {new:>11,.0f} {old / new:>7.1f}x"
+              f" {_peak(legacy_strip_quoted_reply, body):>11,.0f} {_peak(cleaner.strip_quoted_reply, body):>12,.0f}")
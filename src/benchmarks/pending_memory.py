@@ -0,0 +1,112 @@
+"""
+Memory footprint of the pending-review queue: full O365 Message entries vs
+compact PendingEmail records.
+
+O365 is not needed to run this; a stand-in object carries the attributes a
+hydrated Message keeps in memory (HTML body + unique_body, recipients,
+attachment metadata, raw cloud data and a shared connection reference).
+
+Usage (from src/):  python benchmarks/pending_memory.py [count]
+"""
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pending import PendingEmail  # noqa: E402
+
+
+HTML_BODY = ("<html><head><style>p{margin:0}</style></head><body><div>"
+             + "<p>Assalamu alaikum, I am writing about my case. " * 400
+             + "</p><div class='gmail_quote'>" + "<blockquote>older text</blockquote>" * 100
+             + "</div></body></html>")
+CLEAN_TEXT = ("Assalamu alaikum, I am writing about my case. " * 80)[:8000]
+CLASSIFICATION = {
+    "categories": ["legal", "donor"],
+    "all_recipients": ["Mujahid.rasul@mlfa.org", "Syeda.sadiqa@mlfa.org"],
+    "needs_personal_reply": True,
+    "reason": {"legal": "Asks for representation.", "donor": "Mentions a past donation receipt."},
+    "escalation_reason": "Detailed personal narrative.",
+    "name_sender": "Jane Doe",
+}
+
+
+class _Connection:
+    pass
+
+
+class _Recipient:
+    def __init__(self, address):
+        self.address = address
+        self.name = address.split("@")[0]
+
+
+class _Received:
+    def strftime(self, fmt):
+        return "2025-01-01 09:30"
+
+
+class _FakeMessage:
+    def __init__(self, i, connection):
+        self.object_id = f"AAMkAGI2TG93AAA={i:06d}"
+        self.con = connection
+        self.body = HTML_BODY + str(i)
+        self.unique_body = HTML_BODY[: len(HTML_BODY) // 2] + str(i)
+        self.body_preview = CLEAN_TEXT[:255]
+        self.subject = f"Request for legal help #{i}"
+        self.sender = _Recipient(f"sender{i}@example.com")
+        self.to = [_Recipient("info@mlfa.org")]
+        self.cc = []
+        self.categories = ["PAIRActioned/pending_review"]
+        self.received = _Received()
+        self.attachments = [{"name": f"evidence{n}.pdf", "size": 120000, "contentType": "application/pdf"}
+                            for n in range(3)]
+        self._cloud_data = {"id": self.object_id, "body": {"content": self.body},
+                            "uniqueBody": {"content": self.unique_body}}
+
+
+def _measure(build, count):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    queue = build(count)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    assert len(queue) == count
+    return total
+
+
+def build_full(count):
+    connection = _Connection()
+    queue = {}
+    for i in range(count):
+        msg = _FakeMessage(i, connection)
+        queue[msg.object_id] = {
+            "subject": msg.subject,
+            "body": CLEAN_TEXT + str(i),
+            "classification": dict(CLASSIFICATION),
+            "sender": msg.sender.address,
+            "received": msg.received.strftime('%Y-%m-%d %H:%M'),
+            "message_obj": msg,
+        }
+    return queue
+
+
+def build_compact(count):
+    connection = _Connection()
+    queue = {}
+    for i in range(count):
+        msg = _FakeMessage(i, connection)
+        queue[msg.object_id] = PendingEmail.from_message(msg, CLEAN_TEXT + str(i), dict(CLASSIFICATION))
+        del msg  # the Message goes away once the record is built
+    return queue
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    full = _measure(build_full, count)
+    compact = _measure(build_compact, count)
+    print(f"{count} pending emails")
+    print(f"  message_obj dict entries: {full / 1024 / 1024:8.2f} MiB  ({full // count:,} B/email)")
+    print(f"  PendingEmail records:     {compact / 1024 / 1024:8.2f} MiB  ({compact // count:,} B/email)")
+    print(f"  reduction:                {100 * (1 - compact / full):7.1f} %")
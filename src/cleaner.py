@@ -0,0 +1,257 @@
+"""
+Reply-text extraction: turn a message body into just the sender's new text.
+
+Quoted history is dropped in two steps. In HTML bodies the usual quote
+containers (blockquote, Gmail's gmail_quote, Apple Mail's type=cite,
+Thunderbird's moz-cite-prefix, Outlook's OutlookMessageHeader) are removed
+before converting to text. In the resulting text everything from the first
+reply separator ("On ... wrote:", "From: ...", "-----Original Message-----",
+"> " lines, ...) onwards is cut.
+
+Bodies without any markup skip parsing entirely. Ordinary HTML bodies go
+through selectolax or lxml (C-backed, optional) when installed. Large bodies,
+or every HTML body when neither is installed, go through StreamingCleaner: a
+stdlib HTMLParser fed in chunks that drops script/style/quote blocks as it
+sees them and stops at the first separator or once MAX_CHARS of reply text
+are collected, so its work and memory are bounded by the budget rather than
+by the size of a 2 MB newsletter. The separators are one precompiled regex
+matched once per line.
+
+Benchmark: python benchmarks/clean_text.py (from src/).
+"""
+import re
+from html.parser import HTMLParser
+
+try:
+    from selectolax.parser import HTMLParser as _SelectolaxParser
+except ImportError:  # optional
+    _SelectolaxParser = None
+
+try:
+    import lxml.html as _lxml_html
+except ImportError:  # optional
+    _lxml_html = None
+
+MAX_CHARS = 8000  # what the classifier is given at most
+STREAM_THRESHOLD = 64 * 1024  # HTML bodies larger than this are always streamed
+STREAM_CHUNK = 8 * 1024
+
+QUOTE_SELECTORS = (
+    "blockquote",
+    "div.gmail_quote",
+    "div[type=cite]",
+    "div.moz-cite-prefix",
+    "div.OutlookMessageHeader",
+)
+_NOT_TEXT = "script, style, template"  # bs4's get_text() skips these too
+
+_QUOTE_XPATH = " | ".join((
+    "//blockquote",
+    "//div[contains(concat(' ', normalize-space(@class), ' '), ' gmail_quote ')]",
+    "//div[@type='cite']",
+    "//div[contains(concat(' ', normalize-space(@class), ' '), ' moz-cite-prefix ')]",
+    "//div[contains(concat(' ', normalize-space(@class), ' '), ' OutlookMessageHeader ')]",
+    "//script", "//style", "//template", "//comment()",
+))
+
+# Start of the quoted part: a line that is a "> " quote or one of the
+# separators mail clients put above the original message.
+QUOTE_SEPARATOR = re.compile(
+    r"\s*(?:"
+    r">"
+    r"|On .* wrote:\s*$"
+    r"|-----Original Message-----\s*$"
+    r"|(?:From|De|Sent|To):\s+\S"
+    r")",
+    re.IGNORECASE,
+)
+
+# A real tag, so plain text mentioning <someone@example.org> is not parsed as HTML
+_MARKUP = re.compile(r"</?[a-zA-Z][a-zA-Z0-9]*(?:\s[^<>]*)?/?>|<!--")
+
+
+def _text_selectolax(html):
+    tree = _SelectolaxParser(html)
+    # Reversed document order removes nested matches before their ancestors,
+    # so no node is touched after its subtree was freed.
+    for node in reversed(tree.css(", ".join(QUOTE_SELECTORS) + ", " + _NOT_TEXT)):
+        node.decompose()
+    root = tree.body or tree.root
+    return root.text(separator="\n") if root is not None else ""
+
+
+def _text_lxml(html):
+    root = _lxml_html.document_fromstring(html)
+    for node in reversed(root.xpath(_QUOTE_XPATH)):
+        node.drop_tree()  # keeps the node's tail text, like bs4's decompose()
+    return "\n".join(root.itertext())
+
+
+if _SelectolaxParser is not None:
+    html_to_text = _text_selectolax
+elif _lxml_html is not None:
+    html_to_text = _text_lxml
+else:
+    html_to_text = None  # every HTML body is streamed
+
+
+def cut_quoted(text):
+    """
+    Lines up to the first reply separator (trailing whitespace trimmed),
+    capped at MAX_CHARS. Stops reading at the separator or once the budget
+    is filled, whichever comes first.
+    """
+    out, size = [], 0
+    for ln in text.splitlines():
+        if QUOTE_SEPARATOR.match(ln):
+            break
+        ln = ln.rstrip()
+        out.append(ln)
+        if out[0] or ln:  # leading blank lines are stripped, so they don't count
+            size += len(ln) + 1
+            if size > MAX_CHARS:
+                break
+    return "\n".join(out).strip()[:MAX_CHARS]
+
+
+class StreamingCleaner(HTMLParser):
+    """
+    Incremental HTML-to-reply-text. Feed it chunks until `done`; text inside
+    script/style/title/template and quote containers is never collected, and
+    feeding can stop as soon as a separator line or the budget is reached.
+    The budget also counts the line still being built, so a body of inline
+    tags with no line breaks stops as early as a block-structured one.
+    """
+
+    SKIP_TAGS = {"script", "style", "title", "template"}
+    BLOCK_TAGS = {"br", "p", "div", "tr", "td", "th", "li", "ul", "ol", "table", "hr", "pre", "blockquote",
+                  "h1", "h2", "h3", "h4", "h5", "h6", "section", "article", "header", "footer"}
+    QUOTE_CLASSES = {"gmail_quote"}
+    # Headers that sit *above* the quoted history rather than wrapping it:
+    # everything after them is the old message, so reading can stop there.
+    HEADER_CLASSES = {"moz-cite-prefix", "OutlookMessageHeader"}
+    _SPACE = re.compile(r"\s+")
+
+    def __init__(self, budget=MAX_CHARS):
+        super().__init__(convert_charrefs=True)
+        self.budget = budget
+        self.done = False
+        self.lines = []
+        self._parts = []     # pieces of the line being built
+        self._pending = 0    # their total length
+        self._size = 0
+        self._skip = None    # (tag, nesting depth) of the block being dropped
+        self._pre = 0
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if self._skip is not None:
+            if tag == self._skip[0]:
+                self._skip = (tag, self._skip[1] + 1)
+            return
+        if tag == "div":
+            attrs = dict(attrs)
+            classes = set((attrs.get("class") or "").split())
+            if not self.HEADER_CLASSES.isdisjoint(classes):
+                self._end_line()
+                self.done = True
+                return
+            if attrs.get("type") == "cite" or not self.QUOTE_CLASSES.isdisjoint(classes):
+                self._skip = (tag, 1)
+        elif tag == "blockquote" or tag in self.SKIP_TAGS:
+            self._skip = (tag, 1)
+        if tag in self.BLOCK_TAGS:
+            self._end_line()
+        if tag == "pre":
+            self._pre += 1
+
+    def handle_startendtag(self, tag, attrs):
+        if not self.done and self._skip is None and tag in self.BLOCK_TAGS:
+            self._end_line()
+
+    def handle_endtag(self, tag):
+        if self.done:
+            return
+        if self._skip is not None:
+            if tag == self._skip[0]:
+                depth = self._skip[1] - 1
+                self._skip = (tag, depth) if depth else None
+            return
+        if tag == "pre":
+            self._pre = max(self._pre - 1, 0)
+        if tag in self.BLOCK_TAGS:
+            self._end_line()
+
+    def handle_data(self, data):
+        if self.done or self._skip is not None:
+            return
+        if self._pre:
+            first, *rest = data.split("\n")
+            self._add(first)
+            for piece in rest:
+                if self.done:
+                    return
+                self._end_line()
+                self._add(piece)
+        else:
+            self._add(self._SPACE.sub(" ", data))
+
+    def _add(self, piece):
+        self._parts.append(piece)
+        self._pending += len(piece)
+        if self._size + self._pending > self.budget:
+            self._end_line()
+            self.done = True
+
+    def _end_line(self):
+        line = "".join(self._parts).strip() if not self._pre else "".join(self._parts).rstrip()
+        self._parts = []
+        self._pending = 0
+        if QUOTE_SEPARATOR.match(line):
+            self.done = True
+            return
+        if not line and (not self.lines or not self.lines[-1]):
+            return  # collapse runs of blank lines
+        self.lines.append(line)
+        self._size += len(line) + 1
+        if self._size > self.budget:
+            self.done = True
+
+    def text(self):
+        if not self.done:
+            self._end_line()
+        return "\n".join(self.lines).strip()[:self.budget]
+
+
+def stream_reply_text(html, budget=MAX_CHARS):
+    """Reply text of an HTML body, reading only as much of it as the budget needs."""
+    cleaner = StreamingCleaner(budget)
+    for start in range(0, len(html), STREAM_CHUNK):
+        cleaner.feed(html[start:start + STREAM_CHUNK])
+        if cleaner.done:
+            break
+    return cleaner.text()
+
+
+def strip_quoted_reply(html_or_text):
+    """Reply-only text of an HTML or plain-text body."""
+    if not html_or_text:
+        return ""
+    if not _MARKUP.search(html_or_text):
+        return cut_quoted(html_or_text)
+    if html_to_text is None or len(html_or_text) > STREAM_THRESHOLD:
+        return stream_reply_text(html_or_text)
+    try:
+        return cut_quoted(html_to_text(html_or_text))
+    except Exception:
+        return stream_reply_text(html_or_text)
+
+
+def clean_message_text(msg):
+    """
+    Reply content of a Graph message: its unique_body (just the new text) if
+    Graph sent one, otherwise the full body with quoted history stripped.
+    """
+    body = getattr(msg, "unique_body", None) or getattr(msg, "body", None) or ""
+    return strip_quoted_reply(body)
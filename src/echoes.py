@@ -0,0 +1,99 @@
+"""
+Self-echo suppression for the delta stream.
+
+Every tag, mark-read or move we make is itself a change, so the next delta
+poll hands the same message back. Without help, process_folder would fetch
+the message and its whole conversation only to find our PAIRActioned tag.
+
+The Graph response hook records each of our mutations: the message id plus
+the changeKey Graph returned for it, and, for a move, that the id will come
+back as "@removed" from the folder it left (with immutable ids the id is
+the same in the new folder). When a delta page arrives (the same hook sees it
+before O365 turns it into Message objects), items matching a recorded
+mutation are marked as echoes, and process_folder drops them without a
+single extra request. Entries expire after `ttl` seconds. A later change by
+someone else has a different changeKey and goes through.
+
+One-shot replies and forwards (POST .../reply, .../forward) return no body,
+so the changeKey they give the original message is never seen. For
+`send_window` seconds after such a send, the next delta item for that id that
+still carries our PAIRActioned marker is taken as its echo (one item per
+send). Outside that window, and after those items, only an exact changeKey
+match counts.
+"""
+import threading
+import time
+
+ACTIONED_PREFIX = "PAIRActioned"
+
+
+class EchoRegistry:
+    """Short-lived record of our own message mutations (id -> changeKey)."""
+
+    def __init__(self, ttl=900, send_window=120):
+        self.ttl = ttl
+        self.send_window = send_window
+        self._lock = threading.Lock()
+        self._changes = {}    # message id -> (changeKey, moved away?, expiry)
+        self._sends = {}      # message id -> (unmatched one-shot sends, end of their window)
+        self._echoes = set()  # ids seen in a delta page that are only our own change
+
+    def record(self, message_id, change_key, moved=False):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._changes) > 1000:
+                self._changes = {k: v for k, v in self._changes.items() if v[2] > now}
+            self._changes[message_id] = (change_key, moved, now + self.ttl)
+
+    def record_move(self, old_id, new_id, new_change_key):
+        same_id = new_id == old_id  # immutable ids survive the move
+        self.record(old_id, new_change_key if same_id else None, moved=True)
+        if new_id and not same_id:
+            self.record(new_id, new_change_key)
+
+    def record_send(self, message_id):
+        """A one-shot reply/forward of `message_id` went out (its new changeKey is unknown)."""
+        with self._lock:
+            count, _ = self._sends.get(message_id, (0, 0))
+            self._sends[message_id] = (count + 1, time.monotonic() + self.send_window)
+
+    def _is_echo(self, item, now):
+        message_id = item.get("id")
+        entry = self._changes.get(message_id)
+        if entry is not None and entry[2] >= now:
+            change_key, moved, _ = entry
+            if "@removed" in item:
+                return moved
+            if change_key is not None and item.get("changeKey") == change_key:
+                return True
+        count, until = self._sends.get(message_id, (0, 0))
+        if count and until >= now and "@removed" not in item:
+            if any((c or "").startswith(ACTIONED_PREFIX) for c in item.get("categories") or []):
+                self._sends[message_id] = (count - 1, until)  # each send has one echo
+                return True
+        return False
+
+    def note_delta_page(self, items):
+        """Mark the echoes among the raw items of a delta page."""
+        now = time.monotonic()
+        with self._lock:
+            if len(self._sends) > 1000:
+                self._sends = {k: v for k, v in self._sends.items() if v[0] and v[1] > now}
+            for item in items:
+                if self._is_echo(item, now):
+                    self._echoes.add(item["id"])
+
+    def forget(self, message_id):
+        """Drop what we recorded for `message_id`, so its next delta item goes through."""
+        with self._lock:
+            self._changes.pop(message_id, None)
+            self._sends.pop(message_id, None)
+            self._echoes.discard(message_id)
+
+    def is_echo(self, message_id):
+        """True (once) if this delta item is only our own change coming back."""
+        with self._lock:
+            if message_id in self._echoes:
+                self._echoes.discard(message_id)
+                return True
+        return False
@@ -0,0 +1,547 @@
+"""
+Approval hub web service.
+
+A plain WSGI app that only talks to the shared store (hubstore.HubStore); it
+never touches Graph, OpenAI or the poll loop's memory, so it runs as its own
+multi-worker service and scales separately from ingestion:
+
+    gunicorn -w 4 -k gthread --threads 16 -b 0.0.0.0:5000 hub:app
+
+(threads, not just processes: every open Server-Sent Events stream holds one).
+Approve/reject take the email off the queue and queue a job that the
+ingestion process (automate-email.py) executes. For local development,
+`python hub.py` runs Flask's built-in server, or start ingestion with
+--serve-hub to run both in one process.
+"""
+import os, json, hashlib, hmac, time
+import logging
+from dotenv import load_dotenv
+from flask import Flask, Response, abort, jsonify, request, session, render_template_string, redirect, url_for, stream_with_context
+from flask_cors import CORS
+from pending import hub_detail, matches, paginate
+from hubstore import HubStore
+from logs import setup_logging
+from assets import AssetBundle, IMMUTABLE, REVALIDATE, compress_body
+
+load_dotenv()
+setup_logging()
+log = logging.getLogger("hub")
+
+# Simple password (set in .env or use default)
+ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'MLFA2024secure!')
+# Bearer token for the Prometheus scrape endpoint. Without it /metrics is
+# disabled, unless METRICS_PUBLIC=1 explicitly opens it to anyone.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+METRICS_PUBLIC = os.getenv('METRICS_PUBLIC', '').lower() in ('1', 'true', 'yes')
+
+# Flask app for approval hub
+app = Flask(__name__, static_folder=None)  # /static is served from the precompressed bundle below
+app.secret_key = os.getenv('SECRET_KEY', 'mlfa-email-hub-2024')  # Change this in production; must match across workers
+app.config['SESSION_COOKIE_SECURE'] = False  # Set to True in production with HTTPS
+app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+CORS(app, supports_credentials=True)
+
+# Pending queue + action jobs, shared with the ingestion process
+store = HubStore(os.getenv('HUB_DB', 'hub.db'))
+
+# Hub page and its CSS/JS: hashed, compressed and held in memory from startup
+HERE = os.path.dirname(os.path.abspath(__file__))
+assets = AssetBundle(os.path.join(HERE, 'static'))
+hub_page = assets.render_page(os.path.join(HERE, 'approval-hub.html'))
+
+
+def login_required(f):
+    def decorated_function(*args, **kwargs):
+        # Runs on every request, including the polls: nothing above DEBUG here
+        if not session.get('logged_in'):
+            if request.path.startswith('/api/'):
+                # For API calls, return JSON error instead of redirect
+                log.debug("API call denied - not logged in: %s", request.path)
+                return jsonify({"error": "Authentication required"}), 401
+            log.debug("Redirecting to login: %s", request.path)
+            return redirect(url_for('login'))
+        return f(*args, **kwargs)
+    decorated_function.__name__ = f.__name__
+    return decorated_function
+
+
+# Login page template
+LOGIN_TEMPLATE = '''
+<!DOCTYPE html>
+<html>
+<head>
+    <title>MLFA Email Hub - Login</title>
+    <style>
+        @import url('https://fonts.googleapis.com/css2?family=JetBrains+Mono:wght@300;400;500;600&family=Inter:wght@300;400;500;600&display=swap');
+        
+        * {
+            margin: 0;
+            padding: 0;
+            box-sizing: border-box;
+        }
+        
+        body {
+            font-family: 'Inter', -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
+            background: #0d1117;
+            color: #f0f6fc;
+            min-height: 100vh;
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            margin: 0;
+            font-size: 14px;
+            line-height: 1.5;
+        }
+        
+        .login-container {
+            width: 100%;
+            max-width: 400px;
+            padding: 20px;
+        }
+        
+        .login-header {
+            text-align: center;
+            margin-bottom: 32px;
+        }
+        
+        .login-header h1 {
+            font-family: 'JetBrains Mono', monospace;
+            font-size: 18px;
+            font-weight: 500;
+            color: #58a6ff;
+            margin: 0;
+            letter-spacing: -0.025em;
+        }
+        
+        .login-box {
+            background: #161b22;
+            padding: 32px;
+            border-radius: 6px;
+            border: 1px solid #30363d;
+            width: 100%;
+        }
+        
+        .login-box input[type="password"] {
+            width: 100%;
+            padding: 12px;
+            margin-bottom: 16px;
+            background: #0d1117;
+            border: 1px solid #30363d;
+            border-radius: 4px;
+            color: #f0f6fc;
+            font-size: 14px;
+            font-family: 'JetBrains Mono', monospace;
+            transition: border-color 0.15s ease;
+        }
+        
+        .login-box input[type="password"]:focus {
+            outline: none;
+            border-color: #58a6ff;
+        }
+        
+        .login-box input[type="password"]::placeholder {
+            color: #7d8590;
+            font-family: 'JetBrains Mono', monospace;
+        }
+        
+        .login-box button {
+            width: 100%;
+            padding: 8px 16px;
+            background: #238636;
+            border: 1px solid #238636;
+            border-radius: 4px;
+            color: #f0f6fc;
+            font-size: 13px;
+            font-weight: 500;
+            cursor: pointer;
+            font-family: 'Inter', sans-serif;
+            transition: all 0.15s ease;
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            min-height: 32px;
+        }
+        
+        .login-box button:hover {
+            background: #2ea043;
+            border-color: #2ea043;
+        }
+        
+        .error {
+            color: #f85149;
+            margin-bottom: 16px;
+            font-size: 13px;
+            font-family: 'Inter', sans-serif;
+            text-align: center;
+            padding: 8px 12px;
+            background: #0d1117;
+            border: 1px solid #da3633;
+            border-radius: 4px;
+        }
+        
+        @media (max-width: 768px) {
+            .login-container {
+                padding: 16px;
+            }
+            .login-box {
+                padding: 24px;
+            }
+        }
+    </style>
+</head>
+<body>
+    <div class="login-container">
+        <div class="login-header">
+            <h1>Approval Hub for info@mlfa.org</h1>
+        </div>
+        <div class="login-box">
+            {% if error %}
+            <div class="error">{{ error }}</div>
+            {% endif %}
+            <form method="post">
+                <input type="password" name="password" placeholder="enter password" required autofocus>
+                <button type="submit">Login</button>
+            </form>
+        </div>
+    </div>
+</body>
+</html>
+'''
+
+# Flask routes
+@app.route('/login', methods=['GET', 'POST'])
+def login():
+    if request.method == 'POST':
+        password = request.form.get('password')
+        if password == ADMIN_PASSWORD:
+            session['logged_in'] = True
+            session.permanent = True
+            log.info("✅ User logged in from %s", request.remote_addr)
+            return redirect(url_for('index'))
+        else:
+            log.warning("❌ Login failed from %s", request.remote_addr)
+            return render_template_string(LOGIN_TEMPLATE, error='Invalid password')
+    return render_template_string(LOGIN_TEMPLATE)
+
+@app.route('/logout')
+def logout():
+    session.pop('logged_in', None)
+    return redirect(url_for('login'))
+
+@app.route('/')
+@login_required
+def index():
+    return _serve_asset(hub_page, "private, " + REVALIDATE)
+
+@app.route('/static/<path:filename>')
+def static_asset(filename):
+    """Hashed names are immutable and cached for a year; plain names must revalidate."""
+    if filename in assets.by_hashed:
+        return _serve_asset(assets.by_hashed[filename], IMMUTABLE)
+    if filename in assets.by_name:
+        return _serve_asset(assets.by_name[filename], REVALIDATE)
+    abort(404)
+
+def _serve_asset(asset, cache_control):
+    encoding, body = asset.pick(request.headers.get("Accept-Encoding"))
+    headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding",
+               # the bytes differ per encoding, so only a weak validator is honest there
+               "ETag": asset.etag if encoding == "identity" else "W/" + asset.etag}
+    if asset.etag in _if_none_match():
+        return Response(status=304, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(body, content_type=asset.content_type, headers=headers)
+
+@app.after_request
+def compress_json(resp):
+    """Compress JSON API responses for clients that accept gzip/brotli."""
+    if (resp.mimetype != "application/json" or resp.direct_passthrough
+            or resp.status_code in (204, 304) or "Content-Encoding" in resp.headers):
+        return resp
+    resp.vary.add("Accept-Encoding")
+    encoding, body = compress_body(resp.get_data(), request.headers.get("Accept-Encoding"))
+    if encoding:
+        resp.set_data(body)
+        resp.headers["Content-Encoding"] = encoding
+        etag = resp.headers.get("ETag")
+        if etag and not etag.startswith("W/"):
+            resp.headers["ETag"] = "W/" + etag
+    return resp
+
+@app.route('/api/emails')
+@login_required
+def get_emails():
+    """
+    Pending emails, paginated and filterable:
+      ?limit=50&cursor=<nextCursor>&category=legal&sender=acme.org&since=2025-01-01&until=2025-01-31
+    The response carries a strong ETag derived from the queue version and the
+    query, so an unchanged poll with If-None-Match gets a body-less 304.
+    """
+    version, records = store.snapshot()  # immutable view; ingestion keeps running
+    args = request.args
+    etag = _emails_etag(version, args)
+    if etag in _if_none_match():
+        return Response(status=304, headers={"ETag": etag, "X-Queue-Version": str(version)})
+
+    try:
+        limit = min(max(int(args.get('limit', 50)), 1), 200)
+        after_seq = int(args.get('cursor') or 0)
+    except ValueError:
+        return jsonify({"error": "limit and cursor must be integers"}), 400
+
+    page, next_cursor, total = paginate(
+        records, after_seq=after_seq, limit=limit,
+        category=args.get('category'), sender=args.get('sender'),
+        since=args.get('since'), until=args.get('until'),
+    )
+
+    # Each record carries its view model pre-serialized, so the body is just a join
+    head = json.dumps({
+        "version": version,
+        "total": total,
+        "nextCursor": str(next_cursor) if next_cursor else None,
+    }, separators=(",", ":")).encode("utf-8")
+    body = head[:-1] + b',"emails":[' + b",".join(r.view_json for r in page) + b"]}"
+
+    resp = Response(body, mimetype="application/json")
+    resp.headers["ETag"] = etag
+    resp.headers["X-Queue-Version"] = str(version)
+    resp.headers["Cache-Control"] = "no-cache"  # always revalidate, 304 keeps it cheap
+    return resp
+
+@app.route('/api/emails/version')
+@login_required
+def get_emails_version():
+    """Cheap change check: the pending queue's version number."""
+    return jsonify({"version": store.version, "count": len(store)})
+
+@app.route('/api/emails/<email_id>')
+@login_required
+def get_email_detail(email_id):
+    """Body and full reasoning for one pending email, fetched when the reviewer selects it."""
+    record = store.get(email_id)
+    if record is None:
+        return jsonify({"status": "error", "message": "Email is no longer pending"}), 404
+
+    body = json.dumps(hub_detail(record), separators=(",", ":")).encode("utf-8")
+    etag = f'"{hashlib.sha1(body).hexdigest()[:16]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in _if_none_match():
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype="application/json", headers=headers)
+
+@app.route('/api/emails/stream')
+@login_required
+def stream_emails():
+    """
+    Server-Sent Events feed of queue changes: `added` carries the email,
+    `removed` carries its id, and each event id is the queue version. Resume
+    with Last-Event-ID (sent automatically by EventSource) or ?since=<version>
+    from the list response. `reset` means the client is too far behind and
+    should reload the list.
+    """
+    try:
+        since = int(request.headers.get('Last-Event-ID') or request.args.get('since') or store.version)
+    except ValueError:
+        since = store.version
+
+    def events(last):
+        yield b"retry: 3000\n\n"
+        while True:
+            changes = store.events_since(last)
+            if changes is None:
+                last = store.version
+                yield b"id: %d\nevent: reset\ndata: {}\n\n" % last
+                continue
+            for version, kind, payload in changes:
+                data = json.dumps({"id": payload}).encode("utf-8") if kind == "removed" else payload.view_json
+                yield b"id: %d\nevent: %s\ndata: %s\n\n" % (version, kind.encode("ascii"), data)
+                last = version
+            if not changes and not store.wait_for_change(last, timeout=SSE_KEEPALIVE_SECONDS):
+                yield b": keepalive\n\n"  # also lets us notice a closed connection
+
+    return Response(stream_with_context(events(since)), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # don't let a reverse proxy buffer the stream
+    })
+
+SSE_KEEPALIVE_SECONDS = 15
+
+# Differs per store database, so ETags from a wiped store never match; the
+# same in every hub worker, so any worker can answer a revalidation with 304
+_EPOCH = store.epoch
+
+def _emails_etag(version, args):
+    query = "&".join(f"{k}={v}" for k, v in sorted(args.items(multi=True)))
+    digest = hashlib.sha1(query.encode("utf-8")).hexdigest()[:12]
+    return f'"{_EPOCH}-{version}-{digest}"'
+
+def _if_none_match():
+    """Entity tags from If-None-Match, weak prefix dropped (the comparison there is weak anyway)."""
+    header = request.headers.get("If-None-Match", "")
+    return {tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()}
+
+def _accepted(job_id, message):
+    return jsonify({"status": "accepted", "message": message, "jobId": job_id,
+                    "statusUrl": url_for('get_job', job_id=job_id)}), 202
+
+def _start_review(kind, email_id, reason=None):
+    """
+    Take a pending email off the queue and queue its approve/reject job for
+    the ingestion process. Returns the job id, or None when the email is no
+    longer pending. Claiming is atomic across all hub workers, so two
+    reviewers (or a single click racing a bulk action) never both act.
+    """
+    job_id = store.claim(email_id, kind, reason)
+    if job_id is not None:
+        if kind == "approve":
+            log.info("✅ Email approved: %s - queued job %s", email_id, job_id)
+        else:
+            log.info("❌ Email rejected: %s - Reason: %s - queued job %s", email_id, reason, job_id)
+    return job_id
+
+def _reject_reason(data):
+    reason = data.get('reason') or 'No reason provided'
+    if not isinstance(reason, str):
+        raise ValueError("reason must be a string")
+    return reason
+
+@app.route('/api/emails/<email_id>/approve', methods=['POST'])
+@login_required
+def approve_email(email_id):
+    job_id = _start_review("approve", email_id)
+    if job_id is None:
+        return jsonify({"status": "error", "message": "Email is no longer pending"}), 409
+    return _accepted(job_id, "Email approved and will be processed normally")
+
+@app.route('/api/emails/<email_id>/reject', methods=['POST'])
+@login_required
+def reject_email(email_id):
+    try:
+        reason = _reject_reason(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    job_id = _start_review("reject", email_id, reason)
+    if job_id is None:
+        return jsonify({"status": "error", "message": "Email is no longer pending"}), 409
+    return _accepted(job_id, f"Email rejected: {reason}")
+
+BULK_LIMIT = 500
+BULK_FILTERS = ("category", "sender", "since", "until")
+
+def _bulk_targets(data):
+    """Email ids for a bulk request: an explicit "ids" list or a "filter" object."""
+    if "ids" in data:
+        ids = data["ids"]
+        if not isinstance(ids, list) or not all(isinstance(i, str) for i in ids):
+            raise ValueError("ids must be a list of strings")
+        if len(ids) > BULK_LIMIT:
+            raise ValueError(f"at most {BULK_LIMIT} ids per request")
+        return list(dict.fromkeys(ids))  # drop duplicates, keep order
+
+    filters = data.get("filter")
+    if not isinstance(filters, dict) or not filters:
+        raise ValueError("send either ids or a non-empty filter")
+    unknown = set(filters) - set(BULK_FILTERS)
+    if unknown:
+        raise ValueError(f"unknown filter field(s): {', '.join(sorted(unknown))}")
+    _, records = store.snapshot()
+    return [r.id for r in records if matches(r, exact=True, **filters)][:BULK_LIMIT]
+
+@app.route('/api/emails/bulk', methods=['POST'])
+@login_required
+def bulk_review():
+    """
+    Approve or reject many emails in one request:
+    {"action": "approve"|"reject", "ids": [...]} or {"action": ..., "filter": {...}}.
+    Each email becomes its own job for the ingestion process; the response lists
+    the per-item outcome ("accepted" with a jobId, or "not_pending").
+    """
+    data = request.get_json(silent=True) or {}
+    kind = data.get("action")
+    if kind not in ("approve", "reject"):
+        return jsonify({"status": "error", "message": "action must be approve or reject"}), 400
+    try:
+        reason = _reject_reason(data) if kind == "reject" else None
+        email_ids = _bulk_targets(data)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    results = []
+    for email_id in email_ids:
+        job_id = _start_review(kind, email_id, reason)
+        if job_id is None:
+            results.append({"id": email_id, "outcome": "not_pending"})
+        else:
+            results.append({"id": email_id, "outcome": "accepted", "jobId": job_id})
+
+    accepted = sum(1 for r in results if r["outcome"] == "accepted")
+    log.info("📦 Bulk %s: %d accepted, %d no longer pending", kind, accepted, len(results) - accepted)
+    return jsonify({"status": "accepted", "accepted": accepted, "results": results}), 202
+
+@app.route('/api/jobs/<job_id>')
+@login_required
+def get_job(job_id):
+    job = store.job(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown job"}), 404
+    return jsonify(job)
+
+@app.route('/api/jobs')
+@login_required
+def get_jobs():
+    """Status of several jobs at once: /api/jobs?ids=a,b,c (unknown ids are left out)."""
+    ids = [i for i in request.args.get("ids", "").split(",") if i][:BULK_LIMIT]
+    return jsonify({"jobs": store.jobs(ids)})
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """
+    Prometheus scrape target. Queue and job gauges are read from the shared
+    store at scrape time; the pipeline metrics are the latest snapshot the
+    ingestion process published there. Requires `Authorization: Bearer
+    <METRICS_TOKEN>`; with no token configured it answers 404, unless
+    METRICS_PUBLIC opts in to serving it without auth.
+    """
+    if METRICS_TOKEN:
+        supplied = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(supplied.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+            return Response("unauthorized\n", status=401, mimetype="text/plain")
+    elif not METRICS_PUBLIC:
+        abort(404)
+
+    now = time.time()
+    lines = [
+        "# HELP mlfa_pending_queue_depth Emails waiting for review",
+        "# TYPE mlfa_pending_queue_depth gauge",
+        f"mlfa_pending_queue_depth {len(store)}",
+        "# HELP mlfa_review_jobs Approve/reject jobs by status",
+        "# TYPE mlfa_review_jobs gauge",
+    ]
+    lines += [f'mlfa_review_jobs{{status="{status}"}} {count}' for status, count in sorted(store.job_counts().items())]
+
+    published = store.published_metrics()
+    if published:
+        lines += [
+            "# HELP mlfa_seconds_since_last_sync Seconds since the last completed delta poll of a folder",
+            "# TYPE mlfa_seconds_since_last_sync gauge",
+        ]
+        lines += [f'mlfa_seconds_since_last_sync{{folder="{folder}"}} {now - ts:.1f}'
+                  for folder, ts in sorted(published["last_sync"].items())]
+        lines += [
+            "# HELP mlfa_ingest_metrics_age_seconds Age of the ingestion process's last metrics snapshot",
+            "# TYPE mlfa_ingest_metrics_age_seconds gauge",
+            f"mlfa_ingest_metrics_age_seconds {now - published['published']:.1f}",
+        ]
+        body = "\n".join(lines) + "\n" + published["text"]
+    else:
+        body = "\n".join(lines) + "\n"
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
+
+if __name__ == "__main__":
+    log.info("🌐 Starting approval hub at http://localhost:5000 (development server)")
+    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)  # SSE holds a thread per client
@@ -0,0 +1,326 @@
+"""
+Shared SQLite store between the ingestion process and the approval hub.
+
+The hub runs as its own multi-worker WSGI service (see hub.py), so the pending
+queue and reviewer action jobs can no longer live in process globals. Both
+sides open the same database file (WAL mode, so hub readers never block the
+poll loop's writes):
+
+- ingestion adds pending emails and executes queued jobs;
+- hub workers read the queue, and a reviewer's approve/reject atomically
+  removes the email and queues a job for ingestion to run.
+
+Every queue change bumps a global version and is appended to a short change
+log, which the hub's ETags, pagination snapshots and Server-Sent Events use
+exactly as they used the old in-memory queue.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+EVENT_LOG_SIZE = 1000
+WAIT_POLL_INTERVAL = 0.5  # seconds between version checks in wait_for_change()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pending (
+    seq            INTEGER PRIMARY KEY AUTOINCREMENT,
+    id             TEXT NOT NULL UNIQUE,
+    sender         TEXT NOT NULL,
+    subject        TEXT NOT NULL,
+    received       TEXT NOT NULL,
+    classification TEXT NOT NULL,
+    body           TEXT NOT NULL,
+    view_json      BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    version  INTEGER PRIMARY KEY,
+    kind     TEXT NOT NULL,
+    email_id TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id       TEXT PRIMARY KEY,
+    kind     TEXT NOT NULL,
+    email_id TEXT NOT NULL,
+    subject  TEXT NOT NULL,
+    payload  TEXT NOT NULL,
+    status   TEXT NOT NULL DEFAULT 'queued',
+    error    TEXT,
+    created  REAL NOT NULL,
+    updated  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_email ON jobs (email_id);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+"""
+
+
+class StoredEmail:
+    """A pending email as read back from the store (same fields the hub uses on PendingEmail)."""
+
+    __slots__ = ("id", "sender", "subject", "received", "body", "classification", "seq", "view_json")
+
+    def __init__(self, seq, id, sender, subject, received, classification, view_json, body=None):
+        self.seq = seq
+        self.id = id
+        self.sender = sender
+        self.subject = subject
+        self.received = received
+        self.classification = json.loads(classification)
+        self.view_json = bytes(view_json)
+        self.body = body  # only loaded by get(); list views never need it
+
+
+_LIST_COLUMNS = "seq, id, sender, subject, received, classification, view_json"
+
+
+class HubStore:
+    """
+    The pending queue plus the action-job table, shared through one SQLite file.
+
+    Safe to use from many threads and processes: each thread gets its own
+    connection, and every write is a short IMMEDIATE transaction.
+    """
+
+    def __init__(self, path="hub.db"):
+        self.path = path
+        self._local = threading.local()
+        self._snapshot = (None, ())
+        self._snapshot_lock = threading.Lock()
+        # Schema setup on a throwaway connection, so nothing is inherited
+        # across a pre-fork WSGI server's fork()
+        db = self._connect()
+        db.executescript(SCHEMA)
+        db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', '0')")
+        db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)", (os.urandom(4).hex(),))
+        db.close()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    @property
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = self._local.db = self._connect()
+            self._local.pid = os.getpid()
+        return db
+
+    def _write(self):
+        """Context manager for one IMMEDIATE write transaction."""
+        return _Transaction(self._db)
+
+    # --- queue versioning ---
+
+    @property
+    def version(self):
+        return int(self._db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0])
+
+    @property
+    def epoch(self):
+        """Random id of this database; versions from another epoch are meaningless."""
+        return self._db.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+
+    def _record_change(self, db, kind, email_id):
+        # caller holds a write transaction
+        version = int(db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]) + 1
+        db.execute("UPDATE meta SET value = ? WHERE key = 'version'", (str(version),))
+        db.execute("INSERT INTO events (version, kind, email_id) VALUES (?, ?, ?)", (version, kind, email_id))
+        db.execute("DELETE FROM events WHERE version <= ?", (version - EVENT_LOG_SIZE,))
+        return version
+
+    # --- pending queue (ingestion writes, hub reads) ---
+
+    def add(self, record):
+        """
+        Enqueue a PendingEmail. Returns False if it is already pending or a
+        reviewer has already acted on it (a job exists for its id).
+        """
+        with self._write() as db:
+            if db.execute("SELECT 1 FROM pending WHERE id = ? UNION ALL "
+                          "SELECT 1 FROM jobs WHERE email_id = ? LIMIT 1",
+                          (record.id, record.id)).fetchone():
+                return False
+            cur = db.execute(
+                "INSERT INTO pending (id, sender, subject, received, classification, body, view_json) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (record.id, record.sender, record.subject, record.received,
+                 json.dumps(record.classification), record.body, record.view_json),
+            )
+            record.seq = cur.lastrowid
+            self._record_change(db, "added", record.id)
+            return True
+
+    def get(self, email_id):
+        row = self._db.execute(f"SELECT {_LIST_COLUMNS}, body FROM pending WHERE id = ?", (email_id,)).fetchone()
+        return StoredEmail(*row) if row else None
+
+    def snapshot(self):
+        """
+        (version, records) in queue order, without bodies. Cached per process
+        until the version moves, so repeated polls cost one tiny query.
+        """
+        version = self.version
+        snap = self._snapshot
+        if snap[0] == version:
+            return snap
+        with self._snapshot_lock:
+            if self._snapshot[0] != version:
+                db = self._db
+                db.execute("BEGIN")  # version and rows from the same read snapshot
+                try:
+                    version = int(db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0])
+                    rows = db.execute(f"SELECT {_LIST_COLUMNS} FROM pending ORDER BY seq").fetchall()
+                finally:
+                    db.execute("COMMIT")
+                self._snapshot = (version, tuple(StoredEmail(*row) for row in rows))
+            return self._snapshot
+
+    def events_since(self, version):
+        """
+        Changes after `version`, oldest first, as (version, kind, record-or-id).
+        Returns None when `version` is ahead of the store or has fallen out of
+        the change log, in which case the caller must reload the full list.
+        """
+        current = self.version
+        if version > current:
+            return None
+        if version == current:
+            return []
+        rows = self._db.execute(
+            "SELECT version, kind, email_id FROM events WHERE version > ? ORDER BY version", (version,)
+        ).fetchall()
+        if not rows or rows[0][0] != version + 1:
+            return None
+        changes = []
+        for v, kind, email_id in rows:
+            if kind == "removed":
+                changes.append((v, kind, email_id))
+                continue
+            record = self.get(email_id)
+            if record is not None:  # otherwise a later "removed" event follows
+                changes.append((v, kind, record))
+        return changes
+
+    def wait_for_change(self, version, timeout):
+        """Poll until the store moves past `version` or `timeout` seconds pass."""
+        deadline = time.monotonic() + timeout
+        while self.version == version:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(WAIT_POLL_INTERVAL, remaining))
+        return True
+
+    def __contains__(self, email_id):
+        return self._db.execute("SELECT 1 FROM pending WHERE id = ?", (email_id,)).fetchone() is not None
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+
+    # --- action jobs (hub queues, ingestion runs) ---
+
+    def claim(self, email_id, kind, reason=None):
+        """
+        Atomically take an email off the queue and queue a `kind` job
+        ("approve" or "reject") for it. Returns the job id, or None if the
+        email is no longer pending, so exactly one reviewer wins.
+        """
+        with self._write() as db:
+            row = db.execute("SELECT subject, classification FROM pending WHERE id = ?", (email_id,)).fetchone()
+            if row is None:
+                return None
+            subject, classification = row
+            job_id = uuid.uuid4().hex
+            now = time.time()
+            payload = json.dumps({"classification": json.loads(classification), "reason": reason})
+            db.execute("DELETE FROM pending WHERE id = ?", (email_id,))
+            db.execute(
+                "INSERT INTO jobs (id, kind, email_id, subject, payload, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, email_id, subject, payload, now, now),
+            )
+            self._record_change(db, "removed", email_id)
+            return job_id
+
+    def job(self, job_id):
+        jobs = self.jobs([job_id])
+        return jobs[0] if jobs else None
+
+    def jobs(self, job_ids):
+        """Status dicts for the given job ids (unknown ids are left out)."""
+        if not job_ids:
+            return []
+        marks = ",".join("?" * len(job_ids))
+        rows = self._db.execute(
+            f"SELECT id, kind, email_id, subject, status, error, created, updated FROM jobs WHERE id IN ({marks})",
+            list(job_ids),
+        ).fetchall()
+        keys = ("id", "kind", "emailId", "subject", "status", "error", "created", "updated")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def take_jobs(self, limit):
+        """Mark up to `limit` queued jobs as running and return them, oldest first."""
+        with self._write() as db:
+            rows = db.execute(
+                "SELECT id, kind, email_id, subject, payload FROM jobs WHERE status = 'queued' "
+                "ORDER BY created LIMIT ?", (limit,),
+            ).fetchall()
+            db.executemany("UPDATE jobs SET status = 'running', updated = ? WHERE id = ?",
+                           [(time.time(), r[0]) for r in rows])
+        return [{"id": r[0], "kind": r[1], "emailId": r[2], "subject": r[3], "payload": json.loads(r[4])}
+                for r in rows]
+
+    def unsettled_jobs(self):
+        """(job_id, email_id) of jobs whose outbox actions are still being retried."""
+        return self._db.execute(
+            "SELECT id, email_id FROM jobs WHERE status IN ('pending', 'retrying')"
+        ).fetchall()
+
+    def set_job(self, job_id, status, error=None):
+        with self._write() as db:
+            db.execute("UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ?",
+                       (status, error, time.time(), job_id))
+
+    def requeue_running(self):
+        """After a restart, jobs that were mid-run go back to the queue (planning is idempotent)."""
+        with self._write() as db:
+            return db.execute("UPDATE jobs SET status = 'queued', updated = ? WHERE status = 'running'",
+                              (time.time(),)).rowcount
+
+
+    # --- metrics hand-off (ingestion publishes, hub /metrics serves) ---
+
+    def publish_metrics(self, text, last_sync):
+        """Store ingestion's rendered metrics and its per-folder last-sync timestamps."""
+        snapshot = json.dumps({"text": text, "last_sync": last_sync, "published": time.time()})
+        with self._write() as db:
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('ingest_metrics', ?)", (snapshot,))
+
+    def published_metrics(self):
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'ingest_metrics'").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def job_counts(self):
+        return dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+class _Transaction:
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
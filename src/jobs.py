@@ -0,0 +1,77 @@
+"""
+Runs reviewer action jobs queued by the approval hub.
+
+approve/reject in the hub only validate the request, take the email off the
+shared queue and write a job row (see HubStore.claim); the hub answers 202 with
+the job id straight away. This runner lives in the ingestion process, which
+owns the Graph connection and the outbox: it picks queued jobs from the store,
+runs them on a small thread pool and writes their status back, so the hub can
+report completion by polling /api/jobs/<id>.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger("jobs")
+
+
+class JobRunner:
+    """
+    Polls `store` for queued jobs and runs `handler(job)` for each.
+
+    `handler` returns the job's (status, error), status being "done",
+    "retrying" or "failed"; raising marks the job failed. Jobs left "pending"/"retrying"
+    are re-checked with `refresh(email_id)` -> (status, error) on every pass,
+    so later background retries are reflected too.
+    """
+
+    def __init__(self, store, handler, refresh=None, workers=4, poll_interval=1):
+        self.store = store
+        self.handler = handler
+        self.refresh = refresh
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hub-job")
+        self._slots = threading.BoundedSemaphore(workers * 2)  # don't take more than we can start soon
+        self._wake = threading.Event()
+
+    def start(self):
+        requeued = self.store.requeue_running()
+        if requeued:
+            log.info("🔁 Re-queued %d action job(s) interrupted by the last shutdown", requeued)
+        threading.Thread(target=self._run, name="job-runner", daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self._dispatch()
+                if self.refresh:
+                    for job_id, email_id in self.store.unsettled_jobs():
+                        status, error = self.refresh(email_id)
+                        if status not in (None, "pending", "retrying"):
+                            self.store.set_job(job_id, status, error)
+            except Exception as e:
+                log.exception("⚠️ Job runner error: %s", e)
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _dispatch(self):
+        free = 0
+        while self._slots.acquire(blocking=False):
+            free += 1
+        jobs = self.store.take_jobs(free) if free else []
+        for _ in range(free - len(jobs)):
+            self._slots.release()
+        for job in jobs:
+            self._pool.submit(self._execute, job)
+
+    def _execute(self, job):
+        try:
+            status, error = self.handler(job)
+            self.store.set_job(job["id"], status or "done", error)
+        except Exception as e:
+            log.warning("⚠️ %s job for %s failed: %s", job['kind'], job['emailId'], e)
+            self.store.set_job(job["id"], "failed", str(e))
+        finally:
+            self._slots.release()
+            self._wake.set()  # a slot is free again
@@ -0,0 +1,110 @@
+"""
+Logging setup shared by the ingestion process and the hub service.
+
+Every module logs through `logging.getLogger(__name__)`-style loggers ("mlfa",
+"hub", "outbox", ...). setup_logging() installs a QueueHandler on the root
+logger: call sites only enqueue a record, and a QueueListener thread does the
+formatting and the (blocking) stdout writes, so the poll loop and request
+threads never wait on the console.
+
+Configuration comes from the environment:
+
+    LOG_LEVEL=INFO                      default level
+    LOG_LEVELS=hub=WARNING,outbox=DEBUG per-logger overrides
+    LOG_FORMAT=text|json                json = one object per line, extras included
+
+High-frequency events can be sampled by passing `extra={"sample": N}`: only
+every Nth record with the same logger and message template is emitted (with a
+`sampled` count of how many it stands for).
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, msg, plus any extra fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and key != "sample":
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep one in `record.sample` records per (logger, message template)."""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def filter(self, record):
+        every = getattr(record, "sample", None)
+        if not every or every <= 1:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            count = self._counts.get(key, 0) + 1
+            self._counts[key] = count % every
+        if count == 1:
+            record.sampled = every
+            return True
+        return False
+
+
+_listener = None
+
+
+def setup_logging(level=None, fmt=None):
+    """Install the queue-backed root handler. Safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return
+
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT", "text")).lower()
+
+    stream = logging.StreamHandler(sys.stdout)
+    if fmt == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s %(name)s: %(message)s", "%H:%M:%S"))
+
+    records = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(records)
+    handler.addFilter(SamplingFilter())  # drop sampled-out records before they are queued
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+
+    for item in filter(None, os.getenv("LOG_LEVELS", "").split(",")):
+        name, _, name_level = item.partition("=")
+        logging.getLogger(name.strip()).setLevel(name_level.strip().upper() or level)
+
+    # Chatty third-party loggers stay at WARNING unless asked for explicitly
+    for noisy in ("urllib3", "requests_oauthlib", "O365", "httpx", "openai", "werkzeug"):
+        if noisy not in os.getenv("LOG_LEVELS", ""):
+            logging.getLogger(noisy).setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(records, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)  # flush what is still queued on exit
@@ -0,0 +1,261 @@
+"""
+Idempotent outbox for outbound mailbox actions.
+
+Every side effect we plan for a message (update, reply, forward, move)
+is first written as a record keyed by (message_id, action). Writing the same
+record twice is a no-op, so re-planning a half-handled email never produces a
+duplicate reply or forward. A background worker then executes due records in
+a fixed per-message order, retrying failures with exponential backoff.
+When an action gives up, the actions after it are marked "blocked" and never
+run, so a message is not left half-handled (forward lost, but moved anyway),
+and the worker's `on_give_up` hook lets the caller surface the message again.
+"""
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+
+import metrics
+
+log = logging.getLogger("outbox")
+
+ACTION_FAILURES = metrics.Counter("mlfa_outbox_action_failures_total",
+                                  "Outbox action attempts that failed", ("action", "status"))
+ACTIONS_DONE = metrics.Counter("mlfa_outbox_actions_done_total", "Outbox actions executed successfully", ("action",))
+
+# Execution order within one message. "update" (categories + read state in one
+# PATCH) goes first so the processed marker is on the message before anything
+# is sent; "move" is last so the message stays in the inbox, where staff look
+# for it, until the reply and forward have actually gone out. (Ids are
+# immutable, so the move itself no longer strands later actions.)
+ACTION_ORDER = ("update", "reply", "forward", "move")
+
+MAX_ATTEMPTS = 6
+BACKOFF_BASE = 5      # seconds; doubled on each failed attempt
+BACKOFF_MAX = 600     # cap a single wait at 10 minutes
+
+
+class Outbox:
+    """SQLite-backed store of planned actions, safe to share between threads."""
+
+    def __init__(self, path="outbox.db"):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS actions (
+                message_id   TEXT NOT NULL,
+                action       TEXT NOT NULL,
+                payload      TEXT NOT NULL,
+                status       TEXT NOT NULL DEFAULT 'pending',
+                attempts     INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL DEFAULT 0,
+                last_error   TEXT,
+                created      REAL NOT NULL,
+                PRIMARY KEY (message_id, action)
+            )
+        """)
+        self._db.commit()
+
+    def enqueue(self, message_id, action, payload=None):
+        """Record an action once. Returns True if it was new, False if already planned."""
+        if action not in ACTION_ORDER:
+            raise ValueError(f"Unknown outbox action: {action}")
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT OR IGNORE INTO actions (message_id, action, payload, created) VALUES (?, ?, ?, ?)",
+                (message_id, action, json.dumps(payload or {}), time.time()),
+            )
+            self._db.commit()
+            return cur.rowcount == 1
+
+    def due_messages(self, limit=20):
+        """Message IDs that have at least one pending action ready to run and none that gave up."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT DISTINCT message_id FROM actions AS a WHERE status = 'pending' AND next_attempt <= ? "
+                "AND NOT EXISTS (SELECT 1 FROM actions WHERE message_id = a.message_id AND status = 'failed') "
+                "ORDER BY created LIMIT ?",
+                (time.time(), limit),
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def pending_actions(self, message_id):
+        """Pending (action, payload, attempts) for a message, in execution order."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT action, payload, attempts FROM actions WHERE message_id = ? AND status = 'pending'",
+                (message_id,),
+            ).fetchall()
+        rows.sort(key=lambda r: ACTION_ORDER.index(r[0]))
+        return [(action, json.loads(payload), attempts) for action, payload, attempts in rows]
+
+    def mark_done(self, message_id, action):
+        with self._lock:
+            self._db.execute(
+                "UPDATE actions SET status = 'done', last_error = NULL WHERE message_id = ? AND action = ?",
+                (message_id, action),
+            )
+            self._db.commit()
+
+    def mark_failed(self, message_id, action, attempts, error):
+        """
+        Schedule a retry with backoff, or give up after MAX_ATTEMPTS. Giving
+        up blocks the message's pending actions that come later in ACTION_ORDER.
+        """
+        attempts += 1
+        if attempts >= MAX_ATTEMPTS:
+            status, next_attempt = "failed", 0
+        else:
+            delay = min(BACKOFF_BASE * (2 ** (attempts - 1)), BACKOFF_MAX)
+            status, next_attempt = "pending", time.time() + delay + random.uniform(0, delay / 4)
+        with self._lock:
+            self._db.execute(
+                "UPDATE actions SET status = ?, attempts = ?, next_attempt = ?, last_error = ? "
+                "WHERE message_id = ? AND action = ?",
+                (status, attempts, next_attempt, str(error)[:500], message_id, action),
+            )
+            later = ACTION_ORDER[ACTION_ORDER.index(action) + 1:]
+            if status == "failed" and later:
+                self._db.execute(
+                    "UPDATE actions SET status = 'blocked', last_error = ? WHERE message_id = ? "
+                    f"AND status = 'pending' AND action IN ({', '.join('?' * len(later))})",
+                    (f"blocked: {action} failed", message_id, *later),
+                )
+            self._db.commit()
+        return status
+
+    def reopen(self, message_id, redo=("update",)):
+        """
+        If one of a message's actions gave up, forget its failed and blocked
+        actions (and the `redo` ones), so planning it again enqueues them
+        afresh while the actions that did succeed stay recorded and are never
+        repeated. Does nothing for a message that never gave up.
+        """
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM actions WHERE message_id = ? "
+                "AND EXISTS (SELECT 1 FROM actions WHERE message_id = ? AND status = 'failed') "
+                f"AND (status IN ('failed', 'blocked') OR action IN ({', '.join('?' * len(redo))}))",
+                (message_id, message_id, *redo),
+            )
+            self._db.commit()
+
+    def message_status(self, message_id):
+        """
+        Overall (status, last_error) of a message's actions: "failed" if any
+        action gave up (the ones after it are "blocked"), "retrying" if one
+        failed but will be retried, "pending" if work remains, "done" when
+        everything ran, or None if nothing was ever planned for it.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT status, attempts, last_error FROM actions WHERE message_id = ?",
+                (message_id,),
+            ).fetchall()
+        if not rows:
+            return None, None
+        errors = [e for _, _, e in rows if e]
+        last_error = errors[-1] if errors else None
+        statuses = {s for s, _, _ in rows}
+        if "failed" in statuses:
+            return "failed", next(e for s, _, e in rows if s == "failed")
+        if "pending" in statuses:
+            retrying = any(s == "pending" and a > 0 for s, a, _ in rows)
+            return ("retrying" if retrying else "pending"), last_error
+        return "done", None
+
+    def counts(self):
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM actions GROUP BY status").fetchall()
+        return dict(rows)
+
+
+class OutboxWorker:
+    """
+    Drains the outbox on a background thread.
+
+    `fetch_message(message_id)` loads the Graph message once per batch and
+    `executors` maps each action name to `fn(msg, payload)`. An executor
+    signals failure by raising; later actions for the same message wait while
+    the failed one is retried and are blocked if it gives up, so a failed
+    forward never lets the move run. `on_give_up(message_id, msg)` is then
+    called once, so the message does not stay marked as handled.
+    """
+
+    def __init__(self, outbox, fetch_message, executors, poll_interval=2, on_give_up=None):
+        self.outbox = outbox
+        self.fetch_message = fetch_message
+        self.executors = executors
+        self.on_give_up = on_give_up
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._thread = None
+        self._busy_lock = threading.Lock()
+        self._busy = set()  # message ids currently being executed by some thread
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="outbox-worker", daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        """Wake the worker early after new actions were enqueued."""
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            try:
+                for message_id in self.outbox.due_messages():
+                    self.run_message(message_id)
+            except Exception as e:
+                log.exception("⚠️ Outbox worker error: %s", e)
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def run_message(self, message_id):
+        """
+        Execute a message's pending actions now. Safe to call from any thread:
+        if another thread is already running this message, returns False
+        without doing anything (the other run covers it).
+        """
+        with self._busy_lock:
+            if message_id in self._busy:
+                return False
+            self._busy.add(message_id)
+        try:
+            self._execute(message_id)
+        finally:
+            with self._busy_lock:
+                self._busy.discard(message_id)
+        return True
+
+    def _execute(self, message_id):
+        actions = self.outbox.pending_actions(message_id)
+        if not actions:
+            return
+        try:
+            msg = self.fetch_message(message_id)
+            if msg is None:
+                raise LookupError("message not found")
+        except Exception as e:
+            action, _, attempts = actions[0]
+            status = self.outbox.mark_failed(message_id, action, attempts, f"fetch failed: {e}")
+            ACTION_FAILURES.inc(action="fetch", status=status)
+            return
+
+        for action, payload, attempts in actions:
+            try:
+                self.executors[action](msg, payload)
+            except Exception as e:
+                status = self.outbox.mark_failed(message_id, action, attempts, e)
+                ACTION_FAILURES.inc(action=action, status=status)
+                log.warning("⚠️ Outbox %s failed for %s (attempt %d, %s): %s", action, message_id, attempts + 1, status, e)
+                if status == "failed" and self.on_give_up:
+                    try:
+                        self.on_give_up(message_id, msg)
+                    except Exception as hook_error:
+                        log.error("⚠️ Could not release %s after %s gave up: %s", message_id, action, hook_error)
+                return  # keep the remaining actions queued behind this one
+            self.outbox.mark_done(message_id, action)
+            ACTIONS_DONE.inc(action=action)
@@ -0,0 +1,120 @@
+"""
+Pending-review records and hub views. The records themselves are persisted
+in the store shared with the hub service (hubstore.HubStore).
+
+Only the fields the hub and the approve/reject path need are kept per email.
+The full O365 Message (HTML body, attachment metadata, connection reference)
+is NOT held in memory; it is fetched on demand by id when a reviewer acts.
+"""
+import json
+
+
+class PendingEmail:
+    """Compact record for one email awaiting human review."""
+
+    __slots__ = ("id", "sender", "subject", "received", "body", "classification", "seq", "view_json")
+
+    def __init__(self, id, sender, subject, received, body, classification):
+        self.id = id
+        self.sender = sender or ""
+        self.subject = subject or ""
+        self.received = received or ""      # 'YYYY-MM-DD HH:MM' string, as shown in the hub
+        self.body = body or ""              # cleaned reply text (already capped at 8,000 chars)
+        self.classification = classification or {}
+        self.seq = 0                        # queue position, assigned by HubStore.add()
+        # Hub list entry, formatted and serialized once here instead of on every poll
+        self.view_json = json.dumps(hub_summary(self), separators=(",", ":")).encode("utf-8")
+
+    @classmethod
+    def from_message(cls, msg, body, classification):
+        """Build a record from an O365 Message without keeping a reference to it."""
+        return cls(
+            id=msg.object_id,
+            sender=msg.sender.address if msg.sender else "",
+            subject=msg.subject,
+            received=msg.received.strftime('%Y-%m-%d %H:%M') if msg.received else "",
+            body=body,
+            classification=classification,
+        )
+
+    def __repr__(self):
+        return f"PendingEmail(id={self.id!r}, subject={self.subject!r})"
+
+
+def hub_summary(record):
+    """
+    The approval hub's list entry for one pending record. Deliberately small:
+    the body and the classifier's reasoning are only sent by hub_detail(),
+    when a reviewer actually opens the email.
+    """
+    classification = record.classification
+    categories = classification.get('categories', [])
+    category_display = ', '.join([cat.replace('_', ' ').title() for cat in categories])
+
+    return {
+        "id": record.id,
+        "subject": record.subject,
+        "sender": record.sender,
+        "received": record.received,
+        "meta": f"FROM: [INBOX] {record.received} | {record.sender} | {record.subject}",
+        "senderName": classification.get('name_sender', 'Unknown'),
+        "categories": categories,
+        "category": category_display,
+        "status": "pending"
+    }
+
+
+def hub_detail(record):
+    """Everything the hub shows for the selected email: summary, reasoning and body."""
+    classification = record.classification
+
+    recipients = classification.get('all_recipients', [])
+    recipients_display = ', '.join(recipients) if recipients else 'None'
+
+    reasons = classification.get('reason', {})
+    reason_display = '; '.join(reasons.values()) if reasons else 'No reason provided'
+
+    return {
+        **hub_summary(record),
+        "recipients": recipients_display,
+        "needsReply": "Yes" if classification.get('needs_personal_reply', False) else "No",
+        "reason": reason_display,
+        "reasons": reasons,
+        "escalation": classification.get('escalation_reason') or 'None',
+        "originalContent": record.body,
+    }
+
+
+def matches(record, category=None, sender=None, since=None, until=None, exact=False):
+    """
+    Filter used by the hub list and bulk endpoints. `category` must be one of
+    the record's categories, `sender` is a case-insensitive substring (the
+    whole address, still case-insensitive, with `exact`, which bulk actions
+    use so "a@x.org" never selects "ba@x.org"), and `since`/`until` compare
+    against the 'YYYY-MM-DD HH:MM' received string (so a plain 'YYYY-MM-DD'
+    prefix works too; `until` is inclusive of that day).
+    """
+    if category and category not in (record.classification.get("categories") or []):
+        return False
+    if sender:
+        wanted, actual = sender.strip().lower(), (record.sender or "").strip().lower()
+        if (wanted != actual) if exact else (wanted not in actual):
+            return False
+    if since and record.received < since:
+        return False
+    if until and record.received[:len(until)] > until:
+        return False
+    return True
+
+
+def paginate(records, after_seq=0, limit=50, **filters):
+    """
+    One page of `records` (in queue order) with seq > after_seq that match
+    `filters`. Returns (page, next_cursor, total_matching); next_cursor is
+    None on the last page.
+    """
+    selected = [r for r in records if matches(r, **filters)]
+    remaining = [r for r in selected if r.seq > after_seq]
+    page = remaining[:limit]
+    next_cursor = page[-1].seq if len(remaining) > limit else None
+    return page, next_cursor, len(selected)
@@ -0,0 +1,220 @@
+"""
+Category routing: who gets a forward, which reply goes out, where the message
+is moved and whether it stays unread, per classifier category.
+
+The rules are data, not code. DEFAULT_CONFIG below is used unless a JSON file
+with the same shape exists at ROUTING_CONFIG (default routing.json in the
+working directory). The file is compiled once into a RoutingTable of
+precomputed structures, and Router.reload_if_changed() picks up edits on the
+next poll cycle, so changing a recipient does not need a restart (which would
+mean re-authenticating and resyncing). A file that fails to load is logged
+and the previous table stays in effect.
+
+RoutingTable.plan() reduces a classification with any number of categories
+to one Plan per message: at most one reply (the highest-priority route's),
+one forward to the union of recipients, one categories + read-state update
+and at most one move.
+
+    python routing.py > routing.json    # start from the built-in defaults
+"""
+import json
+import logging
+import os
+import re
+import textwrap
+
+log = logging.getLogger("routing")
+
+DEFAULT_CONFIG = {
+    # Staff addresses: replies from them carrying the reply tag are routed back to the original sender
+    "staff": [
+        "Mujahid.rasul@mlfa.org", "Syeda.sadiqa@mlfa.org", "Arshia.ali.khan@mlfa.org", "Maria.laura@mlfa.org",
+        "info@mlfa.org", "aisha.ukiu@mlfa.org", "shawn@strategichradvisory.com", "m.ahmad0826@gmail.com",
+    ],
+    # Reply bodies; {name_sender} is replaced with the sender's name
+    "templates": {
+        "legal_personal": """
+            <p>Dear {name_sender},</p>
+
+            <p>Thank you for contacting the Muslim Legal Fund of America (MLFA).
+            We are grateful that you reached out and placed your trust in us to potentially support your legal matter.</p>
+
+            <p>If you have not already done so, please submit a formal application for legal assistance through our website:<br>
+            <a href="https://mlfa.org/application-for-legal-assistance/">https://mlfa.org/application-for-legal-assistance/</a></p>
+
+            <p>Once submitted, our team will carefully review your application and follow up with next steps.
+            If you have any questions about the application process or need help completing it, please don't hesitate to reach out.</p>
+
+            <p>We appreciate your patience as we work through applications, and we look forward to learning more about how we might be able to help.</p>
+
+            <p>Warm regards,<br>
+            The MLFA Team<br>
+            Muslim Legal Fund of America</p>
+        """,
+        "legal": """
+            <p>Dear {name_sender},</p>
+
+            <p>Thank you for contacting the Muslim Legal Fund of America (MLFA).</p>
+
+            <p>If you have not already done so, please submit a formal application for legal assistance
+            through our website:<br>
+            <a href="https://mlfa.org/application-for-legal-assistance/">https://mlfa.org/application-for-legal-assistance/</a></p>
+
+            <p>This ensures our legal team has the information needed to review your case promptly.</p>
+
+            <p>Sincerely,<br>
+            The MLFA Team</p>
+        """,
+    },
+    # category -> forward (addresses), reply / personal_reply (template names,
+    # the latter used when the classifier says a personal reply is needed),
+    # move (folder names, first existing one wins), keep_unread. Routes are
+    # listed in priority order: when several categories have a reply, only the
+    # first such route's reply is sent (each template is a complete letter).
+    "routes": {
+        "legal": {"reply": "legal", "personal_reply": "legal_personal"},
+        "donor": {"forward": ["Mujahid.rasul@mlfa.org", "Syeda.sadiqa@mlfa.org"]},
+        "sponsorship": {"forward": ["Arshia.ali.khan@mlfa.org", "Maria.laura@mlfa.org"]},
+        "organizational": {"forward": ["Arshia.ali.khan@mlfa.org", "Maria.laura@mlfa.org"]},
+        "volunteer": {"forward": ["aisha.ukiu@mlfa.org"]},
+        "internship": {"forward": ["aisha.ukiu@mlfa.org"]},
+        "job_application": {"forward": ["shawn@strategichradvisory.com"]},
+        "fellowship": {"forward": ["aisha.ukiu@mlfa.org"]},
+        "marketing": {"move": ["Sales emails"], "keep_unread": True},
+    },
+}
+
+
+class Route:
+    """What to do with a message in one category."""
+
+    __slots__ = ("forward", "move", "reply", "personal_reply", "keep_unread")
+
+    def __init__(self, forward=(), move=(), reply=None, personal_reply=None, keep_unread=False):
+        self.forward = tuple(forward)
+        self.move = tuple(move)
+        self.reply = reply                   # template text, not name
+        self.personal_reply = personal_reply
+        self.keep_unread = bool(keep_unread)
+
+    def reply_body(self, needs_personal, name_sender):
+        template = (self.personal_reply if needs_personal else None) or self.reply
+        return template.replace("{name_sender}", str(name_sender)) if template else None
+
+
+_NO_ROUTE = Route()
+
+
+class Plan:
+    """Everything to do for one message, whatever number of categories it has."""
+
+    __slots__ = ("categories", "reply", "forward", "mark_read", "move")
+
+    def __init__(self, categories, reply, forward, mark_read, move):
+        self.categories = categories  # tagged onto the message
+        self.reply = reply            # HTML body or None
+        self.forward = forward        # sorted recipient addresses, possibly empty
+        self.mark_read = mark_read
+        self.move = move              # folder names (first existing one wins), possibly empty
+
+    def __repr__(self):
+        return (f"Plan(categories={self.categories!r}, reply={bool(self.reply)}, forward={self.forward!r}, "
+                f"mark_read={self.mark_read}, move={self.move!r})")
+
+
+class RoutingTable:
+    """A config compiled into lookup structures; immutable once built."""
+
+    def __init__(self, config, reply_tag):
+        templates = {name: textwrap.dedent(body).strip() for name, body in config.get("templates", {}).items()}
+        self.routes = {}  # in priority order (config order)
+        for category, rule in config.get("routes", {}).items():
+            unknown = {rule.get("reply"), rule.get("personal_reply")} - set(templates) - {None}
+            if unknown:
+                raise ValueError(f"route {category!r} uses unknown template(s) {sorted(unknown)}")
+            self.routes[category] = Route(
+                forward=rule.get("forward", ()),
+                move=rule.get("move", ()),
+                reply=templates.get(rule.get("reply")),
+                personal_reply=templates.get(rule.get("personal_reply")),
+                keep_unread=rule.get("keep_unread", False),
+            )
+        self.staff = frozenset(address.lower() for address in config.get("staff", ()))
+        self.keep_unread = frozenset(c for c, route in self.routes.items() if route.keep_unread)
+        self.reply_tag = re.compile(re.escape(reply_tag) + r"\s*([^\s<]+)", re.I | re.S)
+
+    def route(self, category):
+        return self.routes.get(category, _NO_ROUTE)
+
+    def plan(self, result):
+        """
+        The Plan for a classifier result. The reply is that of the
+        highest-priority route (earliest in the config) that has one, since
+        two templates would be two complete letters with their own greeting
+        and sign-off. Forwards go out once to every recipient, and the
+        first category with a move decides the folder (a message ends up
+        in one folder, so the other categories' moves are ignored).
+        """
+        categories = list(result.get("categories", []))
+        needs_personal = result.get("needs_personal_reply", False)
+        name_sender = result.get("name_sender")
+        forward, move = set(result.get("all_recipients", [])), ()
+        for category in categories:
+            route = self.route(category)
+            forward.update(route.forward)
+            move = move or route.move
+        reply = None
+        for category, route in self.routes.items():
+            if category in categories:
+                reply = route.reply_body(needs_personal, name_sender)
+                if reply:
+                    break
+        return Plan(
+            categories=categories,
+            reply=reply,
+            forward=sorted(forward),
+            mark_read=not set(categories).issubset(self.keep_unread),
+            move=list(move),
+        )
+
+    def is_internal_reply(self, sender_address, body):
+        """A staff member answering one of our forwards (the hidden reply tag is in the body)."""
+        return (sender_address or "").lower() in self.staff and bool(self.reply_tag.search(body or ""))
+
+
+class Router:
+    """Holds the current RoutingTable and reloads it when the config file changes."""
+
+    def __init__(self, reply_tag, path=None):
+        self.reply_tag = reply_tag
+        self.path = path or os.getenv("ROUTING_CONFIG", "routing.json")
+        self._mtime = None
+        self.table = RoutingTable(DEFAULT_CONFIG, reply_tag)
+        self.reload_if_changed()
+
+    def reload_if_changed(self):
+        """Recompile if the file appeared, changed or disappeared. One stat() when nothing changed."""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        if mtime is None:
+            log.info("Routing config %s not found, using the built-in routes", self.path)
+            self.table = RoutingTable(DEFAULT_CONFIG, self.reply_tag)
+            return True
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                table = RoutingTable(json.load(f), self.reply_tag)
+        except Exception as e:
+            log.error("⚠️ Could not load routing config %s, keeping the current routes: %s", self.path, e)
+            return False
+        self.table = table
+        log.info("🔀 Loaded %d routes from %s", len(table.routes), self.path)
+        return True
+
+
+if __name__ == "__main__":
+    print(json.dumps(DEFAULT_CONFIG, indent=2))
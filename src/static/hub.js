@@ -0,0 +1,460 @@
+const emailData = [];
+let selectedId = null;  // survives list updates, so the reviewer keeps their place
+
+function selectEmail(index) {
+    const items = document.querySelectorAll('.email-item');
+    // Remove selected class from all items
+    items.forEach(item => {
+        item.classList.remove('selected');
+    });
+
+    // Update email content
+    if (emailData[index]) {
+        // Add selected class to clicked item
+        items[index].classList.add('selected');
+
+        const data = emailData[index];
+        selectedId = data.id;
+        document.querySelector('.email-meta').textContent = data.meta;
+        document.getElementById('senderName').textContent = data.senderName;
+        document.getElementById('category').textContent = data.category;
+        showDetail(data.id);
+
+        // Warm the cache for the email the reviewer will most likely open next
+        if (emailData[index + 1]) loadDetail(emailData[index + 1].id).catch(() => {});
+
+        // Show status info when email is selected
+        const statusInfo = document.getElementById('statusInfo');
+        if (statusInfo) {
+            statusInfo.style.display = 'block';
+        }
+    } else {
+        selectedId = null;
+        document.querySelector('.email-meta').textContent = '';
+        ['senderName', 'category', 'recipients', 'needsReply', 'reason', 'escalation', 'originalContent']
+            .forEach(id => { document.getElementById(id).textContent = ''; });
+    }
+}
+
+// The list only carries summaries; body and reasoning come from
+// /api/emails/<id>. Requests are cached (as promises) per email.
+const DETAIL_FIELDS = ['recipients', 'needsReply', 'reason', 'escalation', 'originalContent'];
+const emailDetails = new Map();
+
+function loadDetail(id) {
+    if (!emailDetails.has(id)) {
+        const request = fetch(`${API_BASE}/emails/${encodeURIComponent(id)}`, { credentials: 'include' })
+            .then(response => {
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                return response.json();
+            });
+        request.catch(() => emailDetails.delete(id));  // let the next selection retry
+        emailDetails.set(id, request);
+    }
+    return emailDetails.get(id);
+}
+
+async function showDetail(id) {
+    DETAIL_FIELDS.forEach(field => { document.getElementById(field).textContent = '…'; });
+    try {
+        const detail = await loadDetail(id);
+        if (selectedId !== id) return;  // the reviewer has moved on
+        DETAIL_FIELDS.forEach(field => { document.getElementById(field).textContent = detail[field]; });
+    } catch (error) {
+        if (selectedId !== id) return;
+        console.error('Error loading email details:', error);
+        document.getElementById('originalContent').textContent = 'Could not load this email.';
+    }
+}
+
+function indexOfEmail(id) {
+    return emailData.findIndex(email => email.id === id);
+}
+
+
+async function handleAction(action) {
+
+    // Get current selected email
+    const emailIndex = indexOfEmail(selectedId);
+    if (emailIndex < 0) {
+        showNotification('No email selected', 'error');
+        return;
+    }
+
+    const currentEmail = emailData[emailIndex];
+
+    const spinner = document.getElementById(action + 'Spinner');
+    const button = spinner.parentElement;
+
+    // Show loading state
+    spinner.style.display = 'inline-block';
+    button.disabled = true;
+
+    try {
+        let response;
+        if (action === 'accept') {
+            response = await fetch(`${API_BASE}/emails/${currentEmail.id}/approve`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                credentials: 'include'  // Include session cookies
+            });
+        } else if (action === 'reject') {
+            response = await fetch(`${API_BASE}/emails/${currentEmail.id}/reject`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify({ reason: 'Rejected via approval hub' }),
+                credentials: 'include'  // Include session cookies
+            });
+        }
+
+        const result = await response.json();
+
+        if (response.status === 202 && result.jobId) {
+            // Accepted: move on now, the mailbox work finishes in the background
+            showNotification(action === 'accept' ? 'Approving…' : 'Rejecting…', 'success');
+            // Drop it right away; the stream's `removed` event is then a no-op
+            removeEmail(currentEmail.id);
+            watchJob(result.statusUrl, action, currentEmail.subject);
+        } else {
+            throw new Error(result.message || `Failed to ${action} email`);
+        }
+    } catch (error) {
+        console.error(`Error ${action}ing email:`, error);
+        showNotification(`Failed to ${action} email: ${error.message}`, 'error');
+    } finally {
+        spinner.style.display = 'none';
+        button.disabled = false;
+    }
+}
+
+
+// Poll an approve/reject job until it settles and report the outcome
+const JOB_POLL_MS = 1000;
+const JOB_POLL_LIMIT = 60;
+async function watchJob(statusUrl, action, subject) {
+    const verb = action === 'accept' ? 'Approve' : 'Reject';
+    for (let i = 0; i < JOB_POLL_LIMIT; i++) {
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_MS));
+        let job;
+        try {
+            const response = await fetch(statusUrl, { credentials: 'include' });
+            if (!response.ok) continue;
+            job = await response.json();
+        } catch (error) {
+            continue;
+        }
+        if (job.status === 'done') {
+            showNotification(`${verb} done: ${subject}`, action === 'accept' ? 'success' : 'error');
+            return;
+        }
+        if (job.status === 'failed') {
+            showNotification(`${verb} failed: ${subject} (${job.error || 'unknown error'})`, 'error');
+            return;
+        }
+        if (job.status === 'retrying') {
+            showNotification(`${verb} delayed, retrying in background: ${subject}`, 'error');
+            return;
+        }
+    }
+}
+
+function showNotification(message, type) {
+    const notification = document.getElementById('notification');
+    notification.textContent = message;
+    notification.className = `notification ${type}`;
+    notification.classList.add('show');
+
+    setTimeout(() => {
+        notification.classList.remove('show');
+    }, 3000);
+}
+
+// API Configuration - use relative URLs to work with ngrok
+const API_BASE = '/api';
+
+// Load emails from backend. The server answers 304 (no body) while the
+// queue is unchanged, so the fallback poll costs almost nothing.
+const PAGE_SIZE = 100;
+const FALLBACK_POLL_MS = 60000;  // live updates come from the event stream
+let emailsEtag = null;
+let nextCursor = null;
+let totalEmails = 0;
+let queueVersion = 0;
+let eventSource = null;
+
+async function fetchEmailPage(cursor) {
+    const params = new URLSearchParams({ limit: PAGE_SIZE });
+    if (cursor) params.set('cursor', cursor);
+    const headers = {};
+    if (!cursor && emailsEtag) headers['If-None-Match'] = emailsEtag;
+    return fetch(`${API_BASE}/emails?${params}`, {
+        credentials: 'include',  // Include session cookies
+        cache: 'no-store',
+        headers
+    });
+}
+
+async function loadEmails() {
+    try {
+        const response = await fetchEmailPage(null);
+        if (response.status === 304) return;  // nothing changed
+        if (!response.ok) throw new Error('Failed to fetch emails');
+        emailsEtag = response.headers.get('ETag');
+
+        const page = await response.json();
+        emailData.length = 0; // Clear existing data
+        emailData.push(...page.emails);
+        nextCursor = page.nextCursor;
+        totalEmails = page.total;
+        queueVersion = page.version;
+
+        // Update email list in UI, keeping the current selection if it is still pending
+        updateEmailList();
+        selectEmail(Math.max(indexOfEmail(selectedId), 0));
+    } catch (error) {
+        console.error('Error loading emails:', error);
+        showNotification('Failed to load emails from server', 'error');
+    }
+}
+
+async function loadMoreEmails() {
+    if (!nextCursor) return;
+    try {
+        const response = await fetchEmailPage(nextCursor);
+        if (!response.ok) throw new Error('Failed to fetch emails');
+        const page = await response.json();
+        const start = emailData.length;
+        emailData.push(...page.emails);
+        nextCursor = page.nextCursor;
+        const listContainer = document.querySelector('.email-list');
+        page.emails.forEach(email => listContainer.insertBefore(createEmailItem(email), listContainer.querySelector('.load-more')));
+        updateLoadMore();
+        if (start === 0) selectEmail(0);
+    } catch (error) {
+        console.error('Error loading more emails:', error);
+        showNotification('Failed to load more emails', 'error');
+    }
+}
+
+function subjectOf(email) {
+    let subject = email.subject || 'No Subject';
+
+    // Truncate long subjects
+    if (subject.length > 22) {
+        subject = subject.substring(0, 22) + '...';
+    }
+    return subject;
+}
+
+function createEmailItem(email) {
+    const emailItem = document.createElement('div');
+    emailItem.className = 'email-item';
+    emailItem.dataset.id = email.id;
+    emailItem.onclick = () => selectEmail(indexOfEmail(email.id));
+
+    const check = document.createElement('input');
+    check.type = 'checkbox';
+    check.checked = checkedIds.has(email.id);
+    check.onclick = event => {
+        event.stopPropagation();  // ticking a box doesn't open the email
+        setChecked(email.id, check.checked);
+    };
+    const subject = document.createElement('span');
+    subject.className = 'email-subject';
+    subject.textContent = subjectOf(email);
+
+    emailItem.append(check, subject);
+    return emailItem;
+}
+
+function showEmptyState() {
+    const emailListContainer = document.querySelector('.email-list');
+    const noEmailsItem = document.createElement('div');
+    noEmailsItem.className = 'no-emails';
+    noEmailsItem.style.padding = '12px';
+    noEmailsItem.style.fontStyle = 'italic';
+    noEmailsItem.style.color = '#888';
+    noEmailsItem.textContent = 'No pending emails';
+    emailListContainer.appendChild(noEmailsItem);
+}
+
+function updateLoadMore() {
+    const emailListContainer = document.querySelector('.email-list');
+    let moreItem = emailListContainer.querySelector('.load-more');
+    if (!nextCursor) {
+        if (moreItem) moreItem.remove();
+        return;
+    }
+    if (!moreItem) {
+        moreItem = document.createElement('div');
+        moreItem.className = 'load-more';
+        moreItem.onclick = loadMoreEmails;
+        emailListContainer.appendChild(moreItem);
+    }
+    moreItem.textContent = `Load more (${totalEmails - emailData.length} remaining)`;
+}
+
+function updateEmailList() {
+    const emailListContainer = document.querySelector('.email-list');
+
+    // Clear existing items except the header and the bulk toolbar
+    const header = emailListContainer.querySelector('h2');
+    const bulkBar = emailListContainer.querySelector('.bulk-bar');
+    emailListContainer.innerHTML = '';
+    emailListContainer.append(header, bulkBar);
+
+    // Forget ticked emails that are no longer in the list
+    const loaded = new Set(emailData.map(email => email.id));
+    checkedIds.forEach(id => { if (!loaded.has(id)) checkedIds.delete(id); });
+    updateBulkBar();
+
+    if (emailData.length === 0) {
+        showEmptyState();
+        return;
+    }
+
+    // Add email items
+    emailData.forEach(email => emailListContainer.appendChild(createEmailItem(email)));
+    updateLoadMore();
+}
+
+// --- Incremental updates from the server's event stream ---
+
+function addEmail(email) {
+    if (indexOfEmail(email.id) >= 0) return;
+    totalEmails += 1;
+    if (nextCursor) {
+        // Newest items sit past the loaded pages; "Load more" will reach them
+        updateLoadMore();
+        return;
+    }
+    const emailListContainer = document.querySelector('.email-list');
+    const empty = emailListContainer.querySelector('.no-emails');
+    if (empty) empty.remove();
+    emailData.push(email);
+    emailListContainer.appendChild(createEmailItem(email));
+    if (emailData.length === 1) selectEmail(0);
+}
+
+function removeEmail(id) {
+    const index = indexOfEmail(id);
+    if (index < 0) return;
+    emailData.splice(index, 1);
+    totalEmails = Math.max(totalEmails - 1, emailData.length);
+    if (checkedIds.delete(id)) updateBulkBar();
+    emailDetails.delete(id);
+    const item = document.querySelector(`.email-item[data-id="${CSS.escape(id)}"]`);
+    if (item) item.remove();
+    updateLoadMore();
+    if (emailData.length === 0) {
+        showEmptyState();
+        selectEmail(-1);
+    } else if (selectedId === id) {
+        // Move on to the next email (or the previous one at the end of the list)
+        selectEmail(Math.min(index, emailData.length - 1));
+    }
+}
+
+// --- Multi-select and bulk actions ---
+
+const checkedIds = new Set();
+
+function setChecked(id, checked) {
+    if (checked) checkedIds.add(id); else checkedIds.delete(id);
+    updateBulkBar();
+}
+
+function toggleSelectAll(checked) {
+    emailData.forEach(email => setChecked(email.id, checked));
+    document.querySelectorAll('.email-item input[type="checkbox"]').forEach(box => { box.checked = checked; });
+}
+
+function updateBulkBar() {
+    const count = checkedIds.size;
+    document.getElementById('bulkCount').textContent = `${count} selected`;
+    document.getElementById('bulkApprove').disabled = count === 0;
+    document.getElementById('bulkReject').disabled = count === 0;
+    document.getElementById('selectAll').checked = count > 0 && count === emailData.length;
+}
+
+async function bulkAction(action) {
+    const ids = Array.from(checkedIds);
+    if (ids.length === 0) return;
+    const verb = action === 'approve' ? 'Approve' : 'Reject';
+    if (!confirm(`${verb} ${ids.length} email(s)?`)) return;
+
+    try {
+        const response = await fetch(`${API_BASE}/emails/bulk`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ action: action, ids: ids, reason: 'Rejected via approval hub (bulk)' }),
+            credentials: 'include'
+        });
+        const result = await response.json();
+        if (response.status !== 202) {
+            throw new Error(result.message || `Failed to ${action} emails`);
+        }
+        // Accepted and already-gone emails both leave the list
+        result.results.forEach(item => removeEmail(item.id));
+        showNotification(`${verb}: ${result.accepted} queued, ${result.results.length - result.accepted} no longer pending`, 'success');
+        const jobIds = result.results.filter(item => item.jobId).map(item => item.jobId);
+        if (jobIds.length) watchJobs(jobIds, verb);
+    } catch (error) {
+        console.error(`Error in bulk ${action}:`, error);
+        showNotification(`Bulk ${action} failed: ${error.message}`, 'error');
+    }
+}
+
+// Poll a batch of jobs until they all settle, then report one summary
+async function watchJobs(jobIds, verb) {
+    const settled = {};
+    for (let i = 0; i < JOB_POLL_LIMIT && Object.keys(settled).length < jobIds.length; i++) {
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_MS));
+        const open = jobIds.filter(id => !(id in settled));
+        try {
+            const response = await fetch(`${API_BASE}/jobs?ids=${open.join(',')}`, { credentials: 'include' });
+            if (!response.ok) continue;
+            (await response.json()).jobs.forEach(job => {
+                if (['done', 'failed', 'retrying'].includes(job.status)) settled[job.id] = job.status;
+            });
+        } catch (error) {
+            continue;
+        }
+    }
+    const counts = { done: 0, failed: 0, retrying: 0 };
+    Object.values(settled).forEach(status => { counts[status] += 1; });
+    const unfinished = jobIds.length - Object.keys(settled).length;
+    const problems = counts.failed + counts.retrying + unfinished;
+    showNotification(`${verb} finished: ${counts.done} done` +
+        (counts.failed ? `, ${counts.failed} failed` : '') +
+        (counts.retrying + unfinished ? `, ${counts.retrying + unfinished} still retrying` : ''),
+        problems ? 'error' : 'success');
+}
+
+function connectStream() {
+    if (!window.EventSource) return;
+    if (eventSource) eventSource.close();
+    eventSource = new EventSource(`${API_BASE}/emails/stream?since=${queueVersion}`, { withCredentials: true });
+    eventSource.addEventListener('added', e => addEmail(JSON.parse(e.data)));
+    eventSource.addEventListener('removed', e => removeEmail(JSON.parse(e.data).id));
+    eventSource.addEventListener('reset', () => { emailsEtag = null; emailDetails.clear(); loadEmails(); });
+}
+
+// Initialize application
+document.addEventListener('DOMContentLoaded', async function() {
+    console.log('Initializing MLFA Approval Hub...');
+    await loadEmails();
+    connectStream();
+
+    // Slow safety-net poll; it is a 304 unless an event was missed
+    setInterval(loadEmails, FALLBACK_POLL_MS);
+});
+
+// Logout function
+function logout() {
+    window.location.href = '/logout';
+}
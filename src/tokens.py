@@ -0,0 +1,75 @@
+"""
+Proactive OAuth token refresh for the Graph connection.
+
+O365 only refreshes the access token when a request finds it expired, so the
+poll loop used to learn about auth trouble from failing requests. The
+TokenRefresher watches the token's expiry on a background thread and calls
+Connection.refresh_token() `lead` seconds before it runs out. The refresh
+updates the token inside the existing connection and session, so the Account,
+mailbox and folder objects held elsewhere keep working and no request ever
+goes out with an expired token. A failed refresh is retried with backoff
+while the current token is still valid.
+"""
+import logging
+import threading
+import time
+
+import metrics
+
+log = logging.getLogger("tokens")
+
+TOKEN_REFRESHES = metrics.Counter("mlfa_token_refreshes_total", "Proactive access-token refreshes", ("result",))
+TOKEN_SECONDS_LEFT = metrics.Gauge("mlfa_token_seconds_left", "Seconds until the Graph access token expires")
+
+
+class TokenRefresher:
+    """Keeps `connection`'s access token fresh from a daemon thread."""
+
+    def __init__(self, connection, lead=300, retry_base=15, retry_max=120, idle_check=600):
+        self.connection = connection
+        self.lead = lead              # refresh this many seconds before expiry
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.idle_check = idle_check  # longest sleep between expiry checks
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="token-refresh", daemon=True)
+        self._thread.start()
+
+    def seconds_left(self):
+        """Seconds until the current access token expires, or None if unknown."""
+        token = getattr(self.connection.token_backend, "token", None) or {}
+        expires_at = token.get("expires_at")
+        return float(expires_at) - time.time() if expires_at else None
+
+    def refresh(self):
+        """Refresh now. Serialized, so callers never trigger two refreshes at once."""
+        with self._lock:
+            try:
+                ok = bool(self.connection.refresh_token())
+            except Exception as e:
+                log.warning("⚠️ Token refresh failed: %s", e)
+                ok = False
+        TOKEN_REFRESHES.inc(result="ok" if ok else "failed")
+        if ok:
+            log.info("🔑 Access token refreshed (%.0f min left)", (self.seconds_left() or 0) / 60)
+        return ok
+
+    def _run(self):
+        failures = 0
+        while True:
+            left = self.seconds_left()
+            if left is None:
+                time.sleep(self.idle_check)
+                continue
+            TOKEN_SECONDS_LEFT.set(round(left))
+            if left > self.lead:
+                time.sleep(min(left - self.lead, self.idle_check))
+                continue
+            if self.refresh() and (self.seconds_left() or 0) > self.lead:
+                failures = 0
+                continue
+            failures += 1
+            time.sleep(min(self.retry_base * 2 ** (failures - 1), self.retry_max))